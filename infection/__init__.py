@@ -1,10 +1,23 @@
-from infection.base import Person, Temperature, Wall
+# the package version (read by setup.py; part of the key of cached runs)
+__version__ = "1.0"
+
+from infection.base import (CellList, GridlessTemperature, HealthQueue,
+                            LazyPerson, Person, RandomStreams, SuperPerson,
+                            Temperature, Wall)
 from infection.infection import Infection
+from infection.batch import BatchInfection
 
 
 __all__ = [
+    "BatchInfection",
+    "CellList",
+    "GridlessTemperature",
+    "HealthQueue",
     "Infection",
+    "LazyPerson",
     "Person",
+    "RandomStreams",
+    "SuperPerson",
     "Temperature",
     "Wall"
 ]
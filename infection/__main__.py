@@ -1,9 +1,13 @@
 import os
 import json
+import numpy as np
 from contextlib import ExitStack
 from argparse import ArgumentParser
 from infection import Infection
 from infection import viz_utils as vzu
+from infection.cache import RunCache, cached_run
+from infection.ensemble import EnsembleAggregator, run_ensemble
+from infection.metrics import METRICS
 import matplotlib.pyplot as plt
 import matplotlib.animation as manimation
 
@@ -42,14 +46,100 @@ def gen_arg_parser():
                         default=333, help="seed for random number generation")
     parser.add_argument("--video", action="store_true",
                         help="if set, generate an mp4 animation of simulation")
+    parser.add_argument("--raster", type=int, default=None,
+                        help=("with --video, draw people as a density image "
+                              + "of RASTER x RASTER pixels per state"))
     parser.add_argument("--graph", action="store_true",
                         help="if set, plot infected/immune vs. day")
     parser.add_argument("--verbose", action="store_true",
                         help="if set, print results to screen")
+    parser.add_argument("--stop_when_absorbing", action="store_true",
+                        help=("if set, stop early once no one is infected "
+                              + "or immune"))
+    parser.add_argument("--cache", action="store_true",
+                        help=("if set, reuse (and store) results of "
+                              + "identical runs (ignored with --video)"))
+    parser.add_argument("--cache_dir", type=str, default=None,
+                        help="directory of result cache")
+    parser.add_argument("--replicas", type=int, default=1,
+                        help=("number of replicas (seeds random_seed, "
+                              + "random_seed + 1, ...); with more than one "
+                              + "the graph shows percentile bands "
+                              + "(--video is ignored)"))
+    parser.add_argument("--cube", type=str, default=None,
+                        help=("with --replicas, .npy file to which to write "
+                              + "every replica's series (memory-mapped)"))
 
     return parser.parse_args()
 
 
+def plot_bands(axis, days, aggregator, name, colour, label):
+    """
+    Plot the median of a series of an ensemble with its 25-75 and 5-95
+    percentile bands
+    """
+    bands = {p: values[:len(days)]
+             for p, values in aggregator.bands(name).items()}
+    axis.fill_between(days, bands[5], bands[95], color=colour, alpha=0.2,
+                      linewidth=0)
+    axis.fill_between(days, bands[25], bands[75], color=colour, alpha=0.4,
+                      linewidth=0)
+    axis.plot(days, bands[50], color=colour, label=label)
+
+
+def main_ensemble(args, configuration):
+    """
+    Run replicas of a configuration and write the mean series with the
+    percentile bands
+    """
+    seeds = range(args.random_seed, args.random_seed + args.replicas)
+    use_cache = args.cache and not args.stop_when_absorbing
+    aggregator = EnsembleAggregator(args.steps, cube_path=args.cube,
+                                    n_replicas=args.replicas)
+    run_ensemble(configuration, args.steps, seeds, aggregator=aggregator,
+                 stop_when_absorbing=args.stop_when_absorbing,
+                 cache=RunCache(args.cache_dir) if use_cache else None)
+
+    # days on which at least one replica is still running
+    days = np.flatnonzero(aggregator.count_ > 0) + 1
+    n_days = len(days)
+    infecteds = aggregator.mean("n_infected")[:n_days]
+    immunes = aggregator.mean("n_immune")[:n_days]
+    temperatures = aggregator.mean("mean_temperature")[:n_days]
+
+    if args.verbose:
+        for day, n_infected, n_immune, mean_temp in zip(
+                days, infecteds, immunes, temperatures):
+            if not day % 50:
+                print(f"day: {day:4d}\t"
+                      + f"infected: {n_infected:4.2f}\t"
+                      + f"immune: {n_immune:4.2f}\t"
+                      + f"mean_temp: {mean_temp:5.3f}")
+
+    if args.graph:
+        fig, axs = plt.subplots(2, 1, sharex="all", figsize=(12, 6))
+        for name, colour, label in [("n_infected", "tomato", "% infected"),
+                                    ("n_immune", "steelblue", "% immune")]:
+            plot_bands(axs[0], days, aggregator, name, colour, label)
+        axs[0].legend()
+        plot_bands(axs[1], days, aggregator, "mean_temperature",
+                   "tab:blue", None)
+        axs[1].set_ylabel("mean temperature")
+        axs[1].set_xlabel("day")
+        axs[0].set_title("median and 5-25-75-95 percentiles of "
+                         + f"{args.replicas} replicas")
+        fig.savefig(f"{args.o}.png")
+
+    # write json file (the series are the ensemble means)
+    output = {"days": days.tolist(),
+              "n_infected": infecteds.tolist(),
+              "n_immune": immunes.tolist(),
+              "mean_temperature": temperatures.tolist(),
+              "ensemble": aggregator.summary()}
+    with open(f"{args.o}.json", "w") as jsf:
+        json.dump(output, jsf, indent=2)
+
+
 def main():
     # get command-line arguments
     args = gen_arg_parser()
@@ -59,8 +149,12 @@ def main():
     output_file = args.o
     random_seed = args.random_seed
     video = args.video
+    raster = args.raster
     graph = args.graph
     verbose = args.verbose
+    stop_when_absorbing = args.stop_when_absorbing
+    use_cache = args.cache and not video and not stop_when_absorbing
+    cache_dir = args.cache_dir
 
     this_directory = os.path.abspath(os.path.dirname(__file__))
     example_dir = os.path.join(this_directory, "examples")
@@ -74,49 +168,88 @@ def main():
         with open(input_file, "r") as jsf:
             configuration = json.load(jsf)
 
+    if args.replicas > 1:
+        main_ensemble(args, configuration)
+        return
+
     fig = None
     scatter = None
     qcs = None
     writer = None
 
-    runner = Infection(**configuration).initialize_all(random_seed=random_seed)
+    if use_cache:
+        series = cached_run(configuration, steps, random_seed,
+                            cache=RunCache(cache_dir))
+        n_people = series["n_people"]
+        metrics = {name: (values[-1] if METRICS[name].cumulative else values)
+                   for name, values in series["metrics"].items()}
+        # the cached series form a single chunk
+        chunks = [{"day": np.array(series["days"], dtype=int),
+                   "n_infected": np.array(series["n_infected"], dtype=int),
+                   "n_immune": np.array(series["n_immune"], dtype=int),
+                   "mean_temperature": np.array(series["mean_temperature"]),
+                   "metrics": {name: np.asarray(values)
+                               for name, values in metrics.items()}}]
+    else:
+        runner = Infection(**configuration)
+        runner.initialize_all(random_seed=random_seed)
+        n_people = runner["n_people"]
 
     if video:
         writer_class = manimation.writers["ffmpeg"]
         metadata = dict(title="Infection!!", artist="Matplotlib",
                         comment="infection animation")
         writer = writer_class(fps=24, metadata=metadata)
-        fig, scatter, qcs = vzu.init_frame(runner, figsize=(12, 12))
+        fig, scatter, qcs = vzu.init_frame(runner, figsize=(12, 12),
+                                           raster=raster)
+
+    def grab_frame(day, done, total):
+        nonlocal fig, scatter, qcs
+        fig, scatter, qcs = vzu.update_frame(fig, scatter, qcs, runner)
+        writer.grab_frame()
 
     days = []
     infecteds = []
     immunes = []
     temperatures = []
+    metric_series = {}
 
     with ExitStack() as stack:
         if video:
             video_file = f"{output_file.split('.')[0]}.mp4"
             stack.enter_context(writer.saving(fig, video_file, dpi=60))
 
-        for day, n_infected, n_immune in runner.run(steps=steps):
-            n_people = len(runner.people_)
-            mean_temp = runner.temperature_.temperature.mean()
+        if not use_cache:
+            # a chunk per step when every step is drawn
+            chunks = runner.run_chunked(
+                steps=steps, chunk=1 if video else 100,
+                progress=grab_frame if video else None,
+                stop_when_absorbing=stop_when_absorbing)
 
-            days.append(day)
-            infecteds.append(100 * n_infected / n_people)
-            immunes.append(100 * n_immune / n_people)
-            temperatures.append(mean_temp)
+        for chunk in chunks:
+            for name, values in chunk["metrics"].items():
+                if METRICS[name].cumulative:
+                    # keep only the accumulated value
+                    metric_series[name] = values.tolist()
+                else:
+                    metric_series.setdefault(name, []).extend(
+                        values.tolist())
 
-            if verbose:
-                if not day % 50:
-                    print(f"day: {day:4d}\t"
-                          + f"infected: {100 * n_infected / n_people:4.2f}\t"
-                          + f"immune: {100 * n_immune / n_people:4.2f}\t"
-                          + f"mean_temp: {mean_temp:5.3f}")
+            days.extend(chunk["day"].tolist())
+            infecteds.extend((100 * chunk["n_infected"] / n_people).tolist())
+            immunes.extend((100 * chunk["n_immune"] / n_people).tolist())
+            temperatures.extend(chunk["mean_temperature"].tolist())
 
-            if video:
-                fig, scatter, qcs = vzu.update_frame(fig, scatter, qcs, runner)
-                writer.grab_frame()
+            if verbose:
+                for day, n_infected, n_immune, mean_temp in zip(
+                        chunk["day"], chunk["n_infected"], chunk["n_immune"],
+                        chunk["mean_temperature"]):
+                    if not day % 50:
+                        print(f"day: {day:4d}\t"
+                              + "infected: "
+                              + f"{100 * n_infected / n_people:4.2f}\t"
+                              + f"immune: {100 * n_immune / n_people:4.2f}\t"
+                              + f"mean_temp: {mean_temp:5.3f}")
 
     if graph:
         fig, axs = plt.subplots(2, 1, sharex="all", figsize=(12, 6))
@@ -129,12 +262,14 @@ def main():
         fig.savefig(f"{output_file}.png")
 
     # write json file
+    output = {"days": days,
+              "n_infected": infecteds,
+              "n_immune": immunes,
+              "mean_temperature": temperatures}
+    if metric_series:
+        output["metrics"] = metric_series
     with open(f"{output_file}.json", "w") as jsf:
-        json.dump({"days": days,
-                   "n_infected": infecteds,
-                   "n_immune": immunes,
-                   "mean_temperature": temperatures}, jsf,
-                  indent=2)
+        json.dump(output, jsf, indent=2)
 
 
 if __name__ == "__main__":
@@ -1,10 +1,22 @@
+from infection.base.cell_list import CellList
+from infection.base.gridless_temperature import GridlessTemperature
+from infection.base.health_queue import HealthQueue
+from infection.base.lazy_person import LazyPerson
 from infection.base.person import Person
+from infection.base.random_streams import RandomStreams
+from infection.base.super_person import SuperPerson
 from infection.base.temperature import Temperature
 from infection.base.wall import Wall
 
 
 __all__ = [
+    "CellList",
+    "GridlessTemperature",
+    "HealthQueue",
+    "LazyPerson",
     "Person",
+    "RandomStreams",
+    "SuperPerson",
     "Temperature",
     "Wall"
 ]
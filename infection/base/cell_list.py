@@ -0,0 +1,96 @@
+"""
+-------------------------------------------------------
+Base class for spatial cell list
+-------------------------------------------------------
+Author:  Mark Fruman
+Email:   majorgowan@yahoo.com
+-------------------------------------------------------
+"""
+import numpy as np
+from pprint import pformat
+
+
+class CellList:
+    """
+    Class representing a uniform spatial binning of points for fast
+    fixed-radius neighbour queries
+
+    Parameters
+    ----------
+    positions : numpy.array
+        (n, 2) array of point coordinates
+    cutoff : float
+        neighbour search radius (also the width of a cell)
+    """
+    def __init__(self, positions, cutoff):
+        self.positions = np.asarray(positions, dtype=float).reshape(-1, 2)
+        self.cutoff = cutoff
+        self.cells_ = {}
+
+        keys = np.floor(self.positions / cutoff).astype(int)
+        for ii, key in enumerate(map(tuple, keys)):
+            self.cells_.setdefault(key, []).append(ii)
+
+    def __len__(self):
+        return len(self.positions)
+
+    def candidates(self, x, y):
+        """
+        Indices of points in the cell containing (x, y) and its
+        eight neighbours
+
+        Parameters
+        ----------
+        x : float
+            x-coordinate of query point
+        y : float
+            y-coordinate of query point
+
+        Returns
+        -------
+        numpy.array of int
+        """
+        cx = int(np.floor(x / self.cutoff))
+        cy = int(np.floor(y / self.cutoff))
+        indices = []
+        for ix in (cx - 1, cx, cx + 1):
+            for iy in (cy - 1, cy, cy + 1):
+                indices.extend(self.cells_.get((ix, iy), []))
+        return np.array(indices, dtype=int)
+
+    def query(self, x, y):
+        """
+        Find points within the cutoff radius of (x, y)
+
+        Parameters
+        ----------
+        x : float
+            x-coordinate of query point
+        y : float
+            y-coordinate of query point
+
+        Returns
+        -------
+        indices : numpy.array of int
+            indices (into positions) of neighbours
+        dist2 : numpy.array of float
+            squared distances of neighbours from query point
+        """
+        if not self.cells_:
+            return np.zeros(0, dtype=int), np.zeros(0)
+        indices = self.candidates(x, y)
+        if len(indices) == 0:
+            return indices, np.zeros(0)
+        dist2 = ((self.positions[indices, 0] - x) ** 2
+                 + (self.positions[indices, 1] - y) ** 2)
+        keep = dist2 <= self.cutoff ** 2
+        return indices[keep], dist2[keep]
+
+    def __repr__(self):
+        return pformat(
+            {
+                "n_points": len(self),
+                "cutoff": self.cutoff,
+                "n_cells": len(self.cells_)
+            }
+        )
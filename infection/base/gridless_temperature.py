@@ -0,0 +1,271 @@
+"""
+-------------------------------------------------------
+Base class for gridless temperature field
+-------------------------------------------------------
+Author:  Mark Fruman
+Email:   majorgowan@yahoo.com
+-------------------------------------------------------
+"""
+import math
+import numpy as np
+from pprint import pformat
+from infection.base.cell_list import CellList
+from infection.base.temperature import grid_coordinates
+
+
+class GridlessTemperature:
+    """
+    Class representing a temperature field evaluated directly as a sum of
+    gaussian hotspots centred on infected people (no grid is maintained).
+    The lingering memory of the field is kept as a set of past hotspot
+    centres whose weights decay by linger / (1 + linger) per step; centres
+    are found within a cutoff radius through a cell list.  A grid field
+    (e.g. for visualization) is rendered only on demand.
+
+    Parameters
+    ----------
+    gridsize : int
+        number of points in each direction of rendered fields
+    hotspot_radius : float
+        gaussian width of hotspot surrounding infected person
+    linger : float
+        fraction of current field to preserve on next time-step
+    intensity : float
+        amplitude of temperature perturbation around infected person
+    dtype : str
+        floating point type of rendered fields
+    cutoff : float
+        radius (in units of hotspot_radius) beyond which hotspots are
+        neglected
+    prune : float
+        relative weight below which past hotspot centres are dropped
+    """
+    def __init__(self, gridsize, hotspot_radius=0.1, linger=0,
+                 intensity=1, dtype="float64", cutoff=4.0, prune=1e-3):
+        self.gridsize = gridsize
+        self.hotspot_radius = hotspot_radius
+        self.linger = linger
+        self.intensity = intensity
+        self.dtype = np.dtype(dtype)
+        self.cutoff = cutoff
+        self.prune = prune
+
+        self.centers_ = np.zeros((0, 2))
+        self.weights_ = np.zeros(0)
+        self.apparent_centers_ = np.zeros((0, 2))
+        self.apparent_weights_ = np.zeros(0)
+        self.cells_ = CellList(self.centers_, cutoff * hotspot_radius)
+        self.apparent_cells_ = CellList(self.apparent_centers_,
+                                        cutoff * hotspot_radius)
+        self.rendered_ = None
+
+    @property
+    def amplitude(self):
+        return self.intensity / (4 * np.pi) / self.hotspot_radius
+
+    @property
+    def xx(self):
+        return grid_coordinates(self.gridsize, self.dtype.name)[0]
+
+    @property
+    def yy(self):
+        return grid_coordinates(self.gridsize, self.dtype.name)[1]
+
+    def reindex(self):
+        radius = self.cutoff * self.hotspot_radius
+        self.cells_ = CellList(self.centers_, radius)
+        self.apparent_cells_ = CellList(self.apparent_centers_, radius)
+        self.rendered_ = None
+
+    def age(self, steps=1):
+        """
+        Decay the weights of the stored centres by a number of steps and
+        drop negligible ones
+        """
+        self.weights_ = (self.weights_
+                         * (self.linger / (1.0 + self.linger)) ** steps)
+        keep = self.weights_ >= self.prune / (1.0 + self.linger)
+        self.centers_ = self.centers_[keep]
+        self.weights_ = self.weights_[keep]
+
+    def update(self, people, steps=1):
+        """
+        Update field based on positions of people
+
+        Parameters
+        ----------
+        people : People objects
+            determine new temperature field after update
+        steps : int
+            number of steps since the last update (see Temperature.update)
+        """
+        self.age(steps)
+
+        # hotspots are weighted by the number of infected people
+        # represented (see SuperPerson)
+        infected = [[p.x, p.y, p.infected_weight] for p in people
+                    if p.infected]
+        symptomatic = [[p.x, p.y, p.infected_weight] for p in people
+                       if p.infected and not p.incubating]
+        infected = np.array(infected, dtype=float).reshape(-1, 3)
+        symptomatic = np.array(symptomatic, dtype=float).reshape(-1, 3)
+
+        self.centers_ = np.concatenate([self.centers_, infected[:, :2]])
+        self.weights_ = np.concatenate([self.weights_,
+                                        infected[:, 2] / (1.0 + self.linger)])
+        self.apparent_centers_ = symptomatic[:, :2].copy()
+        self.apparent_weights_ = symptomatic[:, 2].copy()
+        self.reindex()
+
+    def decay(self):
+        """
+        Update field when no one is infected (see Temperature.decay)
+        """
+        self.age()
+        self.apparent_centers_ = np.zeros((0, 2))
+        self.apparent_weights_ = np.zeros(0)
+        self.reindex()
+
+    def value_at(self, x, y):
+        """
+        Temperature at a point
+
+        Parameters
+        ----------
+        x : float
+        y : float
+
+        Returns
+        -------
+        float
+        """
+        indices, dist2 = self.cells_.query(x, y)
+        return self.amplitude * float(np.dot(
+            self.weights_[indices],
+            np.exp(-0.5 * dist2 / self.hotspot_radius ** 2)))
+
+    def gradient_at(self, x, y):
+        """
+        Negative gradient of the apparent temperature at a point
+
+        Parameters
+        ----------
+        x : float
+        y : float
+
+        Returns
+        -------
+        gradx : float
+        grady : float
+        """
+        indices, dist2 = self.apparent_cells_.query(x, y)
+        factor = (self.amplitude / self.hotspot_radius ** 2
+                  * np.exp(-0.5 * dist2 / self.hotspot_radius ** 2)
+                  * self.apparent_weights_[indices])
+        centers = self.apparent_centers_[indices]
+        return (float(np.dot(factor, x - centers[:, 0])),
+                float(np.dot(factor, y - centers[:, 1])))
+
+    def max_temperature(self):
+        """
+        Maximum of the field (evaluated at the hotspot centres)
+
+        Returns
+        -------
+        float
+        """
+        return max([self.value_at(x, y) for x, y in self.centers_],
+                   default=0.0)
+
+    def mean_temperature(self):
+        """
+        Mean of the field over the domain of the rendered grid (integrated
+        analytically)
+
+        Returns
+        -------
+        float
+        """
+        xs = self.xx[0, :]
+        low, high = float(xs[0]), float(xs[-1])
+        scale = math.sqrt(2) * self.hotspot_radius
+
+        def fraction(c):
+            return 0.5 * (math.erf((high - c) / scale)
+                          - math.erf((low - c) / scale))
+
+        total = sum(w * fraction(cx) * fraction(cy)
+                    for (cx, cy), w in zip(self.centers_, self.weights_))
+        return (self.amplitude * 2 * np.pi * self.hotspot_radius ** 2
+                * total / (high - low) ** 2)
+
+    def render(self):
+        """
+        Evaluate the fields on the grid (cached until the next update)
+
+        Returns
+        -------
+        dict
+            with keys "temperature", "apparent_temperature", "gradx" and
+            "grady"
+        """
+        if self.rendered_ is not None:
+            return self.rendered_
+
+        xs = self.xx[0, :].astype(float)
+        ys = self.yy[:, 0].astype(float)
+        radius2 = self.hotspot_radius ** 2
+
+        def profiles(centers):
+            gx = np.exp(-0.5 * (xs[None, :] - centers[:, 0:1]) ** 2
+                        / radius2)
+            gy = np.exp(-0.5 * (ys[None, :] - centers[:, 1:2]) ** 2
+                        / radius2)
+            return gx, gy
+
+        gx, gy = profiles(self.centers_)
+        temperature = self.amplitude * (gy * self.weights_[:, None]).T @ gx
+
+        gx, gy = profiles(self.apparent_centers_)
+        gy = gy * self.apparent_weights_[:, None]
+        apparent = self.amplitude * gy.T @ gx
+        offset_x = (xs[None, :] - self.apparent_centers_[:, 0:1]) / radius2
+        offset_y = (ys[None, :] - self.apparent_centers_[:, 1:2]) / radius2
+        gradx = self.amplitude * gy.T @ (gx * offset_x)
+        grady = self.amplitude * (gy * offset_y).T @ gx
+
+        self.rendered_ = {
+            "temperature": temperature.astype(self.dtype),
+            "apparent_temperature": apparent.astype(self.dtype),
+            "gradx": gradx.astype(self.dtype),
+            "grady": grady.astype(self.dtype)
+        }
+        return self.rendered_
+
+    @property
+    def temperature(self):
+        return self.render()["temperature"]
+
+    @property
+    def apparent_temperature(self):
+        return self.render()["apparent_temperature"]
+
+    @property
+    def gradx(self):
+        return self.render()["gradx"]
+
+    @property
+    def grady(self):
+        return self.render()["grady"]
+
+    def __repr__(self):
+        return pformat(
+            {
+                "mode": "gridless",
+                "intensity": self.intensity,
+                "linger": self.linger,
+                "n_centers": len(self.centers_),
+                "max_temperature": f"{self.max_temperature():.3f}",
+                "mean_temperature": f"{self.mean_temperature():.3f}"
+            }
+        )
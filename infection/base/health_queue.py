@@ -0,0 +1,183 @@
+"""
+-------------------------------------------------------
+Base class for event queue of health transitions
+-------------------------------------------------------
+Author:  Mark Fruman
+Email:   majorgowan@yahoo.com
+-------------------------------------------------------
+"""
+import heapq
+from functools import lru_cache
+from pprint import pformat
+
+
+@lru_cache(maxsize=4096)
+def incubation_steps(incubation):
+    """
+    Number of steps until the end of an incubation (the countdown of
+    Person.update_health)
+
+    Parameters
+    ----------
+    incubation : float
+        incubation time at infection
+
+    Returns
+    -------
+    int
+    """
+    steps = 0
+    while True:
+        incubation -= 1
+        steps += 1
+        if incubation < 0.01:
+            return steps
+
+
+@lru_cache(maxsize=4096)
+def healing_trajectory(health, healing_rate):
+    """
+    Health on each step of a recovery (the recurrence of
+    Person.update_health), up to the step before recovery
+
+    Parameters
+    ----------
+    health : float
+        health at the end of incubation
+    healing_rate : float
+        rate of recovery
+
+    Returns
+    -------
+    trajectory : tuple
+        health on each step after the end of incubation
+    steps : int or None
+        number of steps until recovery (None if the person never
+        recovers)
+    """
+    trajectory = [health]
+    while True:
+        health = trajectory[-1] + healing_rate * (1 - trajectory[-1])
+        if health >= 0.9:
+            return tuple(trajectory), len(trajectory)
+        if health <= trajectory[-1]:
+            # no progress: the person never recovers
+            return tuple(trajectory), None
+        trajectory.append(health)
+
+
+@lru_cache(maxsize=4096)
+def immunity_trajectory(immunity):
+    """
+    Immunity on each step after recovery (the decay of
+    Person.update_health), until it vanishes
+
+    Parameters
+    ----------
+    immunity : float
+        immunity on recovery
+
+    Returns
+    -------
+    tuple
+    """
+    trajectory = [immunity]
+    while True:
+        trajectory.append(max(0.0, trajectory[-1] - 0.01))
+        if trajectory[-1] <= 0:
+            return tuple(trajectory)
+
+
+class HealthQueue:
+    """
+    Class representing the clock and the priority queue of health
+    transitions (end of incubation, recovery) of a population of
+    LazyPerson objects.  Health and immunity between transitions are
+    evaluated from the day of the last transition, so that a step only
+    touches the people whose state changes.
+
+    Parameters
+    ----------
+    people : list
+        LazyPerson objects (attached to this queue)
+    day : int
+        current day
+    """
+    def __init__(self, people, day=0):
+        self.people = people
+        self.day = day
+        self.events_ = []
+        # latest scheduled transition of each person (earlier ones are
+        # superseded, e.g. by a repeated infection)
+        self.due_ = {}
+        for person in people:
+            person.clock_ = self
+
+    def __len__(self):
+        return len(self.events_)
+
+    def schedule(self, index):
+        """
+        Schedule the next transition of a person who has just been
+        infected or finished incubating
+
+        Parameters
+        ----------
+        index : int
+            index of person
+        """
+        person = self.people[index]
+        if person.incubating:
+            event = (self.day + incubation_steps(person.incubation0_),
+                     index, "incubation")
+        elif person.infected:
+            _, steps = healing_trajectory(person.health0_,
+                                          person.healing_rate_)
+            if steps is None:
+                self.due_.pop(index, None)
+                return
+            event = (self.day + steps, index, "recovery")
+        else:
+            return
+        self.due_[index] = event
+        heapq.heappush(self.events_, event)
+
+    def advance(self):
+        """
+        Advance the clock by one step and apply the transitions due
+        (equivalent to Person.update_health for every person)
+
+        Returns
+        -------
+        list[int]
+            indices of the people whose state changed
+        """
+        self.day += 1
+        changed = []
+        while self.events_ and self.events_[0][0] <= self.day:
+            event = heapq.heappop(self.events_)
+            _, index, kind = event
+            if self.due_.get(index) != event:
+                continue
+            del self.due_[index]
+            person = self.people[index]
+            if kind == "incubation":
+                person.incubating = False
+                person.health_ = max(0.0, 1.0 - person.severity_)
+                self.schedule(index)
+            else:
+                person.health_ = 1.0
+                person.infected = False
+                person.immunity_ = person.full_immunity
+            changed.append(index)
+        return changed
+
+    def __repr__(self):
+        return pformat(
+            {
+                "day": self.day,
+                "n_people": len(self.people),
+                "n_events": len(self),
+                "next_event": self.events_[0][0] if self.events_ else None
+            }
+        )
@@ -0,0 +1,96 @@
+"""
+-------------------------------------------------------
+Base class for person with lazily evaluated health
+-------------------------------------------------------
+Author:  Mark Fruman
+Email:   majorgowan@yahoo.com
+-------------------------------------------------------
+"""
+from infection.base.health_queue import (healing_trajectory,
+                                         immunity_trajectory)
+from infection.base.person import Person
+
+
+class LazyPerson(Person):
+    """
+    Class representing a person whose health, incubation and immunity
+    are evaluated from the day of their last transition on the clock of a
+    HealthQueue (which applies the transitions) instead of being updated
+    on every step.  The values are identical to those of Person.
+
+    Parameters
+    ----------
+    see Person
+    """
+    clock_ = None
+
+    @property
+    def day_(self):
+        return 0 if self.clock_ is None else self.clock_.day
+
+    @property
+    def health_(self):
+        if self.infected and not self.incubating:
+            if self.healing_ is None:
+                self.healing_, _ = healing_trajectory(self.health0_,
+                                                      self.healing_rate_)
+            steps = self.day_ - self.health_since_
+            if steps < len(self.healing_):
+                return self.healing_[steps]
+            return self.healing_[-1]
+        return self.health0_
+
+    @health_.setter
+    def health_(self, value):
+        self.health0_ = value
+        self.health_since_ = self.day_
+        self.healing_ = None
+
+    @property
+    def incubation_(self):
+        if not self.incubating:
+            return self.incubation0_
+        incubation = self.incubation0_
+        for _ in range(self.day_ - self.incubation_since_):
+            incubation -= 1
+        return incubation
+
+    @incubation_.setter
+    def incubation_(self, value):
+        self.incubation0_ = value
+        self.incubation_since_ = self.day_
+
+    @property
+    def immunity_(self):
+        if self.infected:
+            return self.immunity0_
+        steps = self.day_ - self.immunity_since_
+        if steps < len(self.waning_):
+            return self.waning_[steps]
+        return 0.0
+
+    @immunity_.setter
+    def immunity_(self, value):
+        self.immunity0_ = value
+        self.immunity_since_ = self.day_
+        self.waning_ = immunity_trajectory(value)
+
+    def update_health(self):
+        """
+        Transitions are applied by the HealthQueue (see
+        HealthQueue.advance)
+        """
+        pass
+
+    def infect(self, incubation, healing_rate, severity, temperature=None,
+               rng=None):
+        """
+        (Try to) infect this person (see Person.infect); immunity is
+        frozen at its current value while infected
+        """
+        immunity = self.immunity_
+        result = super().infect(incubation, healing_rate, severity,
+                                temperature=temperature, rng=rng)
+        if result is not None:
+            self.immunity_ = immunity
+        return result
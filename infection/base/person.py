@@ -30,6 +30,9 @@ class Person:
     immunity : float
         initial level of immunity
     """
+    # number of people represented (see SuperPerson)
+    weight = 1
+
     def __init__(self, x, y, mobility, direction,
                  hypochondria, immunity):
         self.id_ = random_string(8)
@@ -52,6 +55,27 @@ class Person:
     def health(self):
         return self.health_
 
+    @property
+    def infected_weight(self):
+        """
+        Number of infected people represented (the weight of the hotspot
+        of the person)
+        """
+        return self.weight if self.infected else 0
+
+    @property
+    def recovered_weight(self):
+        """
+        Number of people represented who carry immunity_
+        """
+        return self.weight
+
+    def immune_weight(self, temperature):
+        """
+        Number of immune people represented (see immune)
+        """
+        return self.recovered_weight if self.immune(temperature) else 0
+
     @property
     def speed(self):
         return self.mobility * self.health
@@ -87,16 +111,14 @@ class Person:
 
         Parameters
         ----------
-        temperature : Temperature object
-            with keys "xx", "yy", and "temperature"
+        temperature : Temperature or GridlessTemperature object
+            temperature field
 
         Returns
         -------
         float
         """
-        nextx = self.get_next(temperature.xx[0, :] >= self.x)
-        nexty = self.get_next(temperature.yy[:, 0] >= self.y)
-        return temperature.temperature[nexty, nextx]
+        return temperature.value_at(self.x, self.y)
 
     def get_temperature_gradient(self, temperature):
         """
@@ -105,8 +127,8 @@ class Person:
 
         Parameters
         ----------
-        temperature : Temperature object
-            with keys "xx", "yy", and "temperature"
+        temperature : Temperature or GridlessTemperature object
+            temperature field
 
         Returns
         -------
@@ -115,15 +137,14 @@ class Person:
         grady : float
             y-coordinate of gradient
         """
-        nextx = self.get_next(temperature.xx[0, :] >= self.x)
-        nexty = self.get_next(temperature.yy[:, 0] >= self.y)
-        return (temperature.gradx[nexty, nextx],
-                temperature.grady[nexty, nextx])
+        return temperature.gradient_at(self.x, self.y)
 
     def immune(self, temperature):
         """
         Return True if the person is immune (with buffer) given local
-        temperature.
+        temperature.  If the field provides bounds of the local
+        temperature (bounds_at), the temperature is only looked up when
+        the bounds do not decide.
 
         Parameters
         ----------
@@ -134,8 +155,30 @@ class Person:
         -------
         bool
         """
+        if hasattr(temperature, "bounds_at"):
+            low, high = temperature.bounds_at(self.x, self.y)
+            if self.immunity_ > high + 0.1:
+                return True
+            if self.immunity_ <= low + 0.1:
+                return False
         return self.immunity_ > self.get_temperature(temperature) + 0.1
 
+    def susceptible(self, temperature):
+        """
+        Return True if the person can be infected (neither infected nor
+        immune)
+
+        Parameters
+        ----------
+        temperature : Temperature object
+            temperature field
+
+        Returns
+        -------
+        bool
+        """
+        return not self.infected and not self.immune(temperature)
+
     def update_health(self):
         """
         Update person's health
@@ -220,7 +263,8 @@ class Person:
                 self.dx *= length0 / length
                 self.dy *= length0 / length
 
-    def infect(self, incubation, healing_rate, severity, temperature=None):
+    def infect(self, incubation, healing_rate, severity, temperature=None,
+               rng=None):
         """
         (Try to) infect this person if immunity is weaker than local
         temperature is hot.
@@ -235,20 +279,31 @@ class Person:
             initial severity of disease if infected
         temperature : Temperature object
             temperature field
+        rng : numpy.random.Generator
+            random generator of the infection trial (global numpy.random
+            if None)
 
         Returns
         -------
         dict
             description of the infection event
         """
+        if rng is None:
+            rng = np.random
         infect_flag = False
         if temperature is None:
             # deliberate infection!
             infect_flag = True
             temp0 = 1
+        elif (severity >= 0 and hasattr(temperature, "bounds_at")
+              and temperature.bounds_at(self.x, self.y)[1]
+              <= self.immunity_):
+            # local temperature cannot exceed immunity: no infection,
+            # but make the draw to keep the random sequence
+            rng.random()
         else:
             temp0 = self.get_temperature(temperature)
-            if np.random.random() < severity * (temp0 - self.immunity_):
+            if rng.random() < severity * (temp0 - self.immunity_):
                 infect_flag = True
 
         if infect_flag:
@@ -306,6 +361,18 @@ class Person:
     def immunities(people):
         return np.array([person.immunity_ for person in people])
 
+    @staticmethod
+    def infected_count(people):
+        return sum(person.infected_weight for person in people)
+
+    @staticmethod
+    def immune_count(people, temperature):
+        return sum(person.immune_weight(temperature) for person in people)
+
+    @staticmethod
+    def recovered_weights(people):
+        return np.array([person.recovered_weight for person in people])
+
     @staticmethod
     def infected_people(people):
         return [person for person in people if person.infected]
@@ -321,5 +388,9 @@ class Person:
     @staticmethod
     def susceptible_people(people, temperature):
         return [person for person in people
-                if not person.immune(temperature)
-                and not person.infected]
+                if person.susceptible(temperature)]
+
+    @staticmethod
+    def susceptible_indices(people, temperature):
+        return [ii for ii, person in enumerate(people)
+                if person.susceptible(temperature)]
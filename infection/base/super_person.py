@@ -0,0 +1,174 @@
+"""
+-------------------------------------------------------
+Base class for super-individual representing many people
+-------------------------------------------------------
+Author:  Mark Fruman
+Email:   majorgowan@yahoo.com
+-------------------------------------------------------
+"""
+import numpy as np
+from infection.base.person import Person
+
+
+class SuperPerson(Person):
+    """
+    Class representing a super-individual: an agent standing for weight
+    people who move together.  Its infected members form one cohort: each
+    member is tried independently with the infectiousness times the
+    infection probability of Person.infect (so the number infected by a
+    draw is binomial, or the expected number), members
+    infected while the cohort is ill join it, the cohort follows the
+    health of Person (which sets the speed of the agent) and on recovery
+    its members become immune, with the immunity of Person.  The hotspot
+    of the agent is scaled by the size of the cohort.
+
+    Parameters
+    ----------
+    see Person
+    weight : int
+        number of people represented
+    sampling : str
+        "binomial" (members infected independently) or "fractional" (the
+        expected number of members infected, rounded up or down at random
+        to whole people)
+    """
+    def __init__(self, x, y, mobility, direction, hypochondria, immunity,
+                 weight=1, sampling="binomial"):
+        super().__init__(x=x, y=y, mobility=mobility, direction=direction,
+                         hypochondria=hypochondria, immunity=immunity)
+        self.weight = weight
+        self.sampling = sampling
+        self.infected_weight_ = 0
+        self.immune_weight_ = 0
+
+    @property
+    def infected_weight(self):
+        return self.infected_weight_ if self.infected else 0
+
+    @property
+    def recovered_weight(self):
+        return self.immune_weight_
+
+    def immune(self, temperature):
+        """
+        Return True if every member is immune (see Person.immune)
+        """
+        return (self.immune_weight_ >= self.weight
+                and super().immune(temperature))
+
+    def immune_weight(self, temperature):
+        return self.immune_weight_ if super().immune(temperature) else 0
+
+    def susceptible(self, temperature):
+        """
+        Return True if some member can be infected (neither infected nor
+        immune)
+        """
+        if self.infected_weight_ + self.immune_weight_ < self.weight:
+            return True
+        return (self.immune_weight_ > 0
+                and not super().immune(temperature))
+
+    @staticmethod
+    def clip(probability):
+        return min(max(probability, 0.0), 1.0)
+
+    def sample(self, n_members, probability, rng=None):
+        """
+        Number of n_members infected with a probability
+
+        Parameters
+        ----------
+        n_members : int
+        probability : float
+        rng : numpy.random.Generator
+            random generator (global numpy.random if None)
+
+        Returns
+        -------
+        int
+        """
+        if rng is None:
+            rng = np.random
+        probability = self.clip(probability)
+        if n_members <= 0 or probability == 0:
+            return 0
+        if self.sampling == "fractional":
+            expected = n_members * probability
+            whole = int(expected)
+            return whole + int(rng.random() < expected - whole)
+        return int(rng.binomial(n_members, probability))
+
+    def update_health(self):
+        """
+        Update the health of the infected cohort (see Person.update_health);
+        on recovery its members become immune
+        """
+        infected = self.infected
+        super().update_health()
+        if infected and not self.infected:
+            self.immune_weight_ = min(self.weight, self.immune_weight_
+                                      + self.infected_weight_)
+            self.infected_weight_ = 0
+
+    def infect(self, incubation, healing_rate, severity, temperature=None,
+               rng=None, infectiousness=1.0):
+        """
+        (Try to) infect members: those who are neither infected nor immune
+        with probability infectiousness * severity * temperature, and the
+        immune ones with probability infectiousness * severity *
+        (temperature - immunity) (see Person.infect).  If the cohort is
+        already ill the new members join it.
+
+        Parameters
+        ----------
+        see Person.infect
+        infectiousness : float
+            probability that a member is exposed (drawn for each member
+            rather than once for the agent, see Infection.update_people)
+
+        Returns
+        -------
+        dict
+            description of the infection event (with the "weight" of the
+            members infected), or None if no member is infected
+        """
+        if self.immunity_ <= 0:
+            # the immunity of recovered members has waned
+            self.immune_weight_ = 0
+        naive = self.weight - self.infected_weight_ - self.immune_weight_
+        if temperature is None:
+            # deliberate infection of every member
+            temp0 = 1
+            from_immune = self.immune_weight_
+            cohort = from_immune + naive
+        else:
+            temp0 = self.get_temperature(temperature)
+            from_immune = self.sample(
+                self.immune_weight_,
+                infectiousness * self.clip(severity * (temp0
+                                                       - self.immunity_)),
+                rng=rng)
+            cohort = from_immune + self.sample(
+                naive, infectiousness * self.clip(severity * temp0), rng=rng)
+        if cohort == 0:
+            return None
+
+        if self.infected:
+            result = {
+                "id_": self.id_,
+                "x": self.x,
+                "y": self.y,
+                "severity": self.severity_,
+                "healing_rate": self.healing_rate_,
+                "incubation": self.incubation_
+            }
+        else:
+            result = super().infect(incubation=incubation,
+                                    healing_rate=healing_rate,
+                                    severity=severity)
+        self.infected_weight_ += cohort
+        self.immune_weight_ -= from_immune
+        result["temperature"] = temp0
+        result["weight"] = cohort
+        return result
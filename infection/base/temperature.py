@@ -6,10 +6,77 @@ Author:  Mark Fruman
 Email:   majorgowan@yahoo.com
 -------------------------------------------------------
 """
+import os
 import numpy as np
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
 from pprint import pformat
 
 
+# hotspot terms smaller than this fraction of their peak are dropped (each
+# hotspot is evaluated only within TRUNCATION_RADII hotspot radii)
+TRUNCATION = 1e-12
+TRUNCATION_RADII = float(np.sqrt(-2 * np.log(TRUNCATION)))
+
+
+@lru_cache(maxsize=None)
+def grid_coordinates(gridsize, dtype="float64"):
+    """
+    Generate the coordinates of the temperature grid (the unit square
+    with a buffer of one grid point on each side).  The arrays are
+    read-only and shared by all fields with the same gridsize and dtype.
+
+    Parameters
+    ----------
+    gridsize : int
+        number of points in each direction
+    dtype : str
+        floating point type of coordinates
+
+    Returns
+    -------
+    xx : numpy.array
+        (gridsize, gridsize) array of x-coordinates
+    yy : numpy.array
+        (gridsize, gridsize) array of y-coordinates
+    """
+    buffer_points = 1
+    buffer_width = (buffer_points / gridsize)
+    xx, yy = np.meshgrid(np.linspace(-1 * buffer_width,
+                                     1 + buffer_width, gridsize),
+                         np.linspace(-1 * buffer_width,
+                                     1 + buffer_width, gridsize))
+    xx = xx.astype(dtype)
+    yy = yy.astype(dtype)
+    xx.setflags(write=False)
+    yy.setflags(write=False)
+    return xx, yy
+
+
+@lru_cache(maxsize=None)
+def _thread_pool(threads, pid):
+    return ThreadPoolExecutor(max_workers=threads,
+                              thread_name_prefix="temperature")
+
+
+def thread_pool(threads):
+    """
+    Thread pool shared by all fields with the same number of threads
+    (a new pool is created in a forked process, whose copy of the parent's
+    pool has no running threads)
+
+    Parameters
+    ----------
+    threads : int
+        number of worker threads
+
+    Returns
+    -------
+    concurrent.futures.ThreadPoolExecutor
+    """
+    return _thread_pool(threads, os.getpid())
+
+
 class Temperature:
     """
     Class representing a temperature field
@@ -26,31 +93,42 @@ class Temperature:
         and field due to new positions of people)
     intensity : float
         amplitude of temperature perturbation around infected person
+    dtype : str
+        floating point type of the fields ("float64" or "float32")
+    threads : int
+        number of threads evaluating the hotspots (the grid is split into
+        one block of rows per thread)
+
+    Each hotspot is evaluated only on the grid points within
+    TRUNCATION_RADII * hotspot_radius of its centre (in each direction),
+    beyond which its terms are below TRUNCATION times its peak.
     """
     def __init__(self, gridsize, hotspot_radius=0.1, linger=0,
-                 intensity=1):
+                 intensity=1, dtype="float64", threads=1):
         self.gridsize = gridsize
         self.hotspot_radius = hotspot_radius
         self.linger = linger
         self.intensity = intensity
+        self.dtype = np.dtype(dtype)
+        self.threads = threads
 
-        buffer_points = 1
-        buffer_width = (buffer_points / gridsize)
-        xx, yy = np.meshgrid(np.linspace(-1 * buffer_width,
-                                         1 + buffer_width, gridsize),
-                             np.linspace(-1 * buffer_width,
-                                         1 + buffer_width, gridsize))
+        # coordinates are shared (read-only) between instances
+        xx, yy = grid_coordinates(gridsize, self.dtype.name)
 
         self.xx = xx
         self.yy = yy
         self.dx = xx[0, 1] - xx[0, 0]
         self.dy = yy[1, 0] - yy[0, 0]
-        self.temperature = np.zeros(shape=xx.shape)
-        self.apparent_temperature = np.zeros(shape=xx.shape)
-        self.gradx = np.zeros(shape=xx.shape)
-        self.grady = np.zeros(shape=xx.shape)
+        self.temperature = np.zeros(shape=xx.shape, dtype=self.dtype)
+        self.apparent_temperature = np.zeros(shape=xx.shape,
+                                             dtype=self.dtype)
+        self.gradx = np.zeros(shape=xx.shape, dtype=self.dtype)
+        self.grady = np.zeros(shape=xx.shape, dtype=self.dtype)
+        # coarse cells for bounds of the temperature (see bounds_at)
+        self.n_cells = max(1, gridsize // 4)
+        self.cell_bounds_ = None
 
-    def update(self, people):
+    def update(self, people, steps=1):
         """
         Update field based on positions of people
 
@@ -58,27 +136,45 @@ class Temperature:
         ----------
         people : People objects
             determine new temperature field after update
+        steps : int
+            number of steps since the last update: the lingering
+            temperature decays once per step (as if steps - 1 updates
+            with no one infected preceded this one)
         """
         amplitude = self.intensity / (4 * np.pi) / self.hotspot_radius
+        symptomatic = [(float(person.x), float(person.y),
+                        person.infected_weight)
+                       for person in people
+                       if person.infected and not person.incubating]
+        incubating = [(float(person.x), float(person.y),
+                       person.infected_weight)
+                      for person in people
+                      if person.infected and person.incubating]
+
+        # more threads than cores would only add overhead
+        threads = max(1, min(self.threads, os.cpu_count() or 1))
+        rows = [block for block in np.array_split(np.arange(self.gridsize),
+                                                  threads)
+                if len(block) > 0]
+        rows = [slice(block[0], block[-1] + 1) for block in rows]
+
+        def evaluate(block):
+            return self.hotspots(block, symptomatic, incubating, amplitude)
 
-        temp0 = np.zeros(shape=self.temperature.shape)
-        for person in people:
-            if person.infected and not person.incubating:
-                dist2 = (self.xx - person.x) ** 2 + (self.yy - person.y) ** 2
-                temp0 += (amplitude
-                          * np.exp(-0.5 * dist2 / self.hotspot_radius ** 2))
+        if len(rows) > 1:
+            blocks = list(thread_pool(len(rows)).map(evaluate, rows))
+        else:
+            blocks = [evaluate(block) for block in rows]
 
         # apparent temperature based on symptomatic people
-        self.apparent_temperature = temp0.copy()
+        self.apparent_temperature = np.concatenate(
+            [apparent for apparent, _ in blocks])
+        temp0 = np.concatenate([temp for _, temp in blocks])
 
-        for person in people:
-            if person.infected and person.incubating:
-                dist2 = (self.xx - person.x) ** 2 + (self.yy - person.y) ** 2
-                temp0 += (amplitude
-                          * np.exp(-0.5 * dist2 / self.hotspot_radius ** 2))
         # actual temperature includes incubating people and linger
-        self.temperature = ((self.linger * self.temperature + temp0)
-                            / (1.0 + self.linger))
+        lingering = (self.linger * self.temperature
+                     * (self.linger / (1.0 + self.linger)) ** (steps - 1))
+        self.temperature = (lingering + temp0) / (1.0 + self.linger)
 
         # compute gradient of apparent temperature
         gradx = -0.5 * (self.apparent_temperature[:, 2:]
@@ -88,6 +184,200 @@ class Temperature:
         self.gradx[:, 1:-1] = gradx
         self.grady[1:-1, :] = grady
 
+    def hotspots(self, rows, symptomatic, incubating, amplitude):
+        """
+        Sum the hotspots of infected people on a block of rows of the grid,
+        each on the rows and columns within its truncation window (so the
+        hotspots far from the block are skipped).  Every grid point
+        receives the same terms in the same order whatever the blocks, so
+        the fields do not depend on the number of threads.
+
+        Parameters
+        ----------
+        rows : slice
+            rows of the grid
+        symptomatic : list
+            (x, y, weight) positions of symptomatic people and numbers of
+            infected people they represent
+        incubating : list
+            (x, y, weight) of incubating people
+        amplitude : float
+            amplitude of a hotspot (of a single person)
+
+        Returns
+        -------
+        apparent : numpy.array
+            sum of the hotspots of symptomatic people on the block
+        temp0 : numpy.array
+            sum of the hotspots of all infected people on the block
+        """
+        xline = self.xx[0, :]
+        yline = self.yy[:, 0]
+        reach = TRUNCATION_RADII * self.hotspot_radius
+
+        def window(line, centre):
+            # grid points of a line within reach of a centre, and the
+            # gaussian factor of a hotspot there
+            start = int(np.searchsorted(line, centre - reach, side="left"))
+            stop = int(np.searchsorted(line, centre + reach, side="right"))
+            factor = np.exp(-0.5 * (line[start:stop] - centre) ** 2
+                            / self.hotspot_radius ** 2)
+            return start, stop, factor
+
+        def accumulate(temp0, positions):
+            for x, y, weight in positions:
+                start, stop, factor_y = window(yline, y)
+                # rows of the window in the block
+                first = max(start, rows.start)
+                last = min(stop, rows.stop)
+                if first >= last:
+                    continue
+                left, right, factor_x = window(xline, x)
+                temp0[first - rows.start:last - rows.start, left:right] += (
+                    (amplitude * weight)
+                    * factor_y[first - start:last - start, None]
+                    * factor_x[None, :])
+
+        temp0 = np.zeros(shape=(rows.stop - rows.start, self.gridsize),
+                         dtype=self.dtype)
+        accumulate(temp0, symptomatic)
+        apparent = temp0.copy()
+        accumulate(temp0, incubating)
+        return apparent, temp0
+
+    def grid_index(self, x, y):
+        """
+        Indices of the first grid point at or beyond (x, y) in each
+        direction
+
+        Parameters
+        ----------
+        x : float
+        y : float
+
+        Returns
+        -------
+        nexty : int
+        nextx : int
+        """
+        nextx = int(np.searchsorted(self.xx[0, :], x, side="left"))
+        nexty = int(np.searchsorted(self.yy[:, 0], y, side="left"))
+        return nexty, nextx
+
+    def value_at(self, x, y):
+        """
+        Temperature at the grid point at (or just beyond) a point
+
+        Parameters
+        ----------
+        x : float
+        y : float
+
+        Returns
+        -------
+        float
+        """
+        return self.temperature[self.grid_index(x, y)]
+
+    def gradient_at(self, x, y):
+        """
+        Negative gradient of the apparent temperature at the grid point at
+        (or just beyond) a point
+
+        Parameters
+        ----------
+        x : float
+        y : float
+
+        Returns
+        -------
+        gradx : float
+        grady : float
+        """
+        index = self.grid_index(x, y)
+        return self.gradx[index], self.grady[index]
+
+    def cell_bounds(self):
+        """
+        Minimum and maximum of the temperature over the grid points that
+        value_at may return for positions in each of n_cells x n_cells
+        cells covering the unit square (with a margin of one grid point
+        against rounding of positions near cell edges).  Computed once per
+        temperature field.
+
+        Returns
+        -------
+        low : numpy.array
+            (n_cells, n_cells) minimum in each cell (indexed [y, x])
+        high : numpy.array
+            (n_cells, n_cells) maximum in each cell
+        """
+        if (self.cell_bounds_ is not None
+                and self.cell_bounds_[0] is self.temperature):
+            return self.cell_bounds_[1:]
+
+        edges = np.searchsorted(self.xx[0, :],
+                                np.linspace(0, 1, self.n_cells + 1),
+                                side="left")
+        starts = edges[:-1]
+        ends = np.minimum(edges[1:], self.gridsize - 1)
+
+        def reduce(field, ufunc):
+            for axis in (0, 1):
+                # widen by one grid point on either side
+                field = np.moveaxis(field, axis, 0)
+                field = ufunc(field, np.concatenate([field[:1], field[:-1]]))
+                field = ufunc(field, np.concatenate([field[1:], field[-1:]]))
+                # cell j covers grid points starts[j] to ends[j]
+                field = ufunc(ufunc.reduceat(field, starts, axis=0),
+                              field[ends])
+                field = np.moveaxis(field, 0, axis)
+            return field
+
+        low = reduce(self.temperature, np.minimum)
+        high = reduce(self.temperature, np.maximum)
+        self.cell_bounds_ = (self.temperature, low, high)
+        return low, high
+
+    def bounds_at(self, x, y):
+        """
+        Bounds of the temperature that value_at may return at a point
+        (see cell_bounds)
+
+        Parameters
+        ----------
+        x : float
+        y : float
+
+        Returns
+        -------
+        low : float
+        high : float
+        """
+        low, high = self.cell_bounds()
+        column = min(max(int(x * self.n_cells), 0), self.n_cells - 1)
+        row = min(max(int(y * self.n_cells), 0), self.n_cells - 1)
+        return low[row, column], high[row, column]
+
+    def max_temperature(self):
+        return self.temperature.max(initial=0.0)
+
+    def mean_temperature(self):
+        return self.temperature.mean()
+
+    def decay(self):
+        """
+        Update field when no one is infected: the lingering temperature
+        decays and the apparent temperature and its gradient vanish
+        (equivalent to update with no infected people, without
+        evaluating any hotspots)
+        """
+        self.temperature = (self.linger * self.temperature
+                            / (1.0 + self.linger))
+        self.apparent_temperature[:] = 0.0
+        self.gradx[:] = 0.0
+        self.grady[:] = 0.0
+
     def __repr__(self):
         max_temperature = self.temperature.max(initial=0.0)
         mean_temperature = self.temperature.mean()
@@ -96,6 +386,8 @@ class Temperature:
         return pformat(
             {
                 "gridsize": self.gridsize,
+                "dtype": self.dtype.name,
+                "threads": self.threads,
                 "intensity": self.intensity,
                 "linger": self.linger,
                 "max_temperature": f"{max_temperature:.3f}",
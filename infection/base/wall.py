@@ -6,6 +6,7 @@ Author:  Mark Fruman
 Email:   majorgowan@yahoo.com
 -------------------------------------------------------
 """
+import numpy as np
 from pprint import pformat
 
 
@@ -88,6 +89,51 @@ class Wall:
             # find new landing point
             return [2 * self.x - pos2[0], pos2[1]]
 
+    def bounce_many(self, x1, y1, x2, y2):
+        """
+        Vectorized version of bounce for arrays of displacements
+
+        Parameters
+        ----------
+        x1, y1 : numpy.array
+            coordinates of starting points
+        x2, y2 : numpy.array
+            coordinates of end points
+
+        Returns
+        -------
+        hit : numpy.array of bool
+            True where the displacement intersects the wall
+        x2, y2 : numpy.array
+            new landing points (end points unchanged where not hit)
+        """
+        if self.orient == "h":
+            along1, along2, across1, across2 = x1, x2, y1, y2
+            level, limits = self.y, self.x
+        else:
+            along1, along2, across1, across2 = y1, y2, x1, x2
+            level, limits = self.x, self.y
+
+        hit = ~((np.minimum(across1, across2) > level)
+                | (np.maximum(across1, across2) < level)
+                | (np.maximum(along1, along2) < limits[0])
+                | (np.minimum(along1, along2) > limits[1]))
+
+        # exclude case of displacement parallel to wall
+        oblique = hit & (across1 != across2)
+        if oblique.any():
+            a1, a2 = along1[oblique], along2[oblique]
+            c1, c2 = across1[oblique], across2[oblique]
+            slope = (a2 - a1) / (c2 - c1)
+            crossing = a1 + slope * (level - c1)
+            # check if intersection point is outside limits of wall
+            hit[oblique] = (limits[0] <= crossing) & (crossing <= limits[1])
+
+        # find new landing points
+        if self.orient == "h":
+            return hit, x2, np.where(hit, 2 * self.y - y2, y2)
+        return hit, np.where(hit, 2 * self.x - x2, x2), y2
+
     def __repr__(self):
         return pformat(
             {
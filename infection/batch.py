@@ -0,0 +1,395 @@
+"""
+-------------------------------------------------------
+Batched engine advancing independent replicas at once
+-------------------------------------------------------
+Author:  Mark Fruman
+Email:   majorgowan@yahoo.com
+-------------------------------------------------------
+"""
+import numpy as np
+from pprint import pformat
+from infection.base import Wall
+from infection.base.temperature import grid_coordinates
+from infection.infection import default_configuration
+from infection.resolution import resolve_gridsize
+from infection.utils import supdate, random_choice
+
+
+class BatchInfection:
+    """
+    Class representing n_replicas independent realizations of the same
+    simulation, advanced together in one vectorized state.  The state of
+    the people is stored in (n_replicas, n_people) arrays and the
+    temperature fields in (n_replicas, gridsize, gridsize) arrays; each
+    replica draws from its own random generator.
+
+    The model is the same as that of Infection (see Person and
+    Temperature), but the random streams differ so individual replicas
+    are not reproductions of Infection runs with the same seed.  All
+    state (people and fields) is stored with the configured "dtype".
+    Every agent is one person: super-individuals (agent_weight > 1) are
+    not supported.
+
+    Parameters
+    ----------
+    n_replicas : int
+        number of independent replicas
+    kwargs
+        configuration (as for Infection)
+    """
+    def __init__(self, n_replicas, **kwargs):
+        configuration = default_configuration()
+        supdate(configuration, kwargs)
+        if configuration["agent_weight"] > 1:
+            raise ValueError("super-individuals (agent_weight > 1) are not "
+                             + "supported by BatchInfection")
+        self.configuration = configuration
+        self.n_replicas = n_replicas
+        self.walls_ = [Wall(**wall_config)
+                       for wall_config in configuration["mobility"]["walls"]]
+        self.day_ = 0
+        self.rngs_ = None
+        self.dtype = np.dtype(configuration["dtype"])
+
+        gridsize = resolve_gridsize(configuration)
+        xx, yy = grid_coordinates(gridsize, self.dtype.name)
+        self.xs = xx[0, :]
+        self.ys = yy[:, 0]
+        self.grid_dx = xx[0, 1] - xx[0, 0]
+        self.grid_dy = yy[1, 0] - yy[0, 0]
+
+        shape = (n_replicas, gridsize, gridsize)
+        self.temperature_ = np.zeros(shape, dtype=self.dtype)
+        self.apparent_temperature_ = np.zeros(shape, dtype=self.dtype)
+        self.gradx_ = np.zeros(shape, dtype=self.dtype)
+        self.grady_ = np.zeros(shape, dtype=self.dtype)
+
+    def __getitem__(self, item):
+        return self.configuration.get(item, None)
+
+    def draw(self, values_obj, size):
+        """
+        Draw a (n_replicas, size) array of values from the per-replica
+        generators (see utils.random_choice)
+
+        Returns
+        -------
+        numpy.array
+        """
+        return np.array([np.broadcast_to(random_choice(values_obj,
+                                                       size=size, rng=rng),
+                                         size)
+                         for rng in self.rngs_], dtype=self.dtype)
+
+    def uniform(self, size):
+        """
+        Draw a (n_replicas, size) array of uniform [0, 1) values from the
+        per-replica generators
+
+        Returns
+        -------
+        numpy.array
+        """
+        return np.array([rng.random(size, dtype=self.dtype)
+                         for rng in self.rngs_])
+
+    def initialize_all(self, random_seed=None):
+        """
+        Initialize the people and temperature fields of all replicas
+
+        Parameters
+        ----------
+        random_seed : int
+            seed from which the independent replica streams are spawned
+
+        Returns
+        -------
+        BatchInfection
+        """
+        seeds = np.random.SeedSequence(random_seed).spawn(self.n_replicas)
+        self.rngs_ = [np.random.default_rng(seed) for seed in seeds]
+
+        n_people = self["n_people"]
+        mobility = self["mobility"]
+        infect0 = self["infection"]
+        shape = (self.n_replicas, n_people)
+
+        self.day_ = 0
+        self.x_ = self.uniform(n_people)
+        self.y_ = self.uniform(n_people)
+        self.mobility_ = self.draw(mobility["speed"], n_people)
+        directions = 2 * np.pi * self.uniform(n_people)
+        self.dx_ = np.cos(directions)
+        self.dy_ = np.sin(directions)
+        self.full_immunity_ = self.draw(infect0["immunity"], n_people)
+        self.hypochondria_ = self.draw(mobility["hypochondria"], n_people)
+
+        self.health_ = np.ones(shape, dtype=self.dtype)
+        self.incubation_ = np.zeros(shape, dtype=self.dtype)
+        self.severity_ = np.zeros(shape, dtype=self.dtype)
+        self.immunity_ = np.zeros(shape, dtype=self.dtype)
+        self.healing_rate_ = np.zeros(shape, dtype=self.dtype)
+        self.infected_ = np.zeros(shape, dtype=bool)
+        self.incubating_ = np.zeros(shape, dtype=bool)
+
+        # randomly pick the infected
+        n_infected = int(self["initial_infection_fraction"] * n_people)
+        for replica, rng in enumerate(self.rngs_):
+            infected = rng.choice(n_people, size=n_infected)
+            self.incubation_[replica, infected] = np.broadcast_to(
+                random_choice(infect0["incubation"], size=n_infected,
+                              rng=rng), n_infected)
+            self.severity_[replica, infected] = np.maximum(
+                1.0, np.broadcast_to(random_choice(infect0["severity"],
+                                                   size=n_infected,
+                                                   rng=rng), n_infected))
+            self.healing_rate_[replica, infected] = np.broadcast_to(
+                random_choice(infect0["healing_rate"], size=n_infected,
+                              rng=rng), n_infected)
+            self.infected_[replica, infected] = True
+            self.incubating_[replica, infected] = True
+
+        self.temperature_[:] = 0.0
+        self.apparent_temperature_[:] = 0.0
+        self.gradx_[:] = 0.0
+        self.grady_[:] = 0.0
+        return self
+
+    def grid_indices(self):
+        """
+        Indices of the grid point at (or just beyond) each person's
+        position (cf. Person.get_temperature)
+
+        Returns
+        -------
+        replicas, iy, ix : numpy.array of int
+            index arrays into the (n_replicas, gridsize, gridsize) fields
+        """
+        ix = np.searchsorted(self.xs, self.x_, side="left")
+        iy = np.searchsorted(self.ys, self.y_, side="left")
+        replicas = np.broadcast_to(np.arange(self.n_replicas)[:, None],
+                                   ix.shape)
+        return replicas, iy, ix
+
+    def update_health(self):
+        """
+        Vectorized Person.update_health for all people in all replicas
+        """
+        incubating = self.incubating_.copy()
+        sick = self.infected_ & ~incubating
+        well = ~self.infected_
+
+        # count down incubation
+        self.incubation_[incubating] -= 1
+        finished = incubating & (self.incubation_ < 0.01)
+        self.incubating_[finished] = False
+        self.health_[finished] = np.maximum(0.0,
+                                            1.0 - self.severity_[finished])
+
+        # heal
+        self.health_[sick] += (self.healing_rate_[sick]
+                               * (1 - self.health_[sick]))
+        healed = sick & (self.health_ >= 0.9)
+        self.health_[healed] = 1.0
+        self.infected_[healed] = False
+        self.immunity_[healed] = self.full_immunity_[healed]
+
+        # decay immunity
+        self.immunity_[well] = np.maximum(0.0, self.immunity_[well] - 0.01)
+
+    def infection_draw(self, local, infectiousness, trial, draw, severity):
+        """
+        Determine who is newly infected given the uniform draws (cf. the
+        infection loop in Infection.update_people and Person.infect)
+
+        Parameters
+        ----------
+        local : numpy.array
+            temperature at each person's position
+        infectiousness : float
+            probability of an infection attempt
+        trial : numpy.array
+            uniform draws deciding infection attempts
+        draw : numpy.array
+            uniform draws deciding infection given an attempt
+        severity : numpy.array
+            severity of the disease if infected
+
+        Returns
+        -------
+        numpy.array of bool
+        """
+        susceptible = ~(self.immunity_ > local + 0.1) & ~self.infected_
+        return (susceptible & (trial < infectiousness)
+                & (draw < severity * (local - self.immunity_)))
+
+    def update_people(self):
+        """
+        Update the health, infection status and movement of the people
+        in all replicas
+        """
+        infect0 = self["infection"]
+        infectiousness = infect0["infectiousness"]
+        seasonality = infect0["seasonality"]
+        n_people = self["n_people"]
+
+        if seasonality > 0:
+            infectiousness = (infectiousness
+                              * (1 + seasonality * np.cos(2 * np.pi
+                                                          * self.day_ / 365)))
+
+        self.update_health()
+
+        # infect new people
+        cells = self.grid_indices()
+        local = self.temperature_[cells]
+        trial = self.uniform(n_people)
+        incubation = self.draw(infect0["incubation"], n_people)
+        severity = self.draw(infect0["severity"], n_people)
+        healing_rate = self.draw(infect0["healing_rate"], n_people)
+        draw = self.uniform(n_people)
+        new = self.infection_draw(local, infectiousness, trial, draw,
+                                  severity)
+
+        self.severity_[new] = np.maximum(1.0, severity[new])
+        self.healing_rate_[new] = healing_rate[new]
+        self.incubation_[new] = incubation[new]
+        self.incubating_[new] = True
+        self.infected_[new] = True
+
+        # accelerate away from hotspots
+        well = ~self.infected_
+        length0 = np.sqrt(self.dx_ ** 2 + self.dy_ ** 2)
+        dx = self.dx_ + self.hypochondria_ * self.gradx_[cells]
+        dy = self.dy_ + self.hypochondria_ * self.grady_[cells]
+        length = np.sqrt(dx ** 2 + dy ** 2)
+        scale = np.divide(length0, length, out=np.ones_like(length),
+                          where=length > 0)
+        self.dx_ = np.where(well, dx * scale, self.dx_)
+        self.dy_ = np.where(well, dy * scale, self.dy_)
+
+        self.move()
+
+    def move(self):
+        """
+        Vectorized Person.move for all people in all replicas
+        """
+        speed = self.mobility_ * self.health_
+        x1, y1 = self.x_, self.y_
+        x2 = x1 + self.dx_ * speed
+        y2 = y1 + self.dy_ * speed
+
+        # check if displacement hits a wall (two passes)
+        for _ in range(2):
+            for wall in self.walls_:
+                hit, x2, y2 = wall.bounce_many(x1, y1, x2, y2)
+                if wall.orient == "h":
+                    self.dy_[hit] *= -1
+                else:
+                    self.dx_[hit] *= -1
+
+        # apply periodic bc at open boundary
+        self.x_ = x2 % 1
+        self.y_ = y2 % 1
+
+    def update_temperature(self):
+        """
+        Vectorized Temperature.update for all replicas (the gaussian
+        hotspots are separable, so each field is a matrix product)
+        """
+        hotspot_radius = self["infection"]["hotspot_radius"]
+        linger = self["infection"]["linger"]
+        amplitude = (self["infection"]["infectiousness"]
+                     / (4 * np.pi) / hotspot_radius)
+
+        gx = np.exp(-0.5 * (self.xs[None, None, :] - self.x_[:, :, None]) ** 2
+                    / hotspot_radius ** 2)
+        gy = np.exp(-0.5 * (self.ys[None, None, :] - self.y_[:, :, None]) ** 2
+                    / hotspot_radius ** 2)
+
+        symptomatic = (self.infected_ & ~self.incubating_)[:, :, None]
+        incubating = (self.infected_ & self.incubating_)[:, :, None]
+
+        # apparent temperature based on symptomatic people
+        self.apparent_temperature_ = amplitude * np.matmul(
+            (gy * symptomatic).transpose(0, 2, 1), gx)
+        temp0 = self.apparent_temperature_ + amplitude * np.matmul(
+            (gy * incubating).transpose(0, 2, 1), gx)
+
+        # actual temperature includes incubating people and linger
+        self.temperature_ = ((linger * self.temperature_ + temp0)
+                             / (1.0 + linger))
+
+        # compute gradient of apparent temperature
+        apparent = self.apparent_temperature_
+        self.gradx_[:, :, 1:-1] = (-0.5 * (apparent[:, :, 2:]
+                                           - apparent[:, :, :-2])
+                                   / self.grid_dx)
+        self.grady_[:, 1:-1, :] = (-0.5 * (apparent[:, 2:, :]
+                                           - apparent[:, :-2, :])
+                                   / self.grid_dy)
+
+    def counts(self):
+        """
+        Number of infected and immune people in each replica
+
+        Returns
+        -------
+        n_infected : numpy.array of int
+        n_immune : numpy.array of int
+        """
+        local = self.temperature_[self.grid_indices()]
+        return (self.infected_.sum(axis=1),
+                (self.immunity_ > local + 0.1).sum(axis=1))
+
+    def step(self):
+        """
+        Advance all replicas by one day
+        """
+        self.day_ += 1
+        self.update_people()
+        self.update_temperature()
+
+    def run(self, steps):
+        """
+        Run all replicas
+
+        Parameters
+        ----------
+        steps : int
+            number of steps to run
+
+        Returns
+        -------
+        days : numpy.array of int
+            (steps,) array of days
+        n_infected : numpy.array of int
+            (n_replicas, steps) array of number infected
+        n_immune : numpy.array of int
+            (n_replicas, steps) array of number immune
+        """
+        if self.rngs_ is None:
+            self.initialize_all()
+
+        days = np.zeros(steps, dtype=int)
+        n_infected = np.zeros((self.n_replicas, steps), dtype=int)
+        n_immune = np.zeros((self.n_replicas, steps), dtype=int)
+        for ii in range(steps):
+            self.step()
+            days[ii] = self.day_
+            n_infected[:, ii], n_immune[:, ii] = self.counts()
+        return days, n_infected, n_immune
+
+    def __repr__(self):
+        n_infected, n_immune = self.counts()
+        return pformat({
+            **self.configuration,
+            **{
+                "state": {
+                    "day": self.day_,
+                    "n_replicas": self.n_replicas,
+                    "n_infected": n_infected.tolist(),
+                    "n_immune": n_immune.tolist()
+                }
+            }
+        })
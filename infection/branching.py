@@ -0,0 +1,168 @@
+"""
+-------------------------------------------------------
+Scenario branching from a shared burn-in prefix
+-------------------------------------------------------
+Author:  Mark Fruman
+Email:   majorgowan@yahoo.com
+-------------------------------------------------------
+
+The prefix is simulated once; each variant then continues from the
+prefix state (including the state of the random generator, so that by
+default all variants share common random numbers).  A variant is either
+a configuration update (applied with Infection.configure) or a function
+taking the simulation and modifying it in place.
+
+Where available, variants run in forked worker processes which share the
+prefix state copy-on-write; otherwise workers receive a snapshot.
+"""
+import multiprocessing
+import numpy as np
+from infection.cache import simulate
+from infection.infection import Infection
+
+
+# state inherited by forked workers
+_FORK_STATE = {}
+
+
+def apply_variant(runner, variant, random_seed=None):
+    """
+    Apply a variant to a simulation
+
+    Parameters
+    ----------
+    runner : Infection object
+    variant : dict or callable
+        configuration update, or function modifying the simulation
+    random_seed : int
+        if not None, reseed the global random generator
+    """
+    if callable(variant):
+        variant(runner)
+    elif variant:
+        runner.configure(variant)
+    if random_seed is not None:
+        np.random.seed(random_seed)
+
+
+def _run_forked(index):
+    runner = _FORK_STATE["runner"]
+    apply_variant(runner, _FORK_STATE["variants"][index],
+                  _FORK_STATE["random_seeds"][index])
+    return simulate(runner, _FORK_STATE["steps"])
+
+
+def _run_snapshot(arguments):
+    snapshot, variant, steps, random_seed = arguments
+    runner = Infection.restore(snapshot)
+    apply_variant(runner, variant, random_seed)
+    return simulate(runner, steps)
+
+
+def run_branches(infection, prefix_steps, variants, steps, processes=None,
+                 random_seeds=None):
+    """
+    Run a shared prefix once, then each variant from its final state
+
+    Parameters
+    ----------
+    infection : Infection object
+        initialized simulation (advanced by the prefix in place)
+    prefix_steps : int
+        number of steps of the shared prefix
+    variants : list
+        configuration updates or functions (see apply_variant)
+    steps : int
+        number of steps to run each variant after the prefix
+    processes : int
+        number of worker processes (None for one per cpu, 0 to run the
+        variants one after another in this process)
+    random_seeds : list[int]
+        seed for each variant (None to continue the prefix random stream
+        in every variant)
+
+    Returns
+    -------
+    dict
+        "prefix": series of the prefix, "branches": list of series of
+        the variants (see cache.simulate)
+    """
+    if infection.temperature_ is None:
+        infection.initialize_all()
+    if random_seeds is None:
+        random_seeds = [None] * len(variants)
+
+    prefix = simulate(infection, prefix_steps)
+
+    if processes == 0 or len(variants) < 2:
+        snapshot = infection.snapshot()
+        branches = [_run_snapshot((snapshot, variant, steps, seed))
+                    for variant, seed in zip(variants, random_seeds)]
+        # the branches ran on copies; rewind the random generator to the
+        # end of the prefix
+        Infection.restore_random_state(snapshot)
+    elif "fork" in multiprocessing.get_all_start_methods():
+        _FORK_STATE.update({"runner": infection, "variants": variants,
+                            "steps": steps, "random_seeds": random_seeds})
+        try:
+            # one fresh fork per variant so every branch starts from the
+            # unmodified prefix state
+            context = multiprocessing.get_context("fork")
+            with context.Pool(processes, maxtasksperchild=1) as pool:
+                branches = pool.map(_run_forked, range(len(variants)),
+                                    chunksize=1)
+        finally:
+            _FORK_STATE.clear()
+    else:
+        snapshot = infection.snapshot()
+        with multiprocessing.Pool(processes) as pool:
+            branches = pool.map(_run_snapshot,
+                                [(snapshot, variant, steps, seed)
+                                 for variant, seed in zip(variants,
+                                                          random_seeds)])
+
+    return {"prefix": prefix, "branches": branches}
+
+
+def run_tree(infection, tree):
+    """
+    Run a tree of scenarios, simulating every shared segment only once
+
+    Parameters
+    ----------
+    infection : Infection object
+        initialized simulation (not modified: every node runs on a copy
+        restored from a snapshot of its parent, and the global random
+        generator is reset to its initial state afterwards)
+    tree : dict
+        node with keys "steps" (int), and optionally "name" (str),
+        "variant" (see apply_variant), "random_seed" (int) and
+        "children" (list of nodes); a node's variant is applied before
+        its steps are run
+
+    Returns
+    -------
+    dict
+        the tree with the series of each node's segment added under
+        "series" (variants are not copied)
+    """
+    if infection.temperature_ is None:
+        infection.initialize_all()
+
+    def visit(snapshot, node):
+        runner = Infection.restore(snapshot)
+        apply_variant(runner, node.get("variant"), node.get("random_seed"))
+        result = {key: value for key, value in node.items()
+                  if key not in ("variant", "children")}
+        result["series"] = simulate(runner, node["steps"])
+        children = node.get("children", [])
+        if children:
+            snapshot = runner.snapshot()
+            result["children"] = [visit(snapshot, child)
+                                  for child in children]
+        return result
+
+    initial = infection.snapshot()
+    result = visit(initial, tree)
+    Infection.restore_random_state(initial)
+    return result
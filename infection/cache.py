@@ -0,0 +1,292 @@
+"""
+-------------------------------------------------------
+Content-addressed cache of simulation results
+-------------------------------------------------------
+Author:  Mark Fruman
+Email:   majorgowan@yahoo.com
+-------------------------------------------------------
+
+Results are keyed by a hash of the (supdate-merged) configuration, the
+random seed and the package version, and stored per number of steps in
+an sqlite index with one blob file per entry holding the series and a
+checkpoint of the final state.  A request for fewer steps than cached is
+served from the prefix of the cached series; a request for more steps
+resumes from the longest cached checkpoint.
+"""
+import os
+import copy
+import json
+import time
+import pickle
+import hashlib
+import sqlite3
+import numpy as np
+from pprint import pformat
+import infection
+from infection.infection import Infection
+
+
+def default_cache_dir():
+    return os.environ.get("INFECTION_CACHE",
+                          os.path.join(os.path.expanduser("~"), ".cache",
+                                       "infection"))
+
+
+def canonical(obj):
+    """
+    Normalize a configuration for hashing (sorted keys, numbers as float)
+
+    Parameters
+    ----------
+    obj : dict or list or object
+
+    Returns
+    -------
+    dict or list or object
+    """
+    if isinstance(obj, dict):
+        return {str(k): canonical(v) for k, v in sorted(obj.items())}
+    if isinstance(obj, (list, tuple)):
+        return [canonical(v) for v in obj]
+    if isinstance(obj, (bool, np.bool_)) or obj is None:
+        return bool(obj) if obj is not None else None
+    if isinstance(obj, (int, float, np.integer, np.floating)):
+        return float(obj)
+    return obj
+
+
+def run_key(configuration, random_seed):
+    """
+    Hash identifying a run independently of its number of steps
+
+    Parameters
+    ----------
+    configuration : dict
+        configuration (merged with the defaults before hashing)
+    random_seed : int
+        seed for initializing random generator
+
+    Returns
+    -------
+    str
+    """
+    merged = Infection(**copy.deepcopy(configuration)).configuration
+    content = json.dumps({"configuration": canonical(merged),
+                          "random_seed": random_seed,
+                          "version": infection.__version__},
+                         sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+class RunCache:
+    """
+    Class representing a size-bounded local cache of simulation results
+    with least-recently-used eviction
+
+    Parameters
+    ----------
+    path : str
+        directory of the cache (see default_cache_dir if None)
+    max_bytes : int
+        maximum total size of the stored blobs
+    """
+    def __init__(self, path=None, max_bytes=2 ** 30):
+        self.path = path or default_cache_dir()
+        self.max_bytes = max_bytes
+        os.makedirs(self.path, exist_ok=True)
+        self.db_ = sqlite3.connect(os.path.join(self.path, "index.sqlite"))
+        self.db_.execute("CREATE TABLE IF NOT EXISTS entries ("
+                         "key TEXT, steps INTEGER, size INTEGER, "
+                         "last_access REAL, "
+                         "PRIMARY KEY (key, steps))")
+        self.db_.commit()
+
+    def blob_path(self, key, steps):
+        return os.path.join(self.path, f"{key}_{steps}.pkl")
+
+    def lookup(self, key, steps):
+        """
+        Find the best cached entry for a run of the given length
+
+        Returns
+        -------
+        cached_steps : int or None
+            steps of the shortest entry with at least steps steps, or else
+            of the longest entry (from which to resume)
+        """
+        row = self.db_.execute("SELECT MIN(steps) FROM entries "
+                               "WHERE key = ? AND steps >= ?",
+                               (key, steps)).fetchone()
+        if row[0] is not None:
+            return row[0]
+        row = self.db_.execute("SELECT MAX(steps) FROM entries "
+                               "WHERE key = ?", (key,)).fetchone()
+        return row[0]
+
+    def get(self, key, steps):
+        """
+        Load a cached entry
+
+        Returns
+        -------
+        dict or None
+            with keys "series" and "checkpoint"
+        """
+        try:
+            with open(self.blob_path(key, steps), "rb") as fh:
+                entry = pickle.load(fh)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            self.db_.execute("DELETE FROM entries WHERE key = ? AND steps = ?",
+                             (key, steps))
+            self.db_.commit()
+            return None
+        self.db_.execute("UPDATE entries SET last_access = ? "
+                         "WHERE key = ? AND steps = ?",
+                         (time.time(), key, steps))
+        self.db_.commit()
+        return entry
+
+    def put(self, key, steps, entry):
+        """
+        Store an entry and evict least recently used entries beyond
+        max_bytes
+        """
+        blob = pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL)
+        with open(self.blob_path(key, steps), "wb") as fh:
+            fh.write(blob)
+        self.db_.execute("INSERT OR REPLACE INTO entries "
+                         "VALUES (?, ?, ?, ?)",
+                         (key, steps, len(blob), time.time()))
+        self.db_.commit()
+        self.evict()
+
+    def evict(self):
+        total = self.db_.execute("SELECT COALESCE(SUM(size), 0) "
+                                 "FROM entries").fetchone()[0]
+        rows = self.db_.execute("SELECT key, steps, size FROM entries "
+                                "ORDER BY last_access").fetchall()
+        for key, steps, size in rows:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(self.blob_path(key, steps))
+            except OSError:
+                pass
+            self.db_.execute("DELETE FROM entries WHERE key = ? AND steps = ?",
+                             (key, steps))
+            total -= size
+        self.db_.commit()
+
+    def clear(self):
+        for key, steps in self.db_.execute("SELECT key, steps "
+                                           "FROM entries").fetchall():
+            try:
+                os.remove(self.blob_path(key, steps))
+            except OSError:
+                pass
+        self.db_.execute("DELETE FROM entries")
+        self.db_.commit()
+
+    def close(self):
+        self.db_.close()
+
+    def __repr__(self):
+        n_entries, size = self.db_.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        return pformat({"path": self.path, "n_entries": n_entries,
+                        "size": size, "max_bytes": self.max_bytes})
+
+
+def simulate(runner, steps, series=None):
+    """
+    Run (or continue) a simulation, collecting its series
+
+    Parameters
+    ----------
+    runner : Infection object
+        initialized simulation
+    steps : int
+        number of steps to run
+    series : dict
+        series to extend (new series if None)
+
+    Returns
+    -------
+    dict
+        lists "days", "n_infected", "n_immune", "mean_temperature" and
+        "metrics" (dict of metric series)
+    """
+    if series is None:
+        series = {"n_people": runner["n_people"], "days": [],
+                  "n_infected": [], "n_immune": [], "mean_temperature": [],
+                  "metrics": {}}
+    for day, n_infected, n_immune, measurements in runner.run(
+            steps=steps, with_metrics=True):
+        series["days"].append(day)
+        series["n_infected"].append(n_infected)
+        series["n_immune"].append(n_immune)
+        series["mean_temperature"].append(
+            float(runner.temperature_.mean_temperature()))
+        for name, value in measurements.items():
+            series["metrics"].setdefault(name, []).append(value)
+    return series
+
+
+def truncate(series, steps):
+    """
+    Restrict series to their first steps entries
+
+    Returns
+    -------
+    dict
+    """
+    return {key: (truncate(value, steps) if isinstance(value, dict)
+                  else value[:steps] if isinstance(value, list) else value)
+            for key, value in series.items()}
+
+
+def cached_run(configuration, steps, random_seed, cache=None):
+    """
+    Return the series of a simulation, from the cache if possible
+
+    Parameters
+    ----------
+    configuration : dict
+        configuration of the simulation
+    steps : int
+        number of steps to run
+    random_seed : int
+        seed for initializing random generator
+    cache : RunCache object
+        cache to use (default cache if None)
+
+    Returns
+    -------
+    dict
+        series (see simulate)
+    """
+    if cache is None:
+        cache = RunCache()
+
+    key = run_key(configuration, random_seed)
+    cached_steps = cache.lookup(key, steps)
+    entry = None
+    if cached_steps is not None:
+        entry = cache.get(key, cached_steps)
+
+    if entry is not None and cached_steps >= steps:
+        return truncate(entry["series"], steps)
+
+    if entry is not None:
+        # resume from the checkpoint of the longest cached run
+        runner = Infection.restore(entry["checkpoint"])
+        series = simulate(runner, steps - cached_steps,
+                          series=entry["series"])
+    else:
+        runner = Infection(**copy.deepcopy(configuration))
+        runner.initialize_all(random_seed=random_seed)
+        series = simulate(runner, steps)
+
+    cache.put(key, steps, {"series": series,
+                           "checkpoint": runner.snapshot()})
+    return series
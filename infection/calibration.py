@@ -0,0 +1,408 @@
+"""
+-------------------------------------------------------
+Approximate Bayesian calibration against observed curves
+-------------------------------------------------------
+Author:  Mark Fruman
+Email:   majorgowan@yahoo.com
+-------------------------------------------------------
+
+Parameters of the configuration (given by dotted paths such as
+"infection.infectiousness") are fitted to an observed prevalence curve
+(fraction of people infected on each day) by sequential Monte Carlo
+approximate Bayesian computation (ABC-SMC): each generation perturbs the
+particles of the previous one and accepts those whose simulated curve lies
+within a shrinking distance (root mean square difference of the infected
+fraction) of the observations.  Since the squared differences accumulate
+day by day, a run is stopped as soon as its partial curve exceeds the
+tolerance.  Candidates are simulated on a pool of worker processes.
+"""
+import copy
+import json
+import multiprocessing
+import numpy as np
+from pprint import pformat
+from infection.infection import Infection
+
+
+# uniform prior ranges of the parameters fitted by default
+DEFAULT_PRIORS = {
+    "infection.infectiousness": [0.01, 1.0],
+    "infection.hotspot_radius": [0.01, 0.2],
+    "infection.healing_rate": [0.01, 0.5]
+}
+
+
+def set_parameter(configuration, path, value):
+    """
+    Set a (nested) configuration value
+
+    Parameters
+    ----------
+    configuration : dict
+        configuration to modify in place
+    path : str
+        keys separated by dots, e.g. "infection.infectiousness"
+    value : object
+    """
+    keys = path.split(".")
+    for key in keys[:-1]:
+        configuration = configuration.setdefault(key, {})
+    configuration[keys[-1]] = value
+
+
+def parameterized(configuration, parameters):
+    """
+    Copy of a configuration with parameters set
+
+    Parameters
+    ----------
+    configuration : dict
+    parameters : dict
+        values keyed by path (see set_parameter)
+
+    Returns
+    -------
+    dict
+    """
+    configuration = copy.deepcopy(configuration)
+    for path, value in parameters.items():
+        set_parameter(configuration, path, float(value))
+    return configuration
+
+
+def curve_distance(configuration, observed, random_seed, tolerance=np.inf):
+    """
+    Root mean square difference between the simulated and observed
+    infected fractions, stopping as soon as it must exceed the tolerance
+
+    Parameters
+    ----------
+    configuration : dict
+        configuration of the simulation
+    observed : numpy.array
+        observed fraction of people infected on each day
+    random_seed : int
+        seed for initializing random generator
+    tolerance : float
+        distance beyond which the run is abandoned
+
+    Returns
+    -------
+    distance : float
+        distance (inf if abandoned)
+    steps : int
+        number of steps simulated
+    """
+    runner = Infection(**copy.deepcopy(configuration))
+    runner.initialize_all(random_seed=random_seed)
+    n_people = runner["n_people"]
+    budget = tolerance ** 2 * len(observed)
+    total = 0.0
+    for step, target in enumerate(observed):
+        _, n_infected, _ = runner.step()
+        total += (n_infected / n_people - target) ** 2
+        if total > budget:
+            return np.inf, step + 1
+    return float(np.sqrt(total / len(observed))), len(observed)
+
+
+def _evaluate(arguments):
+    configuration, observed, random_seed, tolerance = arguments
+    return curve_distance(configuration, observed, random_seed, tolerance)
+
+
+class ABCCalibration:
+    """
+    Class representing a sequential Monte Carlo approximate Bayesian
+    calibration of configuration parameters
+
+    Parameters
+    ----------
+    observed : list or numpy.array
+        observed fraction of people infected on each day (from day 1)
+    configuration : dict
+        configuration whose other values are kept fixed
+    priors : dict
+        uniform prior [low, high] of each fitted parameter, keyed by path
+        (see set_parameter)
+    n_particles : int
+        number of accepted particles per generation
+    n_generations : int
+        number of generations
+    quantile : float
+        quantile of the distances of a generation used as the tolerance
+        of the next
+    processes : int
+        number of worker processes (None for one per cpu, 0 to simulate
+        in this process)
+    max_simulations : int
+        maximum number of simulations per generation
+    random_seed : int
+        seed of the proposals and of the simulation seeds
+    """
+    def __init__(self, observed, configuration=None, priors=None,
+                 n_particles=50, n_generations=4, quantile=0.5,
+                 processes=None, max_simulations=5000, random_seed=0):
+        self.observed = np.asarray(observed, dtype=float)
+        self.configuration = copy.deepcopy(configuration or {})
+        self.priors = priors or DEFAULT_PRIORS
+        self.n_particles = n_particles
+        self.n_generations = n_generations
+        self.quantile = quantile
+        self.processes = processes
+        self.max_simulations = max_simulations
+        self.random_seed = random_seed
+
+        self.names_ = list(self.priors)
+        self.low_ = np.array([self.priors[name][0] for name in self.names_])
+        self.high_ = np.array([self.priors[name][1] for name in self.names_])
+        self.particles_ = None
+        self.weights_ = None
+        self.distances_ = None
+        self.tolerances_ = []
+        self.n_simulations_ = 0
+        self.n_steps_ = 0
+        self.n_rejected_early_ = 0
+
+    def in_support(self, theta):
+        return np.all((theta >= self.low_) & (theta <= self.high_), axis=-1)
+
+    def propose(self, rng, size, scale):
+        """
+        Draw candidate parameters: from the prior in the first
+        generation, else by perturbing particles of the previous
+        generation (gaussian kernel with covariance scale)
+
+        Returns
+        -------
+        numpy.array
+            (size, n_parameters)
+        """
+        if self.particles_ is None:
+            return rng.uniform(self.low_, self.high_,
+                               size=(size, len(self.names_)))
+        candidates = np.zeros((0, len(self.names_)))
+        while len(candidates) < size:
+            parents = rng.choice(len(self.particles_), size=size,
+                                 p=self.weights_)
+            theta = (self.particles_[parents]
+                     + rng.multivariate_normal(np.zeros(len(self.names_)),
+                                               scale, size=size))
+            candidates = np.concatenate([candidates,
+                                         theta[self.in_support(theta)]])
+        return candidates[:size]
+
+    def kernel_weights(self, theta, scale):
+        """
+        Importance weights of accepted particles (uniform prior divided by
+        the density of the perturbation kernel mixture)
+        """
+        if self.particles_ is None:
+            return np.ones(len(theta)) / len(theta)
+        precision = np.linalg.inv(scale)
+        offsets = theta[:, None, :] - self.particles_[None, :, :]
+        exponent = -0.5 * np.einsum("ijk,kl,ijl->ij", offsets, precision,
+                                    offsets)
+        density = np.exp(exponent) @ self.weights_
+        weights = 1.0 / density
+        return weights / weights.sum()
+
+    def generation(self, pool, rng, tolerance):
+        """
+        Accept n_particles particles within the tolerance
+
+        Returns
+        -------
+        theta : numpy.array
+        distances : numpy.array
+        """
+        scale = None
+        if self.particles_ is not None:
+            scale = 2 * np.atleast_2d(np.cov(self.particles_.T,
+                                             aweights=self.weights_))
+            scale += 1e-12 * np.eye(len(self.names_))
+
+        accepted = []
+        distances = []
+        n_simulations = 0
+        while (len(accepted) < self.n_particles
+               and n_simulations < self.max_simulations):
+            theta = self.propose(rng, self.n_particles, scale)
+            seeds = rng.integers(0, 2 ** 31, size=len(theta))
+            tasks = [(parameterized(self.configuration,
+                                    dict(zip(self.names_, values))),
+                      self.observed, int(seed), tolerance)
+                     for values, seed in zip(theta, seeds)]
+            results = (pool.map(_evaluate, tasks) if pool is not None
+                       else [_evaluate(task) for task in tasks])
+            for values, (distance, steps) in zip(theta, results):
+                n_simulations += 1
+                self.n_steps_ += steps
+                if steps < len(self.observed):
+                    self.n_rejected_early_ += 1
+                if distance <= tolerance:
+                    accepted.append(values)
+                    distances.append(distance)
+        self.n_simulations_ += n_simulations
+
+        if not accepted:
+            raise RuntimeError(f"no particle within tolerance {tolerance} "
+                               + f"after {n_simulations} simulations")
+        theta = np.array(accepted[:self.n_particles])
+        distances = np.array(distances[:self.n_particles])
+        weights = self.kernel_weights(theta, scale)
+        self.particles_, self.weights_, self.distances_ = (theta, weights,
+                                                           distances)
+        return theta, distances
+
+    def fit(self):
+        """
+        Run the generations
+
+        Returns
+        -------
+        ABCCalibration
+        """
+        rng = np.random.default_rng(self.random_seed)
+        tolerance = np.inf
+        pool = None
+        if self.processes != 0:
+            pool = multiprocessing.Pool(self.processes)
+        try:
+            for _ in range(self.n_generations):
+                self.tolerances_.append(tolerance)
+                _, distances = self.generation(pool, rng, tolerance)
+                tolerance = float(np.quantile(distances, self.quantile))
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+        return self
+
+    def posterior(self):
+        """
+        Weighted samples of the final generation
+
+        Returns
+        -------
+        list[dict]
+            parameter values keyed by path, with "weight" and "distance"
+        """
+        return [{**dict(zip(self.names_, map(float, values))),
+                 "weight": float(weight), "distance": float(distance)}
+                for values, weight, distance in zip(self.particles_,
+                                                    self.weights_,
+                                                    self.distances_)]
+
+    def best_configuration(self):
+        """
+        Configuration (as read by the command line interface with -i) with
+        the parameters of the particle closest to the observations
+
+        Returns
+        -------
+        dict
+        """
+        best = np.argmin(self.distances_)
+        return parameterized(self.configuration,
+                             dict(zip(self.names_, self.particles_[best])))
+
+    def report(self):
+        """
+        Summary of the calibration (JSON-serializable: the unbounded
+        tolerance of the first generation is None)
+
+        Returns
+        -------
+        dict
+        """
+        mean = self.weights_ @ self.particles_
+        std = np.sqrt(self.weights_ @ (self.particles_ - mean) ** 2)
+        return {
+            "tolerances": [None if np.isinf(tolerance) else tolerance
+                           for tolerance in self.tolerances_],
+            "posterior_mean": dict(zip(self.names_, mean.tolist())),
+            "posterior_std": dict(zip(self.names_, std.tolist())),
+            "best_distance": float(self.distances_.min()),
+            "n_simulations": self.n_simulations_,
+            "n_rejected_early": self.n_rejected_early_,
+            "fraction_of_steps_simulated": (
+                self.n_steps_ / (self.n_simulations_ * len(self.observed)))
+        }
+
+    def __repr__(self):
+        return pformat({"parameters": self.names_,
+                        "n_particles": self.n_particles,
+                        "n_generations": self.n_generations,
+                        "tolerances": self.tolerances_})
+
+
+def read_observed(path):
+    """
+    Read an observed prevalence curve: either the output of the command
+    line interface (percent infected under "n_infected") or a list of
+    fractions
+
+    Returns
+    -------
+    numpy.array
+    """
+    with open(path, "r") as jsf:
+        observed = json.load(jsf)
+    if isinstance(observed, dict):
+        return np.array(observed["n_infected"], dtype=float) / 100
+    return np.array(observed, dtype=float)
+
+
+def main():
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(description="fit configuration parameters to "
+                                        + "an observed prevalence curve")
+    parser.add_argument("observed", type=str,
+                        help=("json file with the observed curve (output "
+                              + "of infection -o, or list of fractions)"))
+    parser.add_argument("-i", type=str, default=None,
+                        help="json file with the fixed configuration")
+    parser.add_argument("-o", type=str, default="calibrated.json",
+                        help="file to which to write best-fit configuration")
+    parser.add_argument("--posterior", type=str,
+                        default="posterior.json",
+                        help="file to which to write posterior samples")
+    parser.add_argument("--parameters", type=str, nargs="+",
+                        default=list(DEFAULT_PRIORS),
+                        help=("paths of parameters to fit, optionally with "
+                              + "prior range, e.g. "
+                              + "infection.infectiousness:0.01:1"))
+    parser.add_argument("--particles", type=int, default=50)
+    parser.add_argument("--generations", type=int, default=4)
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--random_seed", type=int, default=0)
+    args = parser.parse_args()
+
+    configuration = {}
+    if args.i is not None:
+        with open(args.i, "r") as jsf:
+            configuration = json.load(jsf)
+    priors = {}
+    for spec in args.parameters:
+        path, *bounds = spec.split(":")
+        priors[path] = ([float(b) for b in bounds] if bounds
+                        else DEFAULT_PRIORS[path])
+
+    calibration = ABCCalibration(read_observed(args.observed),
+                                 configuration=configuration, priors=priors,
+                                 n_particles=args.particles,
+                                 n_generations=args.generations,
+                                 processes=args.processes,
+                                 random_seed=args.random_seed).fit()
+    with open(args.o, "w") as jsf:
+        json.dump(calibration.best_configuration(), jsf, indent=2)
+    with open(args.posterior, "w") as jsf:
+        json.dump({"samples": calibration.posterior(),
+                   "report": calibration.report()}, jsf, indent=2)
+    print(pformat(calibration.report()))
+
+
+if __name__ == "__main__":
+    main()
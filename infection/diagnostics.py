@@ -0,0 +1,318 @@
+"""
+-------------------------------------------------------
+Diagnostics comparing simulation variants
+-------------------------------------------------------
+Author:  Mark Fruman
+Email:   majorgowan@yahoo.com
+-------------------------------------------------------
+"""
+import copy
+import time
+import numpy as np
+from infection.infection import Infection
+
+
+def epidemic_curves(configuration, steps, random_seed):
+    """
+    Run a simulation and collect its epidemic curves
+
+    Parameters
+    ----------
+    configuration : dict
+        configuration of the simulation
+    steps : int
+        number of steps to run
+    random_seed : int
+        seed for initializing random generator
+
+    Returns
+    -------
+    n_infected : numpy.array of int
+    n_immune : numpy.array of int
+    """
+    runner = Infection(**copy.deepcopy(configuration))
+    runner.initialize_all(random_seed=random_seed)
+    results = np.array([result[1:] for result in runner.run(steps=steps)],
+                       dtype=int).reshape(-1, 2)
+    return results[:, 0], results[:, 1]
+
+
+def compare_curves(reference, curves, n_people):
+    """
+    Differences between runs with the same seeds of two variants
+
+    Parameters
+    ----------
+    reference : list
+        (n_infected, n_immune) curves of the reference variant
+    curves : list
+        (n_infected, n_immune) curves of the other variant
+    n_people : int
+        number of people
+
+    Returns
+    -------
+    dict
+    """
+    first_divergence = []
+    max_difference = []
+    for (inf0, imm0), (inf1, imm1) in zip(reference, curves):
+        differs = np.flatnonzero((inf0 != inf1) | (imm0 != imm1))
+        first_divergence.append(int(differs[0]) + 1 if len(differs)
+                                else None)
+        max_difference.append(float(np.abs(inf0 - inf1).max(initial=0)
+                                    / n_people))
+
+    def ensemble(runs, which):
+        return np.mean([curve[which] for curve in runs], axis=0) / n_people
+
+    mean0 = ensemble(reference, 0)
+    mean1 = ensemble(curves, 0)
+    return {
+        "identical_runs": sum(day is None for day in first_divergence),
+        "first_divergence_day": first_divergence,
+        "max_infected_fraction_difference": max_difference,
+        "mean_curve_rms_difference": float(np.sqrt(np.mean(
+            (mean0 - mean1) ** 2))),
+        "peak_infected_fraction": (float(mean0.max()), float(mean1.max())),
+        "final_immune_fraction": (float(ensemble(reference, 1)[-1]),
+                                  float(ensemble(curves, 1)[-1]))
+    }
+
+
+def precision_report(configuration=None, steps=365, random_seeds=(0, 1, 2, 3),
+                     dtype="float32"):
+    """
+    Compare epidemic curves computed in reduced precision against float64
+    runs with the same seeds.  Individual runs may diverge after a
+    borderline infection draw goes the other way, so the ensemble
+    statistics are the relevant measure of accuracy.
+
+    Parameters
+    ----------
+    configuration : dict
+        configuration of the simulation (default configuration if None)
+    steps : int
+        number of steps to run
+    random_seeds : list[int]
+        seeds of the runs to compare
+    dtype : str
+        reduced floating point type to test
+
+    Returns
+    -------
+    dict
+        report of differences in infected and immune fractions
+    """
+    configuration = copy.deepcopy(configuration or {})
+    n_people = Infection(**copy.deepcopy(configuration))["n_people"]
+
+    curves = {}
+    for precision in ("float64", dtype):
+        curves[precision] = [epidemic_curves({**configuration,
+                                              "dtype": precision},
+                                             steps, seed)
+                             for seed in random_seeds]
+
+    comparison = compare_curves(curves["float64"], curves[dtype], n_people)
+    peak = comparison["peak_infected_fraction"]
+    final = comparison["final_immune_fraction"]
+
+    return {
+        "dtype": dtype,
+        "steps": steps,
+        "n_runs": len(random_seeds),
+        **comparison,
+        "peak_infected_fraction": {"float64": peak[0], dtype: peak[1]},
+        "final_immune_fraction": {"float64": final[0], dtype: final[1]}
+    }
+
+
+def rate_report(intervals, configuration=None, steps=365,
+                random_seeds=(0, 1, 2, 3)):
+    """
+    Compare epidemic curves of multi-rate runs (see Infection.due) against
+    single-rate runs (every process updated on every step) with the same
+    seeds, and the numbers of field updates and run times
+
+    Parameters
+    ----------
+    intervals : dict
+        configuration of the multi-rate runs, e.g.
+        {"field_interval": "adaptive", "field_displacement": 1.0}
+    configuration : dict
+        configuration of the simulation (default configuration if None)
+    steps : int
+        number of steps to run
+    random_seeds : list[int]
+        seeds of the runs to compare
+
+    Returns
+    -------
+    dict
+        report of differences in infected and immune fractions (the
+        divergence of the multi-rate runs) and of costs
+    """
+    configuration = copy.deepcopy(configuration or {})
+    n_people = Infection(**copy.deepcopy(configuration))["n_people"]
+    variants = {
+        "single_rate": {**configuration, "movement_interval": 1,
+                        "health_interval": 1, "field_interval": 1},
+        "multi_rate": {**configuration, **intervals}
+    }
+
+    curves = {}
+    field_updates = {}
+    run_time = {}
+    for variant, variant_configuration in variants.items():
+        curves[variant] = []
+        field_updates[variant] = []
+        start = time.perf_counter()
+        for seed in random_seeds:
+            runner = Infection(**copy.deepcopy(variant_configuration))
+            runner.initialize_all(random_seed=seed)
+            results = np.array([result[1:]
+                                for result in runner.run(steps=steps)],
+                               dtype=int).reshape(-1, 2)
+            curves[variant].append((results[:, 0], results[:, 1]))
+            field_updates[variant].append(runner.n_field_updates_)
+        run_time[variant] = time.perf_counter() - start
+
+    comparison = compare_curves(curves["single_rate"], curves["multi_rate"],
+                                n_people)
+    peak = comparison["peak_infected_fraction"]
+    final = comparison["final_immune_fraction"]
+
+    return {
+        "intervals": intervals,
+        "steps": steps,
+        "n_runs": len(random_seeds),
+        **comparison,
+        "peak_infected_fraction": {"single_rate": peak[0],
+                                   "multi_rate": peak[1]},
+        "final_immune_fraction": {"single_rate": final[0],
+                                  "multi_rate": final[1]},
+        "field_updates": {variant: float(np.mean(updates))
+                          for variant, updates in field_updates.items()},
+        "run_time": run_time
+    }
+
+
+def outcomes(n_infected, n_immune, n_people):
+    """
+    Summary outcomes of epidemic curves (as fractions of n_people)
+
+    Returns
+    -------
+    dict
+    """
+    infected = np.asarray(n_infected) / n_people
+    return {
+        "peak_infected": float(infected.max(initial=0)),
+        "peak_day": float(np.argmax(infected) + 1),
+        "mean_infected": float(infected.mean()),
+        "final_immune": float(np.asarray(n_immune)[-1] / n_people)
+    }
+
+
+def replica_outcomes(configuration, steps, random_seed, antithetic=False):
+    """
+    Outcomes of a run with named random streams
+
+    Parameters
+    ----------
+    configuration : dict
+        configuration of the simulation
+    steps : int
+        number of steps to run
+    random_seed : int
+        seed of the streams
+    antithetic : bool
+        if set, run the antithetic replica
+
+    Returns
+    -------
+    dict
+    """
+    configuration = {**copy.deepcopy(configuration), "random_streams": True,
+                     "antithetic": antithetic}
+    runner = Infection(**configuration)
+    runner.initialize_all(random_seed=random_seed)
+    results = np.array([result[1:] for result in runner.run(steps=steps)],
+                       dtype=int).reshape(-1, 2)
+    return outcomes(results[:, 0], results[:, 1], runner["n_people"])
+
+
+def variance_reduction_report(configuration_a, configuration_b, steps=365,
+                              random_seeds=(0, 1, 2, 3, 4, 5, 6, 7),
+                              antithetic=True):
+    """
+    Estimate the variance of the difference of outcomes between two
+    configurations (e.g. with and without an intervention) from replicas
+    with independent draws (different seeds in each arm), with common
+    random numbers (the same seeds), and with common random numbers and
+    antithetic pairs (each replica averaged with its antithetic partner),
+    per run so that the estimators are compared at equal cost
+
+    Parameters
+    ----------
+    configuration_a, configuration_b : dict
+        configurations to compare
+    steps : int
+        number of steps to run
+    random_seeds : list[int]
+        seeds of the replicas
+    antithetic : bool
+        if set, also run the antithetic partners
+
+    Returns
+    -------
+    dict
+        mean difference and variance of each estimator per outcome, and
+        the variance reduction (ratio of the independent variance to that
+        of each estimator)
+    """
+    random_seeds = list(random_seeds)
+    # independent seeds for the second arm
+    offset = max(random_seeds) + 1
+
+    def run(configuration, seeds, mirrored=False):
+        return [replica_outcomes(configuration, steps, seed, mirrored)
+                for seed in seeds]
+
+    a = run(configuration_a, random_seeds)
+    b = run(configuration_b, random_seeds)
+    independent_b = run(configuration_b, [seed + offset
+                                          for seed in random_seeds])
+    if antithetic:
+        a_mirrored = run(configuration_a, random_seeds, mirrored=True)
+        b_mirrored = run(configuration_b, random_seeds, mirrored=True)
+
+    report = {"steps": steps, "n_replicas": len(random_seeds),
+              "outcomes": {}}
+    for name in a[0]:
+        def differences(first, second):
+            return np.array([x[name] - y[name]
+                             for x, y in zip(first, second)])
+
+        estimators = {"independent": differences(independent_b, a),
+                      "common": differences(b, a)}
+        variances = {key: float(np.var(values, ddof=1))
+                     for key, values in estimators.items()}
+        if antithetic:
+            pairs = 0.5 * (differences(b, a)
+                           + differences(b_mirrored, a_mirrored))
+            estimators["antithetic"] = pairs
+            # a pair costs two runs per arm
+            variances["antithetic"] = 2 * float(np.var(pairs, ddof=1))
+        report["outcomes"][name] = {
+            "mean_difference": {key: float(values.mean())
+                                for key, values in estimators.items()},
+            "variance": variances,
+            "variance_reduction": {
+                key: (variances["independent"] / variance if variance > 0
+                      else np.inf)
+                for key, variance in variances.items()
+                if key != "independent"}
+        }
+    return report
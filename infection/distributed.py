@@ -0,0 +1,520 @@
+"""
+-------------------------------------------------------
+Distributed parameter sweeps over TCP
+-------------------------------------------------------
+Author:  Mark Fruman
+Email:   majorgowan@yahoo.com
+-------------------------------------------------------
+
+A coordinator hands out sweep points (a configuration and a random seed)
+to workers, which run them and send back the series.  Messages are
+newline-delimited json over TCP.  A worker sends {"type": "ready"} and
+receives either
+
+    {"type": "task", "id": ..., "configuration": ..., "random_seed": ...,
+     "steps": ...}
+
+or {"type": "done"} once the sweep is complete.  While running a task the
+worker sends {"type": "progress", "id": ..., "day": ...} every few steps
+and finally {"type": "result", "id": ..., "series": ...} (or
+{"type": "error", "id": ..., "message": ...}), followed by a new
+{"type": "ready"}.
+
+The task of a worker that disconnects or fails is re-queued (up to
+max_attempts times); the task of a worker that is silent for longer than
+task_timeout is also handed to another worker, and whichever result
+arrives first is kept.  Identical sweep points (same merged configuration
+and seed) are run once.
+"""
+import copy
+import json
+import socket
+import asyncio
+import multiprocessing
+import numpy as np
+from pprint import pformat
+from infection.cache import run_key, simulate
+from infection.infection import Infection
+
+
+def encode(message):
+    """
+    Serialize a message as a line of json (numpy values as python values)
+
+    Parameters
+    ----------
+    message : dict
+
+    Returns
+    -------
+    bytes
+    """
+    def default(obj):
+        if isinstance(obj, np.ndarray):
+            return obj.tolist()
+        if isinstance(obj, np.generic):
+            return obj.item()
+        raise TypeError(f"cannot serialize {type(obj).__name__}")
+
+    return (json.dumps(message, default=default) + "\n").encode()
+
+
+def sweep_points(configurations, random_seeds):
+    """
+    All combinations of configurations and random seeds
+
+    Parameters
+    ----------
+    configurations : list[dict]
+        configurations of the sweep
+    random_seeds : list[int]
+        seeds with which to run each configuration
+
+    Returns
+    -------
+    list[dict]
+        points with keys "configuration" and "random_seed"
+    """
+    return [{"configuration": configuration, "random_seed": random_seed}
+            for configuration in configurations
+            for random_seed in random_seeds]
+
+
+class SweepCoordinator:
+    """
+    Class representing a server handing out sweep points to workers and
+    collecting their results
+
+    Parameters
+    ----------
+    points : list[dict]
+        sweep points with keys "configuration" and "random_seed"
+    steps : int
+        number of steps to run each point
+    host : str
+        address to bind
+    port : int
+        port to bind (0 for any free port)
+    task_timeout : float
+        seconds without a message from a worker after which its task is
+        also handed to another worker (None to wait indefinitely)
+    max_attempts : int
+        number of failed attempts after which a point is given up
+    """
+    def __init__(self, points, steps, host="127.0.0.1", port=0,
+                 task_timeout=None, max_attempts=3):
+        self.points = points
+        self.steps = steps
+        self.host = host
+        self.port = port
+        self.task_timeout = task_timeout
+        self.max_attempts = max_attempts
+
+        # identical points share a task
+        self.keys_ = [run_key(point["configuration"], point["random_seed"])
+                      for point in points]
+        self.tasks_ = {}
+        for key, point in zip(self.keys_, points):
+            self.tasks_.setdefault(key, {"point": point, "attempts": 0,
+                                         "failures": 0})
+        self.pending_ = list(self.tasks_)
+        self.results_ = {}
+        self.n_duplicates_ = 0
+        self.n_requeued_ = 0
+        self.n_workers_ = 0
+        self.handlers_ = set()
+        self.writers_ = set()
+        self.server_ = None
+        self.changed_ = None
+        self.finished_ = None
+
+    async def start(self):
+        """
+        Bind the server and start accepting workers
+
+        Returns
+        -------
+        SweepCoordinator
+        """
+        self.changed_ = asyncio.Event()
+        self.finished_ = asyncio.Event()
+        if not self.pending_:
+            self.finished_.set()
+        self.server_ = await asyncio.start_server(self.handle_worker,
+                                                  self.host, self.port)
+        self.port = self.server_.sockets[0].getsockname()[1]
+        return self
+
+    @property
+    def complete(self):
+        return len(self.results_) == len(self.tasks_)
+
+    def notify(self):
+        self.changed_.set()
+        self.changed_ = asyncio.Event()
+        if self.complete:
+            self.finished_.set()
+
+    async def next_task(self):
+        """
+        Wait for a task to hand out
+
+        Returns
+        -------
+        str or None
+            key of the task, None once every task has a result
+        """
+        while True:
+            if self.complete:
+                return None
+            if self.pending_:
+                key = self.pending_.pop(0)
+                self.tasks_[key]["attempts"] += 1
+                return key
+            await self.changed_.wait()
+
+    def requeue(self, key, failed=True):
+        """
+        Queue a task again (unless it is complete, already queued or has
+        failed too often)
+
+        Parameters
+        ----------
+        key : str
+            key of the task
+        failed : bool
+            if set, the attempt counts as a failure
+        """
+        if key in self.results_ or key in self.pending_:
+            return
+        task = self.tasks_[key]
+        if failed:
+            task["failures"] += 1
+        if task["failures"] >= self.max_attempts:
+            self.results_[key] = {"error": task.get("error", "worker lost")}
+        else:
+            self.pending_.append(key)
+            self.n_requeued_ += 1
+        self.notify()
+
+    def finish(self, key, result):
+        """
+        Record the result of a task (later duplicates are discarded)
+
+        Parameters
+        ----------
+        key : str
+            key of the task
+        result : dict
+            with key "series"
+        """
+        if key in self.results_:
+            self.n_duplicates_ += 1
+            return
+        self.results_[key] = result
+        if key in self.pending_:
+            self.pending_.remove(key)
+        self.notify()
+
+    async def handle_worker(self, reader, writer):
+        self.n_workers_ += 1
+        self.handlers_.add(asyncio.current_task())
+        self.writers_.add(writer)
+        key = None
+        timeout = None
+        try:
+            while True:
+                try:
+                    line = await asyncio.wait_for(reader.readline(),
+                                                  timeout)
+                except asyncio.TimeoutError:
+                    # hand the task to another worker as well, but keep
+                    # listening in case this one finishes first
+                    self.requeue(key, failed=False)
+                    timeout = None
+                    continue
+                if not line:
+                    break
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    continue
+                kind = message.get("type")
+
+                if kind == "result" and message.get("id") == key:
+                    self.finish(key, {"series": message["series"]})
+                    key = timeout = None
+                elif kind == "error" and message.get("id") == key:
+                    self.tasks_[key]["error"] = message.get("message")
+                    self.requeue(key)
+                    key = timeout = None
+                elif kind == "ready" and key is None:
+                    key = await self.next_task()
+                    if key is None:
+                        writer.write(encode({"type": "done"}))
+                        await writer.drain()
+                        break
+                    timeout = self.task_timeout
+                    point = self.tasks_[key]["point"]
+                    writer.write(encode({
+                        "type": "task",
+                        "id": key,
+                        "configuration": point["configuration"],
+                        "random_seed": point["random_seed"],
+                        "steps": self.steps
+                    }))
+                    await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            if key is not None:
+                self.requeue(key)
+            self.handlers_.discard(asyncio.current_task())
+            self.writers_.discard(writer)
+            writer.close()
+
+    def results(self):
+        """
+        Results in the order of the sweep points
+
+        Returns
+        -------
+        list[dict]
+            points with the "steps" and either the "series" (see
+            cache.simulate) or an "error" added
+        """
+        return [dict(point, steps=self.steps, **self.results_.get(key, {}))
+                for key, point in zip(self.keys_, self.points)]
+
+    async def close(self):
+        """
+        Stop accepting workers and disconnect existing ones
+        """
+        self.server_.close()
+        for writer in list(self.writers_):
+            writer.close()
+        # let the worker handlers see the end of their streams
+        await asyncio.gather(*self.handlers_, return_exceptions=True)
+        await self.server_.wait_closed()
+
+    async def serve(self):
+        """
+        Start, wait until every point has a result and close
+
+        Returns
+        -------
+        list[dict]
+            see results
+        """
+        if self.server_ is None:
+            await self.start()
+        try:
+            await self.finished_.wait()
+            # let connected workers receive "done"
+            await asyncio.sleep(0.1)
+        finally:
+            await self.close()
+        return self.results()
+
+    def __repr__(self):
+        return pformat(
+            {
+                "host": self.host,
+                "port": self.port,
+                "n_points": len(self.points),
+                "n_tasks": len(self.tasks_),
+                "n_pending": len(self.pending_),
+                "n_complete": len(self.results_),
+                "n_requeued": self.n_requeued_,
+                "n_duplicates": self.n_duplicates_,
+                "n_workers": self.n_workers_
+            }
+        )
+
+
+def run_task(task, progress=None, chunk=50):
+    """
+    Run a sweep point
+
+    Parameters
+    ----------
+    task : dict
+        with keys "configuration", "random_seed" and "steps"
+    progress : callable
+        called with the current day every chunk steps
+    chunk : int
+        number of steps between progress calls
+
+    Returns
+    -------
+    dict
+        series (see cache.simulate)
+    """
+    runner = Infection(**copy.deepcopy(task["configuration"]))
+    runner.initialize_all(random_seed=task["random_seed"])
+    series = None
+    remaining = task["steps"]
+    while remaining > 0:
+        series = simulate(runner, min(chunk, remaining), series=series)
+        remaining -= chunk
+        if progress is not None:
+            progress(runner.day_)
+    if series is None:
+        series = simulate(runner, 0)
+    return series
+
+
+def run_worker(host, port, chunk=50):
+    """
+    Run sweep points handed out by a coordinator until the sweep is done
+
+    Parameters
+    ----------
+    host : str
+        address of coordinator
+    port : int
+        port of coordinator
+    chunk : int
+        number of steps between progress messages
+
+    Returns
+    -------
+    int
+        number of points run
+    """
+    n_tasks = 0
+    with socket.create_connection((host, port)) as sock:
+        stream = sock.makefile("rwb")
+
+        def send(message):
+            stream.write(encode(message))
+            stream.flush()
+
+        try:
+            send({"type": "ready"})
+            for line in stream:
+                message = json.loads(line)
+                if message.get("type") != "task":
+                    break
+                key = message["id"]
+                try:
+                    series = run_task(
+                        message,
+                        progress=lambda day: send({"type": "progress",
+                                                   "id": key,
+                                                   "day": int(day)}),
+                        chunk=chunk)
+                except Exception as exc:
+                    send({"type": "error", "id": key,
+                          "message": f"{type(exc).__name__}: {exc}"})
+                else:
+                    send({"type": "result", "id": key, "series": series})
+                    n_tasks += 1
+                send({"type": "ready"})
+        except ConnectionError:
+            # the coordinator has gone away
+            pass
+    return n_tasks
+
+
+def run_sweep(points, steps, n_workers=2, task_timeout=None,
+              max_attempts=3):
+    """
+    Run a sweep with local worker processes
+
+    Parameters
+    ----------
+    points : list[dict]
+        sweep points (see sweep_points)
+    steps : int
+        number of steps to run each point
+    n_workers : int
+        number of worker processes
+    task_timeout : float
+        see SweepCoordinator
+    max_attempts : int
+        see SweepCoordinator
+
+    Returns
+    -------
+    list[dict]
+        see SweepCoordinator.results
+    """
+    async def sweep():
+        coordinator = SweepCoordinator(points, steps,
+                                       task_timeout=task_timeout,
+                                       max_attempts=max_attempts)
+        await coordinator.start()
+        workers = [multiprocessing.Process(
+                       target=run_worker,
+                       args=(coordinator.host, coordinator.port))
+                   for _ in range(n_workers)]
+        for worker in workers:
+            worker.start()
+        try:
+            return await coordinator.serve()
+        finally:
+            for worker in workers:
+                await asyncio.get_running_loop().run_in_executor(
+                    None, worker.join, 10)
+                if worker.is_alive():
+                    worker.terminate()
+
+    return asyncio.run(sweep())
+
+
+def main():
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(description="distributed parameter sweep")
+    subparsers = parser.add_subparsers(dest="role", required=True)
+
+    coordinate = subparsers.add_parser(
+        "coordinate", help="hand out sweep points and collect results")
+    coordinate.add_argument("-i", type=str, required=True,
+                            help=("json file with a list of configurations "
+                                  + "(or of points with keys "
+                                  + "\"configuration\" and \"random_seed\")"))
+    coordinate.add_argument("-o", type=str, default="sweep_output.json",
+                            help="file to which to write results")
+    coordinate.add_argument("--steps", type=int, default=100,
+                            help="number of steps/days to simulate")
+    coordinate.add_argument("--random_seeds", type=int, nargs="+",
+                            default=[333],
+                            help="seeds with which to run configurations")
+    coordinate.add_argument("--host", type=str, default="127.0.0.1")
+    coordinate.add_argument("--port", type=int, default=8765)
+    coordinate.add_argument("--task_timeout", type=float, default=None,
+                            help="seconds of worker silence before a task "
+                                 + "is also handed to another worker")
+
+    work = subparsers.add_parser("work", help="run sweep points")
+    work.add_argument("--host", type=str, default="127.0.0.1")
+    work.add_argument("--port", type=int, default=8765)
+
+    args = parser.parse_args()
+
+    if args.role == "work":
+        run_worker(args.host, args.port)
+        return
+
+    with open(args.i, "r") as jsf:
+        entries = json.load(jsf)
+    if all("configuration" in entry for entry in entries):
+        points = entries
+    else:
+        points = sweep_points(entries, args.random_seeds)
+
+    coordinator = SweepCoordinator(points, args.steps, host=args.host,
+                                   port=args.port,
+                                   task_timeout=args.task_timeout)
+    print(f"coordinating {len(points)} points on "
+          + f"{args.host}:{args.port}")
+    results = asyncio.run(coordinator.serve())
+    with open(args.o, "w") as jsf:
+        json.dump(results, jsf)
+    print(coordinator)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+"""
+-------------------------------------------------------
+Streaming aggregation of ensembles of simulations
+-------------------------------------------------------
+Author:  Mark Fruman
+Email:   majorgowan@yahoo.com
+-------------------------------------------------------
+
+The series of the replicas of an ensemble are consumed as they are
+produced (a step or a chunk of steps at a time) and only per-day summaries
+are kept: the running mean and variance (Welford's algorithm), the exact
+minimum and maximum and a quantile sketch, a histogram of fixed number of
+bins over [0, high) for each day whose range doubles (merging pairs of
+bins) when a larger value arrives that day.  Memory does not grow with the
+number of replicas, and quantiles are accurate to within a bin width of
+the day (high / bins) and clamped to the minimum and maximum (so a day on
+which every value is the same gets that value).  The full (replica, day,
+series) cube is written to a memory-mapped .npy file only if requested.
+"""
+import copy
+import numpy as np
+from pprint import pformat
+from infection.cache import cached_run
+from infection.infection import Infection
+
+
+# series of a run aggregated by default
+SERIES = ["n_infected", "n_immune", "mean_temperature"]
+
+
+class EnsembleAggregator:
+    """
+    Class representing running per-day statistics of the series of an
+    ensemble of runs
+
+    Parameters
+    ----------
+    steps : int
+        number of days
+    names : list[str]
+        names of the series (values must be non-negative)
+    bins : int
+        number of bins of each quantile sketch (even)
+    cube_path : str
+        if given, also write every value to a memory-mapped
+        (n_replicas, steps, len(names)) array in this .npy file (nan where
+        a replica has no value)
+    n_replicas : int
+        number of replicas (required with cube_path)
+    """
+    def __init__(self, steps, names=None, bins=256, cube_path=None,
+                 n_replicas=None):
+        self.steps = steps
+        self.names = list(names or SERIES)
+        self.bins = bins + bins % 2
+        self.cube_path = cube_path
+        self.n_replicas = n_replicas
+
+        shape = (len(self.names), steps)
+        self.count_ = np.zeros(steps, dtype=int)
+        self.mean_ = np.zeros(shape)
+        self.m2_ = np.zeros(shape)
+        self.min_ = np.full(shape, np.inf)
+        self.max_ = np.full(shape, -np.inf)
+        self.histogram_ = np.zeros(shape + (self.bins,), dtype=np.int64)
+        # bin width of each sketch on each day (0 until a positive value
+        # arrives that day)
+        self.width_ = np.zeros(shape)
+        self.cube_ = None
+        if cube_path is not None:
+            self.cube_ = np.lib.format.open_memmap(
+                cube_path, mode="w+", dtype=np.float32,
+                shape=(n_replicas, steps, len(self.names)))
+            self.cube_[:] = np.nan
+
+    def grow(self, which, day, value):
+        """
+        Widen the range of the sketch of a day until it holds value
+        """
+        width = self.width_[which, day]
+        if width == 0:
+            # the value falls in the middle of the range
+            self.width_[which, day] = 2.0 * value / self.bins
+            return
+        histogram = self.histogram_[which, day]
+        while value >= width * self.bins:
+            merged = histogram.reshape(self.bins // 2, 2).sum(-1)
+            histogram = np.concatenate([merged, np.zeros_like(merged)])
+            width *= 2
+        self.histogram_[which, day] = histogram
+        self.width_[which, day] = width
+
+    def add(self, values, start=0, replica=None):
+        """
+        Add consecutive values of one replica
+
+        Parameters
+        ----------
+        values : dict
+            arrays (or lists or numbers) of values of each series, for days
+            start, start + 1, ...
+        start : int
+            index (from 0) of the first day
+        replica : int
+            index of the replica (for the cube)
+        """
+        arrays = np.array([np.atleast_1d(values[name]) for name in self.names],
+                          dtype=float)
+        days = np.arange(start, start + arrays.shape[1])
+
+        # Welford update of the running mean and variance
+        self.count_[days] += 1
+        count = self.count_[days]
+        delta = arrays - self.mean_[:, days]
+        self.mean_[:, days] += delta / count
+        self.m2_[:, days] += delta * (arrays - self.mean_[:, days])
+
+        for which, row in enumerate(arrays):
+            row = np.maximum(row, 0.0)
+            self.min_[which, days] = np.minimum(self.min_[which, days], row)
+            self.max_[which, days] = np.maximum(self.max_[which, days], row)
+            outside = (row > 0) & (row >= self.width_[which, days]
+                                   * self.bins)
+            for day, value in zip(days[outside], row[outside]):
+                self.grow(which, day, value)
+            width = self.width_[which, days]
+            index = np.minimum((row / np.where(width > 0, width, 1.0))
+                               .astype(int), self.bins - 1)
+            self.histogram_[which, days, index] += 1
+
+        if self.cube_ is not None and replica is not None:
+            self.cube_[replica, days, :] = arrays.T
+
+    def update(self, step, values, replica=None):
+        """
+        Add the values of one replica on one day
+
+        Parameters
+        ----------
+        step : int
+            index (from 0) of the day
+        values : dict
+            value of each series
+        replica : int
+            index of the replica (for the cube)
+        """
+        self.add(values, start=step, replica=replica)
+
+    def mean(self, name):
+        return self.mean_[self.names.index(name)]
+
+    def variance(self, name):
+        """
+        Sample variance on each day (nan with fewer than two values)
+        """
+        m2 = self.m2_[self.names.index(name)]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(self.count_ > 1, m2 / (self.count_ - 1), np.nan)
+
+    def quantiles(self, name, q):
+        """
+        Estimated quantiles on each day (interpolated within bins and
+        clamped to the minimum and maximum of the day)
+
+        Parameters
+        ----------
+        name : str
+            name of series
+        q : list[float]
+            quantiles (between 0 and 1)
+
+        Returns
+        -------
+        numpy.array
+            (len(q), steps) (nan on days without values)
+        """
+        which = self.names.index(name)
+        cumulative = np.cumsum(self.histogram_[which], axis=1)
+        result = np.full((len(q), self.steps), np.nan)
+        for day in np.flatnonzero(self.count_ > 0):
+            counts = cumulative[day]
+            for ii, quantile in enumerate(q):
+                target = quantile * counts[-1]
+                index = min(int(np.searchsorted(counts, target)),
+                            self.bins - 1)
+                below = counts[index - 1] if index > 0 else 0
+                inside = counts[index] - below
+                fraction = (target - below) / inside if inside > 0 else 0.0
+                result[ii, day] = self.width_[which, day] * (index + fraction)
+        return np.clip(result, self.min_[which], self.max_[which])
+
+    def bands(self, name, percentiles=(5, 25, 50, 75, 95)):
+        """
+        Percentile bands on each day
+
+        Returns
+        -------
+        dict
+            (steps,) array of each percentile
+        """
+        values = self.quantiles(name, [p / 100 for p in percentiles])
+        return dict(zip(percentiles, values))
+
+    def summary(self, percentiles=(5, 25, 50, 75, 95)):
+        """
+        Mean, standard deviation and percentile bands of every series (as
+        lists)
+
+        Returns
+        -------
+        dict
+        """
+        return {
+            "n_replicas": self.count_.max(initial=0).item(),
+            "count": self.count_.tolist(),
+            "series": {
+                name: {
+                    "mean": self.mean(name).tolist(),
+                    "std": np.sqrt(self.variance(name)).tolist(),
+                    "percentiles": {
+                        str(p): values.tolist()
+                        for p, values in self.bands(name,
+                                                    percentiles).items()}
+                } for name in self.names
+            }
+        }
+
+    def close(self):
+        """
+        Flush the cube (if any) to disk
+        """
+        if self.cube_ is not None:
+            self.cube_.flush()
+
+    def __repr__(self):
+        return pformat({"steps": self.steps, "names": self.names,
+                        "bins": self.bins,
+                        "n_replicas": self.count_.max(initial=0).item(),
+                        "cube_path": self.cube_path})
+
+
+def run_ensemble(configuration, steps, random_seeds, aggregator=None,
+                 chunk=100, stop_when_absorbing=False, cache=None):
+    """
+    Run replicas with different seeds, feeding the percentage of people
+    infected and immune and the mean temperature of each chunk of steps to
+    an aggregator
+
+    Parameters
+    ----------
+    configuration : dict
+        configuration of the simulation
+    steps : int
+        number of steps per replica
+    random_seeds : list[int]
+        seed of each replica
+    aggregator : EnsembleAggregator
+        aggregator of the SERIES (a new one if None)
+    chunk : int
+        number of steps per chunk (see Infection.run_chunked)
+    stop_when_absorbing : bool
+        see Infection.run (later days of a stopped replica are not counted)
+    cache : RunCache object
+        if given, reuse (and store) the runs (see cache.cached_run)
+
+    Returns
+    -------
+    EnsembleAggregator
+    """
+    random_seeds = list(random_seeds)
+    if aggregator is None:
+        aggregator = EnsembleAggregator(steps)
+
+    for replica, seed in enumerate(random_seeds):
+        if cache is not None:
+            series = cached_run(copy.deepcopy(configuration), steps, seed,
+                                cache=cache)
+            n_people = series["n_people"]
+            aggregator.add({
+                "n_infected": 100 * np.array(series["n_infected"]) / n_people,
+                "n_immune": 100 * np.array(series["n_immune"]) / n_people,
+                "mean_temperature": series["mean_temperature"]
+            }, replica=replica)
+            continue
+
+        runner = Infection(**copy.deepcopy(configuration))
+        runner.initialize_all(random_seed=seed)
+        n_people = runner["n_people"]
+        start = 0
+        for values in runner.run_chunked(
+                steps, chunk=chunk, stop_when_absorbing=stop_when_absorbing):
+            aggregator.add({
+                "n_infected": 100 * values["n_infected"] / n_people,
+                "n_immune": 100 * values["n_immune"] / n_people,
+                "mean_temperature": values["mean_temperature"]
+            }, start=start, replica=replica)
+            start += len(values["day"])
+    aggregator.close()
+    return aggregator
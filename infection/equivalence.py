@@ -0,0 +1,500 @@
+"""
+-------------------------------------------------------
+Equivalence harness for simulation engines
+-------------------------------------------------------
+Author:  Mark Fruman
+Email:   majorgowan@yahoo.com
+-------------------------------------------------------
+
+Checks candidate engines against the frozen reference kernels and
+simulation loop (see reference.py):
+    - exact agreement of moves and bounces, of sampled infections given
+      the same uniform draws, and (up to a relative tolerance allowing
+      for reassociated sums and the configured precision) of temperature
+      fields
+    - statistical agreement of ensemble epidemic curves with runs of the
+      reference loop, within confidence bands (and exact agreement for
+      engines drawing the same random numbers as the reference)
+
+An engine is a class with methods move, temperature, infection_draw
+(may be None if not separately testable) and curves, and an attribute
+same_draws; see ENGINES.
+"""
+import os
+import copy
+import json
+import numpy as np
+from statistics import NormalDist
+from pprint import pformat
+from infection import reference
+from infection.base import Person, Temperature, Wall
+from infection.base.temperature import TRUNCATION, grid_coordinates
+from infection.batch import BatchInfection
+from infection.infection import Infection, default_configuration
+from infection.resolution import resolve_gridsize
+from infection.utils import supdate
+
+
+class FixedDraw:
+    """
+    Random generator whose uniform draw is given (for Person.infect)
+
+    Parameters
+    ----------
+    value : float
+        value returned by random
+    """
+    def __init__(self, value):
+        self.value = value
+
+    def random(self):
+        return self.value
+
+
+class ScalarEngine:
+    """
+    The current base classes (Person, Wall, Temperature) and Infection,
+    which draws the same random numbers as the reference loop
+    """
+    name = "scalar"
+    same_draws = True
+
+    def move(self, walls, x, y, dx, dy, speed):
+        people = []
+        for ii in range(len(x)):
+            person = Person(x=x[ii], y=y[ii], mobility=speed[ii],
+                            direction=0, hypochondria=0, immunity=0)
+            person.dx, person.dy = dx[ii], dy[ii]
+            person.move([Wall(**wall) for wall in walls])
+            people.append(person)
+        return (np.array([p.x for p in people]),
+                np.array([p.y for p in people]),
+                np.array([p.dx for p in people]),
+                np.array([p.dy for p in people]))
+
+    def temperature(self, gridsize, previous, x, y, infected, incubating,
+                    hotspot_radius, linger, intensity, dtype="float64"):
+        field = Temperature(gridsize, hotspot_radius=hotspot_radius,
+                            linger=linger, intensity=intensity, dtype=dtype)
+        field.temperature = previous.astype(dtype)
+        people = []
+        for ii in range(len(x)):
+            person = Person(x=x[ii], y=y[ii], mobility=0, direction=0,
+                            hypochondria=0, immunity=0)
+            person.infected = bool(infected[ii])
+            person.incubating = bool(incubating[ii])
+            people.append(person)
+        field.update(people)
+        return (field.temperature, field.apparent_temperature,
+                field.gradx, field.grady)
+
+    def infection_draw(self, local, immunity, infected, infectiousness,
+                       trial, draw, severity):
+        # each person sits on its own grid point, whose temperature is its
+        # local temperature (so that the coarse bounds of the field, see
+        # Temperature.bounds_at, are exercised too)
+        gridsize = 3
+        while True:
+            line = grid_coordinates(gridsize)[0][0]
+            columns = np.flatnonzero((line >= 0) & (line < 1))
+            if len(columns) ** 2 >= len(local):
+                break
+            gridsize *= 2
+        field = Temperature(gridsize)
+        temperature = np.zeros(field.temperature.shape)
+        people = []
+        for ii in range(len(local)):
+            row = columns[ii // len(columns)]
+            column = columns[ii % len(columns)]
+            temperature[row, column] = local[ii]
+            person = Person(x=line[column], y=line[row], mobility=0,
+                            direction=0, hypochondria=0, immunity=0)
+            person.immunity_ = immunity[ii]
+            person.infected = bool(infected[ii])
+            people.append(person)
+        field.temperature = temperature
+
+        # as in Infection.update_people
+        new = []
+        for index in Person.susceptible_indices(people, field):
+            if trial[index] < infectiousness:
+                result = people[index].infect(
+                    incubation=0, healing_rate=0.1, severity=severity[index],
+                    temperature=field, rng=FixedDraw(draw[index]))
+                if result is not None:
+                    new.append(index)
+        return new
+
+    def curves(self, configuration, steps, n_runs, random_seed):
+        n_infected = np.zeros((n_runs, steps), dtype=int)
+        n_immune = np.zeros((n_runs, steps), dtype=int)
+        for run in range(n_runs):
+            runner = Infection(**copy.deepcopy(configuration))
+            runner.initialize_all(random_seed=random_seed + run)
+            for ii, result in enumerate(runner.run(steps=steps)):
+                n_infected[run, ii], n_immune[run, ii] = result[1:3]
+        return n_infected, n_immune
+
+
+class BatchEngine:
+    """
+    The vectorized BatchInfection engine
+    """
+    name = "batch"
+    same_draws = False
+
+    @staticmethod
+    def engine(configuration, n_people):
+        configuration = copy.deepcopy(configuration)
+        configuration["n_people"] = n_people
+        engine = BatchInfection(1, **configuration)
+        shape = (1, n_people)
+        for attribute in ("x_", "y_", "dx_", "dy_", "mobility_",
+                          "immunity_"):
+            setattr(engine, attribute, np.zeros(shape))
+        engine.health_ = np.ones(shape)
+        engine.infected_ = np.zeros(shape, dtype=bool)
+        engine.incubating_ = np.zeros(shape, dtype=bool)
+        return engine
+
+    def move(self, walls, x, y, dx, dy, speed):
+        engine = self.engine({"mobility": {"walls": walls}}, len(x))
+        engine.x_[0], engine.y_[0] = x, y
+        engine.dx_[0], engine.dy_[0] = dx, dy
+        engine.mobility_[0] = speed
+        engine.move()
+        return engine.x_[0], engine.y_[0], engine.dx_[0], engine.dy_[0]
+
+    def temperature(self, gridsize, previous, x, y, infected, incubating,
+                    hotspot_radius, linger, intensity, dtype="float64"):
+        engine = self.engine({"gridsize": gridsize, "dtype": dtype,
+                              "infection": {"hotspot_radius": hotspot_radius,
+                                            "linger": linger,
+                                            "infectiousness": intensity}},
+                             len(x))
+        engine.x_[0], engine.y_[0] = x, y
+        engine.infected_[0] = infected
+        engine.incubating_[0] = incubating
+        engine.temperature_[0] = previous
+        engine.update_temperature()
+        return (engine.temperature_[0], engine.apparent_temperature_[0],
+                engine.gradx_[0], engine.grady_[0])
+
+    def infection_draw(self, local, immunity, infected, infectiousness,
+                       trial, draw, severity):
+        engine = self.engine({}, len(local))
+        engine.immunity_[0] = immunity
+        engine.infected_[0] = infected
+        new = engine.infection_draw(local[None], infectiousness,
+                                    trial[None], draw[None], severity[None])
+        return list(np.flatnonzero(new[0]))
+
+    def curves(self, configuration, steps, n_runs, random_seed):
+        engine = BatchInfection(n_runs, **copy.deepcopy(configuration))
+        engine.initialize_all(random_seed=random_seed)
+        _, n_infected, n_immune = engine.run(steps)
+        return n_infected, n_immune
+
+
+ENGINES = {
+    "scalar": ScalarEngine,
+    "batch": BatchEngine
+}
+
+
+def example_configurations():
+    """
+    The default configuration and the bundled examples
+
+    Returns
+    -------
+    dict
+        configurations keyed by name
+    """
+    this_directory = os.path.abspath(os.path.dirname(__file__))
+    example_dir = os.path.join(this_directory, "examples")
+    configurations = {"default": {}}
+    for filename in sorted(os.listdir(example_dir)):
+        if filename.endswith(".json"):
+            with open(os.path.join(example_dir, filename), "r") as jsf:
+                configurations[filename.split(".")[0]] = json.load(jsf)
+    return configurations
+
+
+def full_configuration(configuration):
+    full = default_configuration()
+    supdate(full, copy.deepcopy(configuration))
+    return full
+
+
+def reference_curves(configuration, steps, n_runs, random_seed):
+    """
+    Epidemic curves of runs of the frozen reference loop (see
+    reference.simulate) with seeds random_seed, random_seed + 1, ...
+
+    Returns
+    -------
+    n_infected : numpy.array
+        (n_runs, steps)
+    n_immune : numpy.array
+        (n_runs, steps)
+    """
+    full = full_configuration(configuration)
+    full["gridsize"] = resolve_gridsize(full)
+    n_infected = np.zeros((n_runs, steps), dtype=int)
+    n_immune = np.zeros((n_runs, steps), dtype=int)
+    for run in range(n_runs):
+        n_infected[run], n_immune[run] = reference.simulate(
+            full, steps, random_seed + run)
+    return n_infected, n_immune
+
+
+def check_moves(engine, configuration, n_samples=2000, random_seed=0):
+    """
+    Check moves and bounces for exact agreement with the reference,
+    including fast movers (several bounces) and displacements parallel to
+    or starting on walls
+
+    Returns
+    -------
+    dict
+    """
+    rng = np.random.default_rng(random_seed)
+    walls = full_configuration(configuration)["mobility"]["walls"]
+
+    x, y = rng.random(n_samples), rng.random(n_samples)
+    direction = 2 * np.pi * rng.random(n_samples)
+    dx, dy = np.cos(direction), np.sin(direction)
+    speed = rng.choice([0.01, 0.05, 0.3], size=n_samples)
+
+    # displacements parallel to axes and starting on interior walls
+    vertical = rng.random(n_samples) < 0.05
+    horizontal = ~vertical & (rng.random(n_samples) < 0.05)
+    dx[vertical] = 0.0
+    dy[vertical] = rng.choice([-1.0, 1.0], size=vertical.sum())
+    dx[horizontal] = rng.choice([-1.0, 1.0], size=horizontal.sum())
+    dy[horizontal] = 0.0
+    for wall in walls:
+        on_wall = rng.random(n_samples) < 0.02
+        if wall["orient"] == "h" and 0 < wall["y"] < 1:
+            y[on_wall] = wall["y"]
+        elif wall["orient"] == "v" and 0 < wall["x"] < 1:
+            x[on_wall] = wall["x"]
+
+    expected = np.array([reference.move(
+        x[ii], y[ii], dx[ii], dy[ii], speed[ii],
+        [(w["orient"], w["x"], w["y"]) for w in walls])
+        for ii in range(n_samples)]).T
+    result = np.array(engine.move(walls, x, y, dx, dy, speed))
+
+    mismatched = np.flatnonzero((result != expected).any(axis=0))
+    return {
+        "passed": len(mismatched) == 0,
+        "n_samples": n_samples,
+        "n_mismatched": len(mismatched),
+        "first_mismatch": int(mismatched[0]) if len(mismatched) else None
+    }
+
+
+def check_field(engine, configuration, n_infected=20, random_seed=0,
+                rtol=None):
+    """
+    Check a temperature update (from a non-zero previous field) against
+    the reference, with the engine computing in the configured "dtype"
+
+    Parameters
+    ----------
+    rtol : float
+        tolerance relative to the maximum of the reference field (None for
+        n_infected * gridsize times the machine epsilon of the dtype plus
+        the truncation of hotspots: summing the n_infected positive
+        hotspot terms in another order, or in a lower precision, changes
+        the fields by at most n_infected epsilons relative to their
+        maximum, dropping the terms below TRUNCATION of the peak of a
+        hotspot by at most n_infected * TRUNCATION, and the centred
+        differences of the gradients amplify that by at most gridsize
+        relative to the largest gradient)
+
+    Returns
+    -------
+    dict
+    """
+    rng = np.random.default_rng(random_seed)
+    full = full_configuration(configuration)
+    gridsize = resolve_gridsize(full)
+    dtype = full["dtype"]
+    if rtol is None:
+        rtol = float(n_infected * gridsize
+                     * (np.finfo(dtype).eps + TRUNCATION))
+    infection = full["infection"]
+    parameters = {"hotspot_radius": infection["hotspot_radius"],
+                  "linger": infection["linger"],
+                  "intensity": infection["infectiousness"]}
+
+    xx, yy = grid_coordinates(gridsize)
+    previous = rng.random(xx.shape)
+    x, y = rng.random(n_infected), rng.random(n_infected)
+    infected = rng.random(n_infected) < 0.8
+    incubating = rng.random(n_infected) < 0.3
+
+    expected = reference.temperature_update(xx, yy, previous, x, y,
+                                            infected, incubating,
+                                            **parameters)
+    result = engine.temperature(gridsize, previous, x, y, infected,
+                                incubating, dtype=dtype, **parameters)
+
+    errors = {}
+    for name, ref, res in zip(("temperature", "apparent_temperature",
+                               "gradx", "grady"), expected, result):
+        scale = max(np.abs(ref).max(), 1e-300)
+        errors[name] = float(np.abs(res - ref).max() / scale)
+    return {
+        "passed": all(error <= rtol for error in errors.values()),
+        "exact": all(error == 0 for error in errors.values()),
+        "dtype": dtype,
+        "rtol": rtol,
+        "relative_errors": errors
+    }
+
+
+def check_infection_draw(engine, n_samples=2000, random_seed=0):
+    """
+    Check that the same uniform draws infect exactly the same people
+
+    Returns
+    -------
+    dict
+    """
+    rng = np.random.default_rng(random_seed)
+    local = rng.random(n_samples) * rng.choice([0.0, 0.5, 2.0],
+                                               size=n_samples)
+    immunity = rng.random(n_samples) * rng.choice([0.0, 1.0],
+                                                  size=n_samples)
+    infected = rng.random(n_samples) < 0.1
+    trial, draw = rng.random(n_samples), rng.random(n_samples)
+    severity = rng.random(n_samples)
+
+    arguments = (local, immunity, infected, 0.5, trial, draw, severity)
+    expected = reference.infection_draw(*arguments)
+    result = engine.infection_draw(*arguments)
+    return {
+        "passed": list(expected) == [int(ii) for ii in result],
+        "n_samples": n_samples,
+        "n_expected": len(expected),
+        "n_result": len(result)
+    }
+
+
+def check_curves(engine, configuration, steps=200, n_runs=20,
+                 random_seed=0, confidence=0.99, max_outside=0.05):
+    """
+    Compare ensemble epidemic curves of the engine with runs of the
+    reference loop: the difference of the ensemble means must lie within
+    the confidence band on all but a fraction max_outside of the days.  An
+    engine drawing the same random numbers as the reference (same_draws)
+    is run with the same seeds and its curves must be identical.
+
+    Returns
+    -------
+    dict
+    """
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    n_people = full_configuration(configuration)["n_people"]
+
+    references = reference_curves(configuration, steps, n_runs, random_seed)
+    engine_curves = engine.curves(
+        configuration, steps, n_runs,
+        random_seed if engine.same_draws else random_seed + n_runs)
+
+    report = {"steps": steps, "n_runs": n_runs, "confidence": confidence}
+    passed = True
+    if engine.same_draws:
+        report["identical"] = all(np.array_equal(ref, res) for ref, res
+                                  in zip(references, engine_curves))
+        passed = report["identical"]
+    for name, ref, res in zip(("n_infected", "n_immune"),
+                              references, engine_curves):
+        ref = ref / n_people
+        res = res / n_people
+        difference = res.mean(axis=0) - ref.mean(axis=0)
+        band = z * np.sqrt(ref.var(axis=0, ddof=1) / len(ref)
+                           + res.var(axis=0, ddof=1) / len(res))
+        outside = float(np.mean(np.abs(difference) > band))
+        passed = passed and outside <= max_outside
+        report[name] = {
+            "fraction_outside_band": outside,
+            "max_mean_difference": float(np.abs(difference).max()),
+            "mean_band_width": float(band.mean())
+        }
+    report["passed"] = passed
+    return report
+
+
+def check_engine(engine="batch", configurations=None, statistical=True,
+                 steps=200, n_runs=20, random_seed=0):
+    """
+    Run all checks of an engine over the bundled example configurations
+
+    Parameters
+    ----------
+    engine : str
+        name of engine in ENGINES
+    configurations : dict
+        configurations keyed by name (example_configurations if None)
+    statistical : bool
+        if set, also compare ensemble epidemic curves (slow)
+    steps : int
+        number of steps of ensemble runs
+    n_runs : int
+        number of runs per ensemble
+    random_seed : int
+        seed for generating test cases
+
+    Returns
+    -------
+    dict
+        reports keyed by configuration name and check
+    """
+    candidate = ENGINES[engine]()
+    if configurations is None:
+        configurations = example_configurations()
+
+    report = {}
+    for name, configuration in configurations.items():
+        report[name] = {
+            "moves": check_moves(candidate, configuration,
+                                 random_seed=random_seed),
+            "field": check_field(candidate, configuration,
+                                 random_seed=random_seed),
+            "infection_draw": check_infection_draw(candidate,
+                                                   random_seed=random_seed)
+        }
+        if statistical:
+            report[name]["curves"] = check_curves(
+                candidate, configuration, steps=steps, n_runs=n_runs,
+                random_seed=random_seed)
+    return report
+
+
+def main():
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(description="check a simulation engine "
+                                        + "against the reference")
+    parser.add_argument("--engine", type=str, default="batch",
+                        choices=sorted(ENGINES))
+    parser.add_argument("--steps", type=int, default=200,
+                        help="number of steps of ensemble runs")
+    parser.add_argument("--runs", type=int, default=20,
+                        help="number of runs per ensemble")
+    parser.add_argument("--no_statistical", action="store_true",
+                        help="if set, skip ensemble curve comparison")
+    args = parser.parse_args()
+
+    report = check_engine(args.engine, statistical=not args.no_statistical,
+                          steps=args.steps, n_runs=args.runs)
+    print(pformat(report))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,44 +1,86 @@
+import pickle
+import asyncio
 import numpy as np
 from pprint import pformat
-from infection import Person, Temperature, Wall
+from infection import (CellList, GridlessTemperature, HealthQueue,
+                       LazyPerson, Person, RandomStreams, SuperPerson,
+                       Temperature, Wall)
+from infection.metrics import build_metrics, evaluate_metrics
+from infection.resolution import resolve_gridsize
 from infection.utils import supdate, random_choice
 
 
+# person attributes that interventions may change
+PEOPLE_PARAMETERS = {
+    "speed": "mobility",
+    "hypochondria": "hypochondria",
+    "immunity": "full_immunity"
+}
+
+
+def default_configuration():
+    """
+    Generate the default configuration of a simulation
+
+    Returns
+    -------
+    dict
+    """
+    configuration = {
+        "n_people": 100,
+        "gridsize": 200,
+        "gridsize_tolerance": 0.05,
+        "gridsize_maximum": 200,
+        "dtype": "float64",
+        "temperature_mode": "grid",
+        "threads": 1,
+        "health_mode": "step",
+        "agent_weight": 1,
+        "weight_sampling": "binomial",
+        "random_streams": False,
+        "antithetic": False,
+        "movement_interval": 1,
+        "health_interval": 1,
+        "field_interval": 1,
+        "field_displacement": 0.5,
+        "initial_infection_fraction": 0.05,
+        "infection": {
+            "infectiousness": 0.1,
+            "linger": 0.1,
+            "hotspot_radius": 0.04,
+            "incubation": 0,
+            "immunity": 2,
+            "healing_rate": 0.1,
+            "severity": 1,
+            "seasonality": 0.2
+        },
+        "mobility": {
+            "speed": 0.02,
+            "hypochondria": 0.05,
+            "walls": [
+                {"orient": "h",
+                 "x": [0, 1],
+                 "y": 0},
+                {"orient": "h",
+                 "x": [0, 1],
+                 "y": 1},
+                {"orient": "v",
+                 "x": 0,
+                 "y": [0, 1]},
+                {"orient": "v",
+                 "x": 1,
+                 "y": [0, 1]}
+            ]
+        },
+        "metrics": [],
+        "schedule": []
+    }
+    return configuration
+
+
 class Infection:
     def __init__(self, **kwargs):
-        configuration = {
-            "n_people": 100,
-            "gridsize": 200,
-            "initial_infection_fraction": 0.05,
-            "infection": {
-                "infectiousness": 0.1,
-                "linger": 0.1,
-                "hotspot_radius": 0.04,
-                "incubation": 0,
-                "immunity": 2,
-                "healing_rate": 0.1,
-                "severity": 1,
-                "seasonality": 0.2
-            },
-            "mobility": {
-                "speed": 0.02,
-                "hypochondria": 0.05,
-                "walls": [
-                    {"orient": "h",
-                     "x": [0, 1],
-                     "y": 0},
-                    {"orient": "h",
-                     "x": [0, 1],
-                     "y": 1},
-                    {"orient": "v",
-                     "x": 0,
-                     "y": [0, 1]},
-                    {"orient": "v",
-                     "x": 1,
-                     "y": [0, 1]}
-                ]
-            }
-        }
+        configuration = default_configuration()
         supdate(configuration, kwargs)
         self.configuration = configuration
         # build walls
@@ -47,6 +89,17 @@ class Infection:
         self.people_ = []
         self.temperature_ = None
         self.infections_ = []
+        self.event_index_ = None
+        self.metrics_ = {}
+        self.measurements_ = {}
+        self.schedule_index_ = 0
+        self.health_queue_ = None
+        self.quiescent_ = False
+        # day of the last update of each process (see due)
+        self.updated_ = {"movement": 0, "health": 0, "field": 0}
+        self.field_state_ = None
+        self.n_field_updates_ = 0
+        self.streams_ = None
         # set walls
         for wall_config in configuration["mobility"]["walls"]:
             self.walls_.append(Wall(**wall_config))
@@ -55,37 +108,151 @@ class Infection:
         """
         Initialize the people in the simulation
         """
-        n_people = self["n_people"]
         initial_infection_fraction = self["initial_infection_fraction"]
         mobility = self["mobility"]
         infect0 = self["infection"]
 
+        # with "agent_weight" above 1 each agent is a super-individual
+        # standing for (about) agent_weight of the n_people people
+        agent_weight = self["agent_weight"]
+        n_people = int(np.ceil(self["n_people"] / agent_weight))
+        weights = np.full(n_people, self["n_people"] // n_people)
+        weights[:self["n_people"] % n_people] += 1
+
         # generate initial positions and speeds for people
-        positions = np.random.random(size=(n_people, 2))
-        speeds = random_choice(mobility["speed"], size=n_people)
-        directions = 2 * np.pi * np.random.random(size=n_people)
+        parameters = self.rng("parameters")
+        positions = self.rng("positions").random(size=(n_people, 2))
+        speeds = random_choice(mobility["speed"], size=n_people,
+                               rng=parameters)
+        directions = 2 * np.pi * self.rng("directions").random(size=n_people)
+
+        options = {}
+        if agent_weight > 1:
+            if self["health_mode"] == "event":
+                raise ValueError("super-individuals (agent_weight > 1) "
+                                 + "require \"health_mode\": \"step\"")
+            person_class = SuperPerson
+            options = {"sampling": self["weight_sampling"]}
+        elif self["health_mode"] == "event":
+            person_class = LazyPerson
+        else:
+            person_class = Person
 
         self.people_ = []
-        for position, speed, direction in zip(positions, speeds, directions):
-            immunity = random_choice(infect0["immunity"])
-            hypochondria = random_choice(mobility["hypochondria"])
-            self.people_.append(Person(x=position[0], y=position[1],
-                                       mobility=speed, direction=direction,
-                                       hypochondria=hypochondria,
-                                       immunity=immunity))
+        for position, speed, direction, weight in zip(positions, speeds,
+                                                      directions, weights):
+            immunity = random_choice(infect0["immunity"], rng=parameters)
+            hypochondria = random_choice(mobility["hypochondria"],
+                                         rng=parameters)
+            if person_class is SuperPerson:
+                options["weight"] = int(weight)
+            self.people_.append(person_class(x=position[0], y=position[1],
+                                             mobility=speed,
+                                             direction=direction,
+                                             hypochondria=hypochondria,
+                                             immunity=immunity, **options))
+
+        self.health_queue_ = None
+        if person_class is LazyPerson:
+            self.health_queue_ = HealthQueue(self.people_)
 
         # randomly pick the infected
         n_infected = int(initial_infection_fraction * n_people)
-        infected = np.random.choice(a=np.arange(n_people),
-                                    size=n_infected)
+        infected = self.rng("seeding").choice(a=np.arange(n_people),
+                                              size=n_infected)
+
+        self.infections_ = []
+        # index (into infections_) of each person's latest infection
+        self.event_index_ = -1 * np.ones(n_people, dtype=int)
 
         for inf0 in infected:
-            incubation = random_choice(infect0["incubation"])
-            severity = random_choice(infect0["severity"])
-            healing_rate = random_choice(infect0["healing_rate"])
-            self.people_[inf0].infect(incubation=incubation,
-                                      healing_rate=healing_rate,
-                                      severity=severity)
+            incubation = random_choice(infect0["incubation"], rng=parameters)
+            severity = random_choice(infect0["severity"], rng=parameters)
+            healing_rate = random_choice(infect0["healing_rate"],
+                                         rng=parameters)
+            result = self.people_[inf0].infect(incubation=incubation,
+                                               healing_rate=healing_rate,
+                                               severity=severity)
+            # log the seed infection (root of the transmission tree)
+            self.log_infection(inf0, result, sources=[], weights=[])
+            self.schedule_health(inf0)
+
+    def log_infection(self, index, result, sources, weights):
+        """
+        Record an infection event together with its attributed sources
+
+        Parameters
+        ----------
+        index : int
+            index (in people_) of the newly infected person
+        result : dict
+            description of the infection event returned by Person.infect
+        sources : list[int]
+            indices (in infections_) of the events of probable sources
+        weights : list[float]
+            normalized probability of each source
+        """
+        result["day"] = self.day_
+        result["index"] = int(index)
+        result["sources"] = [int(s) for s in sources]
+        result["weights"] = [float(w) for w in weights]
+        result["parent"] = (int(sources[int(np.argmax(weights))])
+                            if len(sources) > 0 else -1)
+        self.event_index_[index] = len(self.infections_)
+        self.infections_.append(result)
+
+    def source_index(self):
+        """
+        Build a neighbour index over people who currently contribute to
+        the temperature field (symptomatic and incubating)
+
+        Returns
+        -------
+        CellList object
+            cell list over positions of infected people (cutoff at three
+            hotspot radii)
+        numpy.array of int
+            indices (in people_) of the infected people
+        """
+        hotspot_radius = self["infection"]["hotspot_radius"]
+        infected = np.array([ii for ii, person in enumerate(self.people_)
+                             if person.infected], dtype=int)
+        positions = np.array([[self.people_[ii].x, self.people_[ii].y]
+                              for ii in infected]).reshape(-1, 2)
+        return CellList(positions, cutoff=3 * hotspot_radius), infected
+
+    def attribute_infection(self, x, y, cell_list, infected):
+        """
+        Attribute an infection at (x, y) to nearby infected people,
+        weighted by their gaussian contribution to the temperature there
+
+        Parameters
+        ----------
+        x : float
+            x-coordinate of infection site
+        y : float
+            y-coordinate of infection site
+        cell_list : CellList object
+            neighbour index over infected people (see source_index)
+        infected : numpy.array of int
+            indices (in people_) of the points in cell_list
+
+        Returns
+        -------
+        sources : list[int]
+            indices (in infections_) of the events of probable sources
+        weights : list[float]
+            normalized probability of each source
+        """
+        hotspot_radius = self["infection"]["hotspot_radius"]
+        neighbours, dist2 = cell_list.query(x, y)
+        if len(neighbours) == 0:
+            # infected by the lingering field only
+            return [], []
+        weights = np.exp(-0.5 * dist2 / hotspot_radius ** 2)
+        weights /= weights.sum()
+        sources = self.event_index_[infected[neighbours]]
+        return list(sources), list(weights)
 
     def initialize_temperature(self):
         """
@@ -95,12 +262,22 @@ class Infection:
         linger = self["infection"]["linger"]
         infectiousness = self["infection"]["infectiousness"]
 
-        self.temperature_ = Temperature(
-            gridsize=self.configuration["gridsize"],
+        if self["temperature_mode"] == "gridless":
+            temperature_class = GridlessTemperature
+            options = {}
+        else:
+            temperature_class = Temperature
+            options = {"threads": self["threads"]}
+
+        self.temperature_ = temperature_class(
+            gridsize=resolve_gridsize(self.configuration),
             hotspot_radius=hotspot_radius,
             linger=linger,
-            intensity=infectiousness
+            intensity=infectiousness,
+            dtype=self["dtype"],
+            **options
         )
+        self.field_state_ = None
 
     def update_people(self):
         """
@@ -115,31 +292,186 @@ class Infection:
                               * (1 + seasonality * np.cos(2 * np.pi
                                                           * self.day_ / 365)))
 
+        # index the people whose positions determined the current field
+        cell_list, infected = self.source_index()
+
         # update people's health
-        for person in self.people_:
-            person.update_health()
+        for _ in range(self.due("health")):
+            self.update_health()
 
-        # infect new people
-        for person in Person.susceptible_people(self.people_,
+        # infect new people: with named streams, the trials draw from a
+        # block of one uniform per person per step and from a generator
+        # keyed by day and person (see RandomStreams)
+        streams = self.streams_
+        if streams is not None:
+            gates = streams.generator("infections").random(len(self.people_))
+        rng = None
+        for index in Person.susceptible_indices(self.people_,
                                                 self.temperature_):
-            if np.random.random() < infectiousness:
-                incubation = random_choice(infect0["incubation"])
-                severity = random_choice(infect0["severity"])
-                healing_rate = random_choice(infect0["healing_rate"])
-                result = person.infect(incubation=incubation,
-                                       healing_rate=healing_rate,
-                                       severity=severity,
-                                       temperature=self.temperature_)
-                if result is not None:
-                    # log the infection event
-                    result["day"] = self.day_
-                    self.infections_.append(result)
+            person = self.people_[index]
+            options = {}
+            if isinstance(person, SuperPerson):
+                # each member is exposed with probability infectiousness
+                # (see SuperPerson.infect) rather than the whole agent
+                options["infectiousness"] = infectiousness
+            else:
+                gate = (np.random.random() if streams is None
+                        else gates[index])
+                if gate >= infectiousness:
+                    continue
+            if streams is not None:
+                rng = streams.keyed("trials", self.day_, index)
+            incubation = random_choice(infect0["incubation"], rng=rng)
+            severity = random_choice(infect0["severity"], rng=rng)
+            healing_rate = random_choice(infect0["healing_rate"], rng=rng)
+            result = person.infect(incubation=incubation,
+                                   healing_rate=healing_rate,
+                                   severity=severity,
+                                   temperature=self.temperature_,
+                                   rng=rng, **options)
+            if result is not None:
+                # log the infection event with its probable sources
+                sources, weights = self.attribute_infection(
+                    result["x"], result["y"], cell_list, infected)
+                self.log_infection(index, result, sources, weights)
+                self.schedule_health(index)
 
         # update people movement
-        for person in self.people_:
-            person.accelerate(self.temperature_)
-        for person in self.people_:
-            person.move(self.walls_)
+        steps = self.due("movement")
+        if steps > 0:
+            for person in self.people_:
+                person.accelerate(self.temperature_)
+            for _ in range(steps):
+                for person in self.people_:
+                    person.move(self.walls_)
+
+    def update_health(self):
+        """
+        Update the health of the people: every person in "step" mode, only
+        the people with a transition due in "event" mode (see HealthQueue)
+        """
+        if self.health_queue_ is not None:
+            self.health_queue_.advance()
+        else:
+            for person in self.people_:
+                person.update_health()
+
+    def due(self, process, force=False):
+        """
+        Number of steps by which to advance a process ("movement",
+        "health" or "field") on the current step: the steps since its last
+        update if it is due according to its configured interval (for the
+        field, "adaptive" updates once the field has moved by
+        field_displacement, see field_displacement), else 0.  Movement
+        applies one acceleration and a move per step, health one update
+        per step, and the field a single update from the current people
+        (with the lingering temperature decayed once per step, see
+        Temperature.update).
+
+        Parameters
+        ----------
+        process : str
+            "movement", "health" or "field"
+        force : bool
+            if set, the process is due whatever its interval
+
+        Returns
+        -------
+        int
+        """
+        steps = self.day_ - self.updated_[process]
+        interval = self[process + "_interval"]
+        if not force:
+            if interval == "adaptive":
+                if self.field_displacement() < self["field_displacement"]:
+                    return 0
+            elif steps < interval:
+                return 0
+        self.updated_[process] = self.day_
+        return steps
+
+    def field_displacement(self):
+        """
+        Largest displacement of the sources of the field (infected people)
+        since the last field update, relative to hotspot_radius; a hotspot
+        that has appeared (a person newly infected) or vanished (a source
+        recovered) counts as a displacement of one radius.  Only the
+        sources of the last update and the infections logged since are
+        examined.
+
+        Returns
+        -------
+        float
+        """
+        if self.field_state_ is None:
+            return np.inf
+        sources, positions, n_events = self.field_state_
+        current = [self.people_[index] for index in sources]
+        remaining = np.array([p.infected for p in current], dtype=bool)
+        offset = np.abs(Person.positions(current).reshape(-1, 2)[remaining]
+                        - positions[remaining])
+        # positions are periodic at open boundaries
+        offset = np.minimum(offset, 1 - offset)
+        displacement = (np.sqrt((offset ** 2).sum(axis=1)).max(initial=0)
+                        / self["infection"]["hotspot_radius"])
+        infected = [event["index"] for event in self.infections_[n_events:]]
+        if (not remaining.all()
+                or np.setdiff1d(infected, sources).size > 0):
+            displacement = max(displacement, 1.0)
+        return float(displacement)
+
+    def update_field(self, steps=1):
+        """
+        Update the temperature field from the current people
+
+        Parameters
+        ----------
+        steps : int
+            number of steps since the last update (see Temperature.update)
+        """
+        self.temperature_.update(self.people_, steps=steps)
+        if self["field_interval"] == "adaptive":
+            # sources of the field, their positions and the number of
+            # infections logged (see field_displacement)
+            sources = np.flatnonzero([p.infected for p in self.people_])
+            current = [self.people_[index] for index in sources]
+            self.field_state_ = (sources,
+                                 Person.positions(current).reshape(-1, 2),
+                                 len(self.infections_))
+        self.n_field_updates_ += 1
+
+    def rng(self, name):
+        """
+        Random generator of a named stream (see RandomStreams), or the
+        global numpy.random if "random_streams" is not set
+
+        Parameters
+        ----------
+        name : str
+            purpose of the stream (see random_streams.STREAMS)
+
+        Returns
+        -------
+        numpy.random.Generator or module
+        """
+        if not self["random_streams"]:
+            return np.random
+        if self.streams_ is None:
+            self.streams_ = RandomStreams(antithetic=self["antithetic"])
+        return self.streams_.generator(name)
+
+    def schedule_health(self, index):
+        """
+        Schedule the health transitions of a newly infected person (in
+        "event" mode)
+
+        Parameters
+        ----------
+        index : int
+            index (in people_) of the person
+        """
+        if self.health_queue_ is not None:
+            self.health_queue_.schedule(index)
 
     def initialize_all(self, random_seed=None):
         """
@@ -150,12 +482,123 @@ class Infection:
         """
         if random_seed is not None:
             np.random.seed(random_seed)
+        self.streams_ = None
+        if self["random_streams"]:
+            self.streams_ = RandomStreams(random_seed,
+                                          antithetic=self["antithetic"])
 
         self.initialize_people()
         self.initialize_temperature()
+        self.initialize_metrics()
         return self
 
-    def run(self, steps):
+    def initialize_metrics(self):
+        """
+        Build the metrics listed in the configuration (see metrics.py);
+        metrics depending on the walls use the walls at this time
+        """
+        self.metrics_ = build_metrics(self, self["metrics"])
+        self.measurements_ = {}
+
+    def apply_intervention(self, event):
+        """
+        Apply an intervention to the running simulation without rebuilding
+        it.  An event may contain:
+            "walls": {"add": [<wall config(s)>], "remove": [<wall config(s)>]}
+                walls to add or (matching configs) remove
+            "infection": {<key>: <value>}, "mobility": {<key>: <value>}
+                configuration updates (as for configure, but without walls);
+                e.g. infectiousness, severity, healing_rate apply to new
+                infections and field parameters from the next update
+            "people": {"speed" | "hypochondria" | "immunity":
+                       {"scale": <factor>} or {"set": <value(s)>}}
+                rescale the current parameter of every person, or draw
+                new values (see random_choice)
+
+        Parameters
+        ----------
+        event : dict
+            description of the intervention
+        """
+        walls = event.get("walls", {})
+        # copy so as not to modify a list shared with the caller
+        wall_configs = list(self.configuration["mobility"]["walls"])
+        self.configuration["mobility"]["walls"] = wall_configs
+        for wall_config in walls.get("remove", []):
+            while wall_config in wall_configs:
+                index = wall_configs.index(wall_config)
+                del wall_configs[index]
+                del self.walls_[index]
+        for wall_config in walls.get("add", []):
+            wall_configs.append(wall_config)
+            self.walls_.append(Wall(**wall_config))
+
+        for section in ("infection", "mobility"):
+            update = {k: v for k, v in event.get(section, {}).items()
+                      if k.lstrip("+") != "walls"}
+            if update:
+                supdate(self.configuration, {section: update})
+        self.sync_temperature()
+
+        n_people = len(self.people_)
+        for parameter, change in event.get("people", {}).items():
+            attribute = PEOPLE_PARAMETERS[parameter]
+            values = np.array([getattr(p, attribute) for p in self.people_],
+                              dtype=float)
+            if "scale" in change:
+                values = values * change["scale"]
+            if "set" in change:
+                values = np.broadcast_to(
+                    random_choice(change["set"], size=n_people,
+                                  rng=self.rng("parameters")), n_people)
+            for person, value in zip(self.people_, values):
+                setattr(person, attribute, value)
+
+    def apply_schedule(self):
+        """
+        Apply the interventions in the configured "schedule" that are due
+        (those with "day" up to the current day and not yet applied)
+        """
+        schedule = sorted(self["schedule"] or [],
+                          key=lambda event: event["day"])
+        while (self.schedule_index_ < len(schedule)
+               and schedule[self.schedule_index_]["day"] <= self.day_):
+            self.apply_intervention(schedule[self.schedule_index_])
+            self.schedule_index_ += 1
+
+    def quiescent(self, floor):
+        """
+        Return True if no one is infected and the (lingering) temperature
+        is everywhere below floor, so that no further infection can occur
+        (up to a probability of order floor)
+
+        Parameters
+        ----------
+        floor : float
+            temperature below which the field is considered cold
+
+        Returns
+        -------
+        bool
+        """
+        if any(person.infected for person in self.people_):
+            return False
+        return self.temperature_.max_temperature() < floor
+
+    def fast_forward_people(self):
+        """
+        Update the people during a quiescent period: only immunity decays
+        and people move (with a vanishing field there is no infection and
+        no acceleration away from hotspots)
+        """
+        for _ in range(self.due("health", force=True)):
+            self.update_health()
+        for _ in range(self.due("movement", force=True)):
+            for person in self.people_:
+                person.move(self.walls_)
+
+    def run(self, steps, quiescent_floor=1e-6, stop_when_absorbing=False,
+            with_metrics=False):
         """
         Run the simulation
 
@@ -163,6 +606,17 @@ class Infection:
         ----------
         steps : int
             number of steps to run
+        quiescent_floor : float
+            if no one is infected and the temperature is below this value,
+            skip the infection draw and the temperature evaluation and
+            only advance positions, immunity decay and the lingering field
+            (None to always run full steps)
+        stop_when_absorbing : bool
+            if set, stop early once the state is quiescent and no one is
+            immune (the output can no longer change)
+        with_metrics : bool
+            if set, also yield a dict with the values of the configured
+            metrics (also available as measurements_ after each step)
 
         Returns
         -------
@@ -173,13 +627,196 @@ class Infection:
             self.initialize_all()
 
         for _ in range(steps):
-            self.day_ += 1
-            self.update_people()
-            self.temperature_.update(self.people_)
-            yield (self.day_,
-                   len(Person.infected_people(self.people_)),
-                   len(Person.immune_people(self.people_,
-                                            self.temperature_)))
+            result = self.step(quiescent_floor)
+            if with_metrics:
+                yield (*result, self.measurements_)
+            else:
+                yield result
+            if stop_when_absorbing and self.quiescent_ and result[2] == 0:
+                return
+
+    def step(self, quiescent_floor=1e-6):
+        """
+        Advance the simulation by one step (see run)
+
+        Parameters
+        ----------
+        quiescent_floor : float
+            see run
+
+        Returns
+        -------
+        day : int
+        n_infected : int
+        n_immune : int
+        """
+        self.day_ += 1
+        self.apply_schedule()
+        self.quiescent_ = (quiescent_floor is not None
+                           and self.quiescent(quiescent_floor))
+        if self.quiescent_:
+            self.fast_forward_people()
+            self.temperature_.decay()
+            self.due("field", force=True)
+            # temperature is below the floor everywhere
+            threshold = self.temperature_.max_temperature() + 0.1
+            immune = Person.immunities(self.people_) > threshold
+            n_immune = int(np.sum(Person.recovered_weights(self.people_)
+                                  * immune))
+            self.measurements_ = evaluate_metrics(self, self.metrics_)
+            return self.day_, 0, n_immune
+
+        self.update_people()
+        steps = self.due("field")
+        if steps > 0:
+            self.update_field(steps)
+        self.measurements_ = evaluate_metrics(self, self.metrics_)
+        return (self.day_,
+                Person.infected_count(self.people_),
+                Person.immune_count(self.people_, self.temperature_))
+
+    def run_chunked(self, steps, chunk=100, progress=None,
+                    quiescent_floor=1e-6, stop_when_absorbing=False):
+        """
+        Run the simulation, collecting the results of chunk steps at a
+        time into arrays
+
+        Parameters
+        ----------
+        steps : int
+            number of steps to run
+        chunk : int
+            number of steps per chunk
+        progress : callable
+            called after every chunk with the current day and the numbers
+            of steps done and requested
+        quiescent_floor : float
+            see run
+        stop_when_absorbing : bool
+            see run
+
+        Returns
+        -------
+        generator
+            dicts of arrays "day", "n_infected", "n_immune",
+            "mean_temperature" (chunk,) and "metrics" (arrays of the values
+            of each configured metric, stacked along a first axis; for
+            cumulative metrics only the value at the end of the chunk)
+        """
+        if self.temperature_ is None:
+            self.initialize_all()
+
+        done = 0
+        stopped = False
+        while done < steps and not stopped:
+            size = min(chunk, steps - done)
+            counts = np.zeros((size, 3), dtype=int)
+            mean_temperature = np.zeros(size)
+            measurements = {name: [] for name in self.metrics_}
+            n_steps = 0
+            for ii in range(size):
+                counts[ii] = self.step(quiescent_floor)
+                mean_temperature[ii] = self.temperature_.mean_temperature()
+                for name, value in self.measurements_.items():
+                    measurements[name].append(value)
+                n_steps += 1
+                if (stop_when_absorbing and self.quiescent_
+                        and counts[ii, 2] == 0):
+                    stopped = True
+                    break
+            done += n_steps
+
+            metrics = {}
+            for name, values in measurements.items():
+                if self.metrics_[name].cumulative:
+                    metrics[name] = np.asarray(values[-1])
+                else:
+                    metrics[name] = np.asarray(values)
+            if progress is not None:
+                progress(self.day_, done, steps)
+            yield {"day": counts[:n_steps, 0],
+                   "n_infected": counts[:n_steps, 1],
+                   "n_immune": counts[:n_steps, 2],
+                   "mean_temperature": mean_temperature[:n_steps],
+                   "metrics": metrics}
+
+    async def arun(self, steps, executor=None, **kwargs):
+        """
+        Run the simulation asynchronously: each step is computed in an
+        executor so the event loop stays responsive
+
+        Parameters
+        ----------
+        steps : int
+            number of steps to run
+        executor : concurrent.futures.Executor
+            executor in which to run the steps (default executor of the
+            event loop if None)
+        kwargs
+            passed to run
+
+        Returns
+        -------
+        async generator
+        """
+        loop = asyncio.get_running_loop()
+        generator = self.run(steps, **kwargs)
+        while True:
+            result = await loop.run_in_executor(executor, next,
+                                                generator, None)
+            if result is None:
+                return
+            yield result
+
+    def transmission_tree(self):
+        """
+        Export the transmission tree as a compact parent-index array
+
+        Returns
+        -------
+        parents : numpy.array of int
+            for each event in infections_, the index of the event of its
+            most probable source (-1 for seed infections and infections
+            due to the lingering field alone)
+        days : numpy.array of int
+            day of each event in infections_
+        """
+        parents = np.array([event["parent"] for event in self.infections_],
+                           dtype=int)
+        days = np.array([event["day"] for event in self.infections_],
+                        dtype=int)
+        return parents, days
+
+    def reproduction_numbers(self, window=1):
+        """
+        Compute the (case) reproduction number R_t: the mean number of
+        secondary infections caused by people infected on day t.  Values
+        for recent days are biased low since their offspring are not yet
+        complete.
+
+        Parameters
+        ----------
+        window : int
+            width (in days) of the window over which to pool cases
+
+        Returns
+        -------
+        days : numpy.array of int
+            first day of each window
+        r_t : numpy.array of float
+            mean number of offspring per case (nan if no cases)
+        """
+        parents, days = self.transmission_tree()
+        offspring = np.bincount(parents[parents >= 0],
+                                minlength=len(parents))
+        bins = np.arange(0, self.day_ + 1, window)
+        which = days // window
+        n_cases = np.bincount(which, minlength=len(bins))[:len(bins)]
+        n_offspring = np.bincount(which, weights=offspring,
+                                  minlength=len(bins))[:len(bins)]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            r_t = np.where(n_cases > 0, n_offspring / n_cases, np.nan)
+        return bins, r_t
 
     def __getitem__(self, item):
         return self.configuration.get(item, None)
@@ -190,8 +827,67 @@ class Infection:
         self.walls_ = []
         for wall_config in self.configuration["mobility"]["walls"]:
             self.walls_.append(Wall(**wall_config))
+        self.sync_temperature()
         return self
 
+    def sync_temperature(self):
+        """
+        Pass the field parameters of the configuration to the temperature
+        field (they apply from its next update)
+        """
+        if self.temperature_ is not None:
+            infect0 = self["infection"]
+            self.temperature_.hotspot_radius = infect0["hotspot_radius"]
+            self.temperature_.linger = infect0["linger"]
+            self.temperature_.intensity = infect0["infectiousness"]
+            if hasattr(self.temperature_, "threads"):
+                self.temperature_.threads = self["threads"]
+
+    def snapshot(self):
+        """
+        Serialize the full state of the simulation, including the state
+        of the global random generator
+
+        Returns
+        -------
+        bytes
+        """
+        return pickle.dumps((self, np.random.get_state()),
+                            protocol=pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def restore(snapshot):
+        """
+        Recreate a simulation from a snapshot (and restore the state of
+        the global random generator)
+
+        Parameters
+        ----------
+        snapshot : bytes
+            see Infection.snapshot
+
+        Returns
+        -------
+        Infection
+        """
+        infection, random_state = pickle.loads(snapshot)
+        np.random.set_state(random_state)
+        return infection
+
+    @staticmethod
+    def restore_random_state(snapshot):
+        """
+        Restore only the state of the global random generator saved in a
+        snapshot (the simulation itself is not recreated)
+
+        Parameters
+        ----------
+        snapshot : bytes
+            see Infection.snapshot
+        """
+        _, random_state = pickle.loads(snapshot)
+        np.random.set_state(random_state)
+
     def __repr__(self):
         return pformat({
             **self.configuration,
@@ -199,9 +895,9 @@ class Infection:
                 "state": {
                     "day": self.day_,
                     "temperature": self.temperature_,
-                    "n_infected": len(Person.infected_people(self.people_)),
-                    "n_immune": len(Person.immune_people(self.people_,
-                                                         self.temperature_))
+                    "n_infected": Person.infected_count(self.people_),
+                    "n_immune": Person.immune_count(self.people_,
+                                                    self.temperature_)
                 }
             }
         })
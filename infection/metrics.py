@@ -0,0 +1,343 @@
+"""
+-------------------------------------------------------
+Metrics evaluated inside the simulation loop
+-------------------------------------------------------
+Author:  Mark Fruman
+Email:   majorgowan@yahoo.com
+-------------------------------------------------------
+
+A metric is configured by name (or by {"name": ..., "params": {...}})
+in the "metrics" list of the configuration, e.g.
+
+    "metrics": ["mean_temperature",
+                {"name": "infection_heatmap", "params": {"bins": 25}}]
+
+and is evaluated after every step on a snapshot of the state shared by
+all metrics.  New metrics are added with the register_metric decorator.
+"""
+import numpy as np
+from pprint import pformat
+from infection.base import Person
+
+
+METRICS = {}
+
+
+def register_metric(name):
+    """
+    Class decorator adding a metric to the registry
+
+    Parameters
+    ----------
+    name : str
+        name by which the metric is configured
+    """
+    def decorator(cls):
+        cls.name = name
+        METRICS[name] = cls
+        return cls
+    return decorator
+
+
+class Metric:
+    """
+    Base class for metrics
+
+    Parameters
+    ----------
+    infection : Infection object
+        simulation in which the metric is evaluated
+
+    Attributes
+    ----------
+    cumulative : bool
+        if True, the value accumulates over the run and only its final
+        value is of interest (rather than the series)
+    """
+    name = None
+    cumulative = False
+
+    def __init__(self, infection):
+        pass
+
+    def __call__(self, infection, state):
+        """
+        Evaluate the metric
+
+        Parameters
+        ----------
+        infection : Infection object
+            simulation after the current step
+        state : dict
+            snapshot of the state of the people (see snapshot)
+
+        Returns
+        -------
+        float or numpy.array
+            (converted to lists only when exported)
+        """
+        raise NotImplementedError
+
+    def __repr__(self):
+        return pformat({"name": self.name, "cumulative": self.cumulative})
+
+
+def snapshot(infection):
+    """
+    Collect the state of the people as arrays (once per step, shared by
+    all metrics)
+
+    Parameters
+    ----------
+    infection : Infection object
+
+    Returns
+    -------
+    dict
+        with keys "positions", "health", "immunity", "infected",
+        "incubating" and the numbers of people represented by each agent
+        "weight", "infected_weight" and "recovered_weight" (see
+        SuperPerson)
+    """
+    people = infection.people_
+    return {
+        "positions": Person.positions(people).reshape(-1, 2),
+        "health": Person.healths(people),
+        "immunity": Person.immunities(people),
+        "infected": np.array([p.infected for p in people], dtype=bool),
+        "incubating": np.array([p.incubating for p in people], dtype=bool),
+        "weight": np.array([p.weight for p in people]),
+        "infected_weight": np.array([p.infected_weight for p in people]),
+        "recovered_weight": Person.recovered_weights(people)
+    }
+
+
+def build_metrics(infection, specs):
+    """
+    Instantiate the configured metrics
+
+    Parameters
+    ----------
+    infection : Infection object
+    specs : list
+        metric names or dicts with keys "name" and (optional) "params"
+
+    Returns
+    -------
+    dict
+        metric objects keyed by name
+    """
+    metrics = {}
+    for spec in specs or []:
+        if isinstance(spec, str):
+            spec = {"name": spec}
+        if spec["name"] not in METRICS:
+            raise KeyError(f"unknown metric {spec['name']!r}; "
+                           + f"choose from {', '.join(sorted(METRICS))}")
+        metrics[spec["name"]] = METRICS[spec["name"]](
+            infection, **spec.get("params", {}))
+    return metrics
+
+
+def evaluate_metrics(infection, metrics):
+    """
+    Evaluate metrics on the current state
+
+    Parameters
+    ----------
+    infection : Infection object
+    metrics : dict
+        metric objects keyed by name (see build_metrics)
+
+    Returns
+    -------
+    dict
+        metric values keyed by name
+    """
+    if not metrics:
+        return {}
+    state = snapshot(infection)
+    return {name: metric(infection, state)
+            for name, metric in metrics.items()}
+
+
+def wall_regions(walls):
+    """
+    Partition the unit square into the regions enclosed by the walls (e.g.
+    four regions for quadrants with walls across the whole square, but a
+    single region if the walls have gaps through which people can pass)
+
+    The square is divided into rectangular cells by the lines through the
+    walls and their ends, and neighbouring cells belong to the same region
+    unless the edge between them is covered by a wall.
+
+    Parameters
+    ----------
+    walls : list
+        Wall objects
+
+    Returns
+    -------
+    xcuts : numpy.array
+        x-coordinates of the boundaries between columns of cells
+    ycuts : numpy.array
+        y-coordinates of the boundaries between rows of cells
+    labels : numpy.array
+        (len(ycuts) + 1, len(xcuts) + 1) region of each cell (regions
+        numbered row by row from the bottom left)
+    """
+    xs, ys = set(), set()
+    for wall in walls:
+        if wall.orient == "v":
+            xs.add(wall.x)
+            ys.update(wall.y)
+        else:
+            ys.add(wall.y)
+            xs.update(wall.x)
+    xcuts = np.array(sorted(x for x in xs if 0 < x < 1), dtype=float)
+    ycuts = np.array(sorted(y for y in ys if 0 < y < 1), dtype=float)
+    # middles of the columns and rows of cells
+    xedges = np.concatenate([[0], xcuts, [1]])
+    yedges = np.concatenate([[0], ycuts, [1]])
+    xmiddles = (xedges[:-1] + xedges[1:]) / 2
+    ymiddles = (yedges[:-1] + yedges[1:]) / 2
+
+    def covered(orient, level, position):
+        # is the edge at level through position covered by a wall
+        for wall in walls:
+            if wall.orient != orient:
+                continue
+            wall_level, limits = ((wall.x, wall.y) if orient == "v"
+                                  else (wall.y, wall.x))
+            if wall_level == level and limits[0] <= position <= limits[1]:
+                return True
+        return False
+
+    # union-find over cells (indexed row * n_columns + column)
+    n_rows, n_columns = len(ycuts) + 1, len(xcuts) + 1
+    parent = list(range(n_rows * n_columns))
+
+    def find(cell):
+        while parent[cell] != cell:
+            parent[cell] = parent[parent[cell]]
+            cell = parent[cell]
+        return cell
+
+    for row in range(n_rows):
+        for column in range(n_columns):
+            cell = row * n_columns + column
+            if (column + 1 < n_columns
+                    and not covered("v", xcuts[column], ymiddles[row])):
+                parent[find(cell + 1)] = find(cell)
+            if (row + 1 < n_rows
+                    and not covered("h", ycuts[row], xmiddles[column])):
+                parent[find(cell + n_columns)] = find(cell)
+
+    # number regions in order of their first cell
+    numbers = {}
+    labels = np.array([numbers.setdefault(find(cell), len(numbers))
+                       for cell in range(n_rows * n_columns)])
+    return xcuts, ycuts, labels.reshape(n_rows, n_columns)
+
+
+@register_metric("mean_temperature")
+class MeanTemperature(Metric):
+    def __call__(self, infection, state):
+        return float(infection.temperature_.mean_temperature())
+
+
+@register_metric("max_temperature")
+class MaxTemperature(Metric):
+    def __call__(self, infection, state):
+        return float(infection.temperature_.max_temperature())
+
+
+@register_metric("health_histogram")
+class HealthHistogram(Metric):
+    """
+    Number of people in each of bins equal health intervals in [0, 1]
+    (the members of a super-individual who are not infected are in full
+    health)
+    """
+    def __init__(self, infection, bins=10):
+        super().__init__(infection)
+        self.edges = np.linspace(0, 1, bins + 1)
+
+    def __call__(self, infection, state):
+        infected = state["infected_weight"]
+        healthy = state["weight"] - infected
+        counts = (np.histogram(state["health"], bins=self.edges,
+                               weights=infected)[0]
+                  + np.histogram(np.ones_like(state["health"]),
+                                 bins=self.edges, weights=healthy)[0])
+        return np.rint(counts).astype(int)
+
+
+@register_metric("region_prevalence")
+class RegionPrevalence(Metric):
+    """
+    Fraction of people infected in each region delimited by the walls
+    (regions ordered row by row from the bottom left)
+    """
+    def __init__(self, infection):
+        super().__init__(infection)
+        self.xcuts, self.ycuts, self.labels = wall_regions(infection.walls_)
+        self.n_regions = int(self.labels.max()) + 1
+
+    def __call__(self, infection, state):
+        column = np.searchsorted(self.xcuts, state["positions"][:, 0])
+        row = np.searchsorted(self.ycuts, state["positions"][:, 1])
+        region = self.labels[row, column]
+        n_people = np.bincount(region, weights=state["weight"],
+                               minlength=self.n_regions)
+        n_infected = np.bincount(region, weights=state["infected_weight"],
+                                 minlength=self.n_regions)
+        with np.errstate(invalid="ignore"):
+            prevalence = np.where(n_people > 0, n_infected / n_people, 0.0)
+        return prevalence
+
+
+@register_metric("infected_density")
+class InfectedDensity(Metric):
+    """
+    Number of infected people in each cell of a bins x bins grid
+    (indexed [y, x])
+    """
+    def __init__(self, infection, bins=20):
+        super().__init__(infection)
+        self.bins = bins
+
+    def __call__(self, infection, state):
+        positions = state["positions"]
+        density = np.histogram2d(positions[:, 1], positions[:, 0],
+                                 bins=self.bins, range=[[0, 1], [0, 1]],
+                                 weights=state["infected_weight"])[0]
+        return np.rint(density).astype(int)
+
+
+@register_metric("infection_heatmap")
+class InfectionHeatmap(Metric):
+    """
+    Running count of new infections in each cell of a bins x bins grid
+    (indexed [y, x])
+    """
+    cumulative = True
+
+    def __init__(self, infection, bins=20):
+        super().__init__(infection)
+        self.bins = bins
+        self.heatmap_ = np.zeros((bins, bins), dtype=int)
+        self.n_seen_ = len(infection.infections_)
+
+    def __call__(self, infection, state):
+        events = infection.infections_[self.n_seen_:]
+        self.n_seen_ = len(infection.infections_)
+        if events:
+            x = np.array([event["x"] for event in events])
+            y = np.array([event["y"] for event in events])
+            # an event of a super-individual infects "weight" members
+            weights = np.array([event.get("weight", 1) for event in events])
+            self.heatmap_ += np.rint(np.histogram2d(
+                y, x, bins=self.bins, range=[[0, 1], [0, 1]],
+                weights=weights)[0]).astype(int)
+        return self.heatmap_.copy()
@@ -0,0 +1,374 @@
+"""
+-------------------------------------------------------
+Frozen reference implementation of the model kernels
+-------------------------------------------------------
+Author:  Mark Fruman
+Email:   majorgowan@yahoo.com
+-------------------------------------------------------
+
+Plain scalar copies of Wall.bounce, Person.move, Temperature.update and
+the infection draw of Infection.update_people, and of the simulation loop
+of Infection.run built on them, independent of the base classes and of
+Infection.  They define the behaviour that faster engines (and Infection
+itself) are checked against (see equivalence.py) and must not be
+optimized or changed.
+"""
+import string
+import numpy as np
+
+
+# characters of the identifiers drawn for each person (see
+# utils.random_string)
+ID_CHARACTERS = list(string.ascii_letters) + list(string.digits)
+
+
+def bounce(orient, x, y, pos1, pos2):
+    """
+    Landing point of the displacement pos1 -> pos2 after reflection from
+    a wall, or None if the displacement does not intersect the wall
+
+    Parameters
+    ----------
+    orient : str
+        either "h" or "v"
+    x : float or list
+        x coordinate(s) of wall
+    y : float or list
+        y coordinate(s) of wall
+    pos1 : list[float]
+        [x, y] coordinates of starting point
+    pos2 : list[float]
+        [x, y] coordinates of end point
+
+    Returns
+    -------
+    list or None
+    """
+    if orient == "h":
+        if min(pos1[1], pos2[1]) > y:
+            return None
+        if max(pos1[1], pos2[1]) < y:
+            return None
+        if max(pos1[0], pos2[0]) < x[0]:
+            return None
+        if min(pos1[0], pos2[0]) > x[1]:
+            return None
+        if pos1[1] != pos2[1]:
+            slope = (pos2[0] - pos1[0]) / (pos2[1] - pos1[1])
+            xwall = pos1[0] + slope * (y - pos1[1])
+            if not x[0] <= xwall <= x[1]:
+                return None
+        return [pos2[0], 2 * y - pos2[1]]
+    else:
+        if min(pos1[0], pos2[0]) > x:
+            return None
+        if max(pos1[0], pos2[0]) < x:
+            return None
+        if max(pos1[1], pos2[1]) < y[0]:
+            return None
+        if min(pos1[1], pos2[1]) > y[1]:
+            return None
+        if pos1[0] != pos2[0]:
+            slope = (pos2[1] - pos1[1]) / (pos2[0] - pos1[0])
+            ywall = pos1[1] + slope * (x - pos1[0])
+            if not y[0] <= ywall <= y[1]:
+                return None
+        return [2 * x - pos2[0], pos2[1]]
+
+
+def move(x, y, dx, dy, speed, walls):
+    """
+    Move one person (see Person.move)
+
+    Parameters
+    ----------
+    x, y : float
+        position
+    dx, dy : float
+        direction of motion
+    speed : float
+        current speed (mobility times health)
+    walls : list[tuple]
+        (orient, x, y) of each wall
+
+    Returns
+    -------
+    tuple
+        new x, y, dx, dy
+    """
+    vx = dx * speed
+    vy = dy * speed
+
+    pos1 = [x, y]
+    pos2 = [x + vx, y + vy]
+
+    for _ in range(2):
+        for orient, wx, wy in walls:
+            landing = bounce(orient, wx, wy, pos1, pos2)
+            if landing is not None:
+                pos2 = landing
+                if orient == "h":
+                    dy *= -1
+                else:
+                    dx *= -1
+
+    pos2[0] = pos2[0] % 1
+    pos2[1] = pos2[1] % 1
+    return pos2[0], pos2[1], dx, dy
+
+
+def temperature_update(xx, yy, temperature, x, y, infected, incubating,
+                       hotspot_radius, linger, intensity):
+    """
+    Update a temperature field (see Temperature.update)
+
+    Parameters
+    ----------
+    xx, yy : numpy.array
+        grid coordinates
+    temperature : numpy.array
+        current field
+    x, y : numpy.array
+        positions of people
+    infected, incubating : numpy.array of bool
+        status of people
+    hotspot_radius, linger, intensity : float
+        field parameters
+
+    Returns
+    -------
+    tuple of numpy.array
+        temperature, apparent temperature, gradx, grady
+    """
+    amplitude = intensity / (4 * np.pi) / hotspot_radius
+    ddx = xx[0, 1] - xx[0, 0]
+    ddy = yy[1, 0] - yy[0, 0]
+
+    temp0 = np.zeros(shape=temperature.shape)
+    for ii in range(len(x)):
+        if infected[ii] and not incubating[ii]:
+            dist2 = (xx - x[ii]) ** 2 + (yy - y[ii]) ** 2
+            temp0 += amplitude * np.exp(-0.5 * dist2 / hotspot_radius ** 2)
+
+    apparent = temp0.copy()
+
+    for ii in range(len(x)):
+        if infected[ii] and incubating[ii]:
+            dist2 = (xx - x[ii]) ** 2 + (yy - y[ii]) ** 2
+            temp0 += amplitude * np.exp(-0.5 * dist2 / hotspot_radius ** 2)
+    temperature = (linger * temperature + temp0) / (1.0 + linger)
+
+    gradx = np.zeros(shape=temperature.shape)
+    grady = np.zeros(shape=temperature.shape)
+    gradx[:, 1:-1] = -0.5 * (apparent[:, 2:] - apparent[:, :-2]) / ddx
+    grady[1:-1, :] = -0.5 * (apparent[2:, :] - apparent[:-2, :]) / ddy
+    return temperature, apparent, gradx, grady
+
+
+def infection_draw(local, immunity, infected, infectiousness, trial, draw,
+                   severity):
+    """
+    Indices of newly infected people given the uniform draws (see
+    Infection.update_people and Person.infect)
+
+    Parameters
+    ----------
+    local : numpy.array
+        temperature at each person's position
+    immunity : numpy.array
+        current immunity of each person
+    infected : numpy.array of bool
+        current infection status
+    infectiousness : float
+        probability of an infection attempt
+    trial, draw : numpy.array
+        uniform draws deciding the attempt and the infection
+    severity : numpy.array
+        severity of the disease if infected
+
+    Returns
+    -------
+    list[int]
+    """
+    new = []
+    for ii in range(len(local)):
+        immune = immunity[ii] > local[ii] + 0.1
+        if immune or infected[ii]:
+            continue
+        if trial[ii] < infectiousness:
+            if draw[ii] < severity[ii] * (local[ii] - immunity[ii]):
+                new.append(ii)
+    return new
+
+
+def random_value(values_obj, size=None):
+    """
+    Draw a configured value (see utils.random_choice)
+
+    Parameters
+    ----------
+    values_obj : list or dict or object
+        list to choose from, dict with the name "dist" and "params" of a
+        numpy.random distribution (absolute value taken), or fixed value
+    size : int
+        if specified, return size values
+
+    Returns
+    -------
+    number or object or list
+    """
+    if isinstance(values_obj, list):
+        return np.random.choice(values_obj, size=size)
+    if isinstance(values_obj, dict) and "dist" in values_obj:
+        params = {**values_obj.get("params"), **{"size": size}}
+        return np.abs(getattr(np.random, values_obj["dist"])(**params))
+    if size is not None:
+        return size * [values_obj]
+    return values_obj
+
+
+def simulate(configuration, steps, random_seed):
+    """
+    Run the model (see Infection.initialize_all and Infection.run) with the
+    global numpy random generator, drawing in the same order as Infection
+
+    Parameters
+    ----------
+    configuration : dict
+        full configuration; only "n_people", "gridsize" (an int),
+        "initial_infection_fraction", "infection" and "mobility" (the
+        original parameters of the model) are read
+    steps : int
+        number of steps to run
+    random_seed : int
+        seed for initializing random generator
+
+    Returns
+    -------
+    n_infected : numpy.array
+        number of people infected on each day
+    n_immune : numpy.array
+        number of people immune on each day
+    """
+    np.random.seed(random_seed)
+    n_people = configuration["n_people"]
+    infect0 = configuration["infection"]
+    mobility = configuration["mobility"]
+    walls = [(wall["orient"], wall["x"], wall["y"])
+             for wall in mobility["walls"]]
+
+    # people
+    positions = np.random.random(size=(n_people, 2))
+    speeds = random_value(mobility["speed"], size=n_people)
+    directions = 2 * np.pi * np.random.random(size=n_people)
+    x, y, dx, dy = [], [], [], []
+    full_immunity, hypochondria = [], []
+    for position, direction in zip(positions, directions):
+        full_immunity.append(random_value(infect0["immunity"]))
+        hypochondria.append(random_value(mobility["hypochondria"]))
+        np.random.choice(ID_CHARACTERS, 8)
+        x.append(position[0])
+        y.append(position[1])
+        dx.append(np.cos(direction))
+        dy.append(np.sin(direction))
+    health = [1] * n_people
+    incubation = [0] * n_people
+    severity = [0] * n_people
+    healing_rate = [None] * n_people
+    immunity = [0] * n_people
+    infected = [False] * n_people
+    incubating = [False] * n_people
+
+    def infect(ii, incubation0, healing_rate0, severity0):
+        severity[ii] = max(1.0, severity0)
+        healing_rate[ii] = healing_rate0
+        incubation[ii] = incubation0
+        incubating[ii] = True
+        infected[ii] = True
+
+    n_initial = int(configuration["initial_infection_fraction"] * n_people)
+    for ii in np.random.choice(a=np.arange(n_people), size=n_initial):
+        incubation0 = random_value(infect0["incubation"])
+        severity0 = random_value(infect0["severity"])
+        healing_rate0 = random_value(infect0["healing_rate"])
+        infect(ii, incubation0, healing_rate0, severity0)
+
+    # temperature
+    gridsize = configuration["gridsize"]
+    buffer_width = 1 / gridsize
+    line = np.linspace(-1 * buffer_width, 1 + buffer_width, gridsize)
+    xx, yy = np.meshgrid(line, line)
+    temperature = np.zeros(shape=xx.shape)
+    gradx = np.zeros(shape=xx.shape)
+    grady = np.zeros(shape=xx.shape)
+
+    def grid_index(ii):
+        return (int(np.searchsorted(line, y[ii], side="left")),
+                int(np.searchsorted(line, x[ii], side="left")))
+
+    n_infected = np.zeros(steps, dtype=int)
+    n_immune = np.zeros(steps, dtype=int)
+    for day in range(1, steps + 1):
+        infectiousness = infect0["infectiousness"]
+        if infect0["seasonality"] > 0:
+            infectiousness = (infectiousness
+                              * (1 + infect0["seasonality"]
+                                 * np.cos(2 * np.pi * day / 365)))
+
+        # health
+        for ii in range(n_people):
+            if incubating[ii]:
+                incubation[ii] -= 1
+                if incubation[ii] < 0.01:
+                    incubating[ii] = False
+                    health[ii] = max(0.0, 1.0 - severity[ii])
+            elif infected[ii]:
+                health[ii] += healing_rate[ii] * (1 - health[ii])
+                if health[ii] >= 0.9:
+                    health[ii] = 1.0
+                    infected[ii] = False
+                    immunity[ii] = full_immunity[ii]
+            else:
+                immunity[ii] = max(0.0, immunity[ii] - 0.01)
+
+        # infections
+        local = [temperature[grid_index(ii)] for ii in range(n_people)]
+        susceptible = [ii for ii in range(n_people)
+                       if not immunity[ii] > local[ii] + 0.1
+                       and not infected[ii]]
+        for ii in susceptible:
+            if np.random.random() < infectiousness:
+                incubation0 = random_value(infect0["incubation"])
+                severity0 = random_value(infect0["severity"])
+                healing_rate0 = random_value(infect0["healing_rate"])
+                if (np.random.random()
+                        < severity0 * (local[ii] - immunity[ii])):
+                    infect(ii, incubation0, healing_rate0, severity0)
+
+        # acceleration away from hotspots and movement
+        for ii in range(n_people):
+            if not infected[ii]:
+                length0 = np.sqrt(dx[ii] ** 2 + dy[ii] ** 2)
+                index = grid_index(ii)
+                dx[ii] += hypochondria[ii] * gradx[index]
+                dy[ii] += hypochondria[ii] * grady[index]
+                length = np.sqrt(dx[ii] ** 2 + dy[ii] ** 2)
+                if length > 0:
+                    dx[ii] *= length0 / length
+                    dy[ii] *= length0 / length
+        for ii in range(n_people):
+            x[ii], y[ii], dx[ii], dy[ii] = move(
+                x[ii], y[ii], dx[ii], dy[ii], speeds[ii] * health[ii],
+                walls)
+
+        temperature, _, gradx, grady = temperature_update(
+            xx, yy, temperature, np.array(x), np.array(y),
+            np.array(infected), np.array(incubating),
+            infect0["hotspot_radius"], infect0["linger"],
+            infect0["infectiousness"])
+
+        n_infected[day - 1] = sum(infected)
+        n_immune[day - 1] = sum(immunity[ii]
+                                > temperature[grid_index(ii)] + 0.1
+                                for ii in range(n_people))
+    return n_infected, n_immune
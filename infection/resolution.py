@@ -0,0 +1,204 @@
+"""
+-------------------------------------------------------
+Automatic resolution of the temperature grid
+-------------------------------------------------------
+Author:  Mark Fruman
+Email:   majorgowan@yahoo.com
+-------------------------------------------------------
+
+People sample the grid temperature at the first grid point at or beyond
+their position (Temperature.value_at), and the gradient is a centred
+difference on the grid, so both are in error by an amount depending only
+on the ratio of the grid spacing to hotspot_radius.  The error is
+estimated from a single hotspot: the sampled temperature and gradient at
+random positions within a few radii of the hotspot are compared with the
+exact gaussian, relative to the peak temperature and peak gradient of the
+hotspot (root mean square over the positions).
+
+The cost of a field update is proportional to gridsize ** 2, so
+"gridsize": "auto" picks the coarsest of a few candidate grids with errors
+within "gridsize_tolerance", but no finer than "gridsize_maximum" (by
+default the default gridsize, 200), which has to be raised explicitly when
+the tolerance demands a finer grid.
+"""
+import numpy as np
+from functools import lru_cache
+
+
+# gridsize with which the errors and costs of automatic grids are compared
+# when the configured gridsize is "auto"
+REFERENCE_GRIDSIZE = 200
+
+# gridsizes considered by "gridsize": "auto"
+CANDIDATE_GRIDSIZES = (25, 50, 75, 100, 125, 150, 200, 250, 300, 400, 500,
+                       600, 800, 1000, 1500, 2000)
+
+
+@lru_cache(maxsize=None)
+def _samples(n_samples, random_seed):
+    # hotspot centres and positions relative to them (in hotspot radii)
+    rng = np.random.default_rng(random_seed)
+    centres = rng.random((n_samples, 2))
+    offsets = rng.uniform(-3, 3, size=(n_samples, 2))
+    return centres, offsets
+
+
+def resolution_error(gridsize, hotspot_radius, n_samples=4000,
+                     random_seed=0):
+    """
+    Estimate the relative errors of the temperature and gradient sampled
+    on a grid
+
+    Parameters
+    ----------
+    gridsize : int
+        number of points in each direction
+    hotspot_radius : float
+        gaussian width of hotspot
+    n_samples : int
+        number of sampled positions
+    random_seed : int
+        seed of hotspot centres and positions
+
+    Returns
+    -------
+    temperature_error : float
+        root mean square error relative to the peak temperature
+    gradient_error : float
+        root mean square error (of the gradient vector) relative to the
+        peak gradient
+    """
+    centres, offsets = _samples(n_samples, random_seed)
+    positions = centres + hotspot_radius * offsets
+    # people are confined to the unit square
+    inside = np.all((positions >= 0) & (positions <= 1), axis=1)
+    centres, positions = centres[inside], positions[inside]
+    # grid line of grid_coordinates (without building the 2-d grid)
+    buffer_width = 1 / gridsize
+    grid = np.linspace(-buffer_width, 1 + buffer_width, gridsize)
+    spacing = grid[1] - grid[0]
+
+    # grid point at or beyond each position (as in Temperature.value_at)
+    index = np.clip(np.searchsorted(grid, positions, side="left"),
+                    1, gridsize - 2)
+    points = grid[index]
+
+    def hotspot(xy):
+        dist2 = ((xy - centres) ** 2).sum(axis=-1)
+        return np.exp(-0.5 * dist2 / hotspot_radius ** 2)
+
+    exact = hotspot(positions)
+    sampled = hotspot(points)
+    temperature_error = np.sqrt(np.mean((sampled - exact) ** 2))
+
+    exact_gradient = ((positions - centres) / hotspot_radius ** 2
+                      * exact[:, None])
+    sampled_gradient = np.zeros_like(exact_gradient)
+    for axis in (0, 1):
+        step = np.zeros(2)
+        step[axis] = spacing
+        sampled_gradient[:, axis] = -0.5 * (hotspot(points + step)
+                                            - hotspot(points - step)) / spacing
+    peak_gradient = np.exp(-0.5) / hotspot_radius
+    gradient_error = (np.sqrt(np.mean(((sampled_gradient - exact_gradient)
+                                       ** 2).sum(axis=-1)))
+                      / peak_gradient)
+    return float(temperature_error), float(gradient_error)
+
+
+@lru_cache(maxsize=None)
+def auto_gridsize(hotspot_radius, tolerance=0.05,
+                  maximum=REFERENCE_GRIDSIZE):
+    """
+    Coarsest of the CANDIDATE_GRIDSIZES whose temperature and gradient
+    errors are within the tolerance (see resolution_error).  The errors
+    do not decrease monotonically with gridsize (the positions sampled
+    fall differently on each grid), so every candidate is checked from
+    the coarsest rather than bisecting.
+
+    Parameters
+    ----------
+    hotspot_radius : float
+        gaussian width of hotspot
+    tolerance : float
+        largest relative error
+    maximum : int
+        largest gridsize (returned if no coarser candidate is accurate
+        enough)
+
+    Returns
+    -------
+    int
+    """
+    for gridsize in CANDIDATE_GRIDSIZES:
+        if gridsize >= maximum:
+            break
+        if max(resolution_error(gridsize, hotspot_radius)) <= tolerance:
+            return gridsize
+    return maximum
+
+
+def resolve_gridsize(configuration):
+    """
+    Gridsize of a configuration, choosing it if it is "auto"
+
+    Parameters
+    ----------
+    configuration : dict
+        full configuration (with gridsize, gridsize_tolerance,
+        gridsize_maximum and infection.hotspot_radius)
+
+    Returns
+    -------
+    int
+    """
+    gridsize = configuration["gridsize"]
+    if gridsize == "auto":
+        return auto_gridsize(configuration["infection"]["hotspot_radius"],
+                             configuration["gridsize_tolerance"],
+                             configuration["gridsize_maximum"])
+    return int(gridsize)
+
+
+def resolution_report(configuration, reference=None):
+    """
+    Errors of the grid of a configuration and its cost compared with a
+    reference grid
+
+    Parameters
+    ----------
+    configuration : dict
+        full configuration
+    reference : int
+        gridsize to compare with (the configured gridsize, or
+        REFERENCE_GRIDSIZE if that is "auto")
+
+    Returns
+    -------
+    dict
+    """
+    hotspot_radius = configuration["infection"]["hotspot_radius"]
+    gridsize = resolve_gridsize(configuration)
+    if reference is None:
+        reference = (REFERENCE_GRIDSIZE if configuration["gridsize"] == "auto"
+                     else int(configuration["gridsize"]))
+    temperature_error, gradient_error = resolution_error(gridsize,
+                                                         hotspot_radius)
+    reference_errors = resolution_error(reference, hotspot_radius)
+    # hotspot evaluations per update scale with the number of grid points
+    cost_ratio = gridsize ** 2 / reference ** 2
+    return {
+        "hotspot_radius": hotspot_radius,
+        "tolerance": configuration["gridsize_tolerance"],
+        "gridsize": gridsize,
+        "temperature_error": temperature_error,
+        "gradient_error": gradient_error,
+        "within_tolerance": (max(temperature_error, gradient_error)
+                             <= configuration["gridsize_tolerance"]),
+        "reference_gridsize": reference,
+        "reference_temperature_error": reference_errors[0],
+        "reference_gradient_error": reference_errors[1],
+        "cost_ratio": cost_ratio,
+        "cost_saved": 1 - cost_ratio
+    }
+
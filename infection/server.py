@@ -0,0 +1,340 @@
+"""
+-------------------------------------------------------
+Live-streaming server for simulation state
+-------------------------------------------------------
+Author:  Mark Fruman
+Email:   majorgowan@yahoo.com
+-------------------------------------------------------
+
+Messages are newline-delimited json over TCP.  The server sends
+
+    {"type": "stats", "day": ..., "n_infected": ..., "n_immune": ...,
+     "mean_temperature": ...}
+
+after every step (with a decimated "frame" added every frame_every
+steps, and the values of the configured "metrics" if run with
+with_metrics) and {"type": "done", "day": ...} when the run ends.  Clients may
+send {"command": "pause"}, {"command": "resume"}, {"command": "step"} or
+{"command": "stop"}.
+
+A slow client never blocks the simulation: each subscriber only keeps
+the latest unsent message, older ones are dropped.
+"""
+import json
+import asyncio
+import numpy as np
+from pprint import pformat
+from infection.base import Person
+
+
+class Subscriber:
+    """
+    Class representing a connected client holding only the latest
+    unsent message
+
+    Parameters
+    ----------
+    writer : asyncio.StreamWriter
+        stream to the client
+    """
+    def __init__(self, writer):
+        self.writer = writer
+        self.latest_ = None
+        self.ready_ = asyncio.Event()
+        self.sent_ = 0
+        self.dropped_ = 0
+
+    def push(self, message):
+        """
+        Replace the pending message (never blocks)
+
+        Parameters
+        ----------
+        message : dict
+            message to send
+        """
+        if self.latest_ is not None:
+            self.dropped_ += 1
+        self.latest_ = message
+        self.ready_.set()
+
+    async def send_loop(self):
+        """
+        Send pending messages as fast as the client reads them
+        """
+        while True:
+            await self.ready_.wait()
+            self.ready_.clear()
+            message, self.latest_ = self.latest_, None
+            if message is None:
+                continue
+            self.writer.write((json.dumps(message) + "\n").encode())
+            await self.writer.drain()
+            self.sent_ += 1
+
+
+class SimulationServer:
+    """
+    Class representing a local server pushing simulation state to
+    subscribers
+
+    Parameters
+    ----------
+    infection : Infection object
+        simulation to run and stream
+    steps : int
+        number of steps to run
+    host : str
+        address to bind
+    port : int
+        port to bind (0 for any free port)
+    frame_every : int
+        number of steps between frames (0 for no frames)
+    decimation : int
+        stride with which to subsample the temperature field in frames
+    paused : bool
+        if set, wait for a "resume" or "step" command before the first step
+    run_kwargs : dict
+        keyword arguments passed to Infection.run (with "with_metrics" the
+        metric values are added to the messages)
+    """
+    def __init__(self, infection, steps, host="127.0.0.1", port=0,
+                 frame_every=10, decimation=4, paused=False,
+                 run_kwargs=None):
+        self.infection = infection
+        self.steps = steps
+        self.host = host
+        self.port = port
+        self.frame_every = frame_every
+        self.decimation = decimation
+        self.run_kwargs = run_kwargs or {}
+        self.subscribers_ = []
+        self.handlers_ = set()
+        self.server_ = None
+        self.paused_ = paused
+        self.stopped_ = False
+        self.step_budget_ = 0
+        self.wakeup_ = None
+
+    async def start(self):
+        """
+        Bind the server and start accepting subscribers
+
+        Returns
+        -------
+        SimulationServer
+        """
+        self.wakeup_ = asyncio.Event()
+        self.server_ = await asyncio.start_server(self.handle_client,
+                                                  self.host, self.port)
+        self.port = self.server_.sockets[0].getsockname()[1]
+        return self
+
+    async def handle_client(self, reader, writer):
+        subscriber = Subscriber(writer)
+        self.subscribers_.append(subscriber)
+        self.handlers_.add(asyncio.current_task())
+        sender = asyncio.ensure_future(subscriber.send_loop())
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    command = json.loads(line).get("command")
+                except (ValueError, AttributeError):
+                    continue
+                self.command(command)
+        except ConnectionError:
+            pass
+        finally:
+            sender.cancel()
+            self.subscribers_.remove(subscriber)
+            self.handlers_.discard(asyncio.current_task())
+            writer.close()
+
+    def command(self, command):
+        """
+        Apply a control command
+
+        Parameters
+        ----------
+        command : str
+            one of "pause", "resume", "step" or "stop"
+        """
+        if command == "pause":
+            self.paused_ = True
+        elif command == "resume":
+            self.paused_ = False
+        elif command == "step":
+            self.paused_ = True
+            self.step_budget_ += 1
+        elif command == "stop":
+            self.stopped_ = True
+        self.wakeup_.set()
+
+    async def wait_turn(self):
+        """
+        Wait until the simulation is allowed to take its next step
+
+        Returns
+        -------
+        bool
+            False if the simulation has been stopped
+        """
+        while (self.paused_ and self.step_budget_ == 0
+               and not self.stopped_):
+            self.wakeup_.clear()
+            await self.wakeup_.wait()
+        if self.paused_ and self.step_budget_ > 0:
+            self.step_budget_ -= 1
+        return not self.stopped_
+
+    def state_message(self, day, n_infected, n_immune, metrics=None):
+        """
+        Build the message describing the current state
+
+        Parameters
+        ----------
+        day : int
+        n_infected : int
+        n_immune : int
+        metrics : dict
+            values of the metrics (see Infection.run with with_metrics)
+
+        Returns
+        -------
+        dict
+        """
+        message = {
+            "type": "stats",
+            "day": int(day),
+            "n_infected": int(n_infected),
+            "n_immune": int(n_immune),
+            "mean_temperature": float(
+                self.infection.temperature_.mean_temperature())
+        }
+        if metrics is not None:
+            message["metrics"] = {name: np.asarray(value).tolist()
+                                  for name, value in metrics.items()}
+        if self.frame_every and not day % self.frame_every:
+            temperature = self.infection.temperature_.temperature
+            people = self.infection.people_
+            step = self.decimation
+            message["frame"] = {
+                "temperature": np.round(temperature[::step, ::step],
+                                        4).tolist(),
+                "positions": np.round(Person.positions(people),
+                                      4).tolist(),
+                "infected": [bool(p.infected) for p in people]
+            }
+        return message
+
+    def publish(self, message):
+        for subscriber in self.subscribers_:
+            subscriber.push(message)
+
+    async def simulate(self):
+        """
+        Run the simulation, publishing the state after every step
+        """
+        generator = self.infection.arun(self.steps, **self.run_kwargs)
+        try:
+            while await self.wait_turn():
+                try:
+                    result = await generator.__anext__()
+                except StopAsyncIteration:
+                    break
+                # with_metrics appends the metric values to the result
+                self.publish(self.state_message(*result))
+        finally:
+            await generator.aclose()
+        self.publish({"type": "done", "day": int(self.infection.day_)})
+
+    async def close(self):
+        """
+        Stop accepting subscribers and disconnect existing ones
+        """
+        # give subscribers a chance to receive their last message
+        await asyncio.sleep(0)
+        self.server_.close()
+        for subscriber in list(self.subscribers_):
+            subscriber.writer.close()
+        # let the client handlers see the end of their streams
+        await asyncio.gather(*self.handlers_, return_exceptions=True)
+        await self.server_.wait_closed()
+
+    async def serve(self):
+        """
+        Start, run the simulation to completion and close
+        """
+        await self.start()
+        try:
+            await self.simulate()
+        finally:
+            await self.close()
+
+    def __repr__(self):
+        return pformat(
+            {
+                "host": self.host,
+                "port": self.port,
+                "steps": self.steps,
+                "paused": self.paused_,
+                "n_subscribers": len(self.subscribers_)
+            }
+        )
+
+
+async def subscribe(host, port):
+    """
+    Connect to a simulation server
+
+    Parameters
+    ----------
+    host : str
+        address of server
+    port : int
+        port of server
+
+    Returns
+    -------
+    reader : asyncio.StreamReader
+        stream of messages (see receive)
+    writer : asyncio.StreamWriter
+        stream for commands (see send_command)
+    """
+    return await asyncio.open_connection(host, port)
+
+
+async def receive(reader):
+    """
+    Read the next message from a simulation server
+
+    Parameters
+    ----------
+    reader : asyncio.StreamReader
+
+    Returns
+    -------
+    dict or None
+        None if the connection has closed
+    """
+    line = await reader.readline()
+    if not line:
+        return None
+    return json.loads(line)
+
+
+async def send_command(writer, command):
+    """
+    Send a control command to a simulation server
+
+    Parameters
+    ----------
+    writer : asyncio.StreamWriter
+    command : str
+        one of "pause", "resume", "step" or "stop"
+    """
+    writer.write((json.dumps({"command": command}) + "\n").encode())
+    await writer.drain()
@@ -0,0 +1,399 @@
+"""
+-------------------------------------------------------
+Mean-field SEIRS surrogate of the agent model
+-------------------------------------------------------
+Author:  Mark Fruman
+Email:   majorgowan@yahoo.com
+-------------------------------------------------------
+
+The surrogate is a discrete-time (one step per day) SEIRS model with
+rates derived from the configuration:
+
+    - a susceptible person (immunity 0) at a uniformly random position
+      can be infected wherever the hotspot of an infected person
+      (incubating or not) is warm, since the immunity threshold (0.1)
+      only protects recovered people; integrating the infection
+      probability severity * temperature over the whole gaussian hotspot
+      (2 pi hotspot_radius ** 2 times its peak) and multiplying by the
+      (seasonal) infectiousness of the draw gives the transmission rate
+      per infected person, and n_people / area gives the density
+    - the incubation and recovery rates are the inverse mean numbers of
+      steps of the incubation countdown and of healing (from health 0 to
+      0.9 at healing_rate)
+    - immunity is lost once it has decayed (by 0.01 per step) from the
+      full immunity to the threshold (the only place the threshold
+      enters: recovered people then return to the susceptible
+      compartment)
+
+As in the agent model, people stay in each of the exposed, infectious
+and recovered compartments for a fixed number of steps (the inverse of
+the rate, rounded), rather than leaving at a constant rate.
+
+Mixing in the agent model is far from uniform (walls, avoidance of
+hotspots), so the rates can be rescaled by factors calibrated against a
+few agent runs.  Runs of many configurations are vectorized.
+"""
+import copy
+import numpy as np
+from pprint import pformat
+from infection.base.health_queue import healing_trajectory, incubation_steps
+from infection.diagnostics import epidemic_curves
+from infection.infection import Infection
+from infection.utils import random_choice
+
+
+# immunity margin above the local temperature (see Person.immune)
+IMMUNITY_THRESHOLD = 0.1
+# rates that can be rescaled by calibration
+RATES = ("beta", "sigma", "gamma", "omega")
+
+
+def expected(spec, function=float, n_samples=4096):
+    """
+    Mean of a function of a (possibly random) configuration value
+
+    Parameters
+    ----------
+    spec : number or list or dict
+        value specification (see random_choice)
+    function : callable
+        function of a single value
+    n_samples : int
+        number of samples of a random value
+
+    Returns
+    -------
+    float
+    """
+    if not isinstance(spec, (list, dict)):
+        return float(function(spec))
+    samples = random_choice(spec, size=n_samples,
+                            rng=np.random.default_rng(0))
+    return float(np.mean([function(float(value)) for value in samples]))
+
+
+def seirs_parameters(configuration):
+    """
+    Derive the parameters of the surrogate from a configuration
+
+    Parameters
+    ----------
+    configuration : dict
+        configuration (merged with the defaults)
+
+    Returns
+    -------
+    dict
+        "n_people", "exposed" (initially infected), "beta" (transmission
+        probability per infected and susceptible person per step),
+        "sigma" (end of incubation), "gamma" (recovery) and "omega" (loss
+        of immunity) rates per step, and "seasonality"
+    """
+    merged = Infection(**copy.deepcopy(configuration)).configuration
+    infect0 = merged["infection"]
+    n_people = merged["n_people"]
+    radius = expected(infect0["hotspot_radius"])
+    infectiousness = expected(infect0["infectiousness"])
+
+    # peak temperature of a hotspot and the integral of the temperature
+    # over the whole hotspot (susceptible people have no immunity)
+    peak = infectiousness / (4 * np.pi) / radius
+    hot_integral = 2 * np.pi * radius ** 2 * peak
+    beta = (infectiousness * expected(infect0["severity"]) * hot_integral)
+
+    sigma = 1.0 / expected(infect0["incubation"], incubation_steps)
+
+    def recovery_steps(healing_rate):
+        _, steps = healing_trajectory(0.0, healing_rate)
+        return np.inf if steps is None else steps
+
+    gamma = 1.0 / expected(infect0["healing_rate"], recovery_steps)
+
+    def waning_steps(immunity):
+        return max(immunity - IMMUNITY_THRESHOLD, 0.0) / 0.01
+
+    omega = 1.0 / max(expected(infect0["immunity"], waning_steps), 1.0)
+
+    return {
+        "n_people": n_people,
+        "exposed": int(merged["initial_infection_fraction"] * n_people),
+        "beta": beta,
+        "sigma": sigma,
+        "gamma": gamma,
+        "omega": omega,
+        "seasonality": expected(infect0["seasonality"])
+    }
+
+
+class SEIRSSurrogate:
+    """
+    Class representing a mean-field SEIRS surrogate of the agent model
+
+    Parameters
+    ----------
+    scales : dict
+        factors by which to rescale the derived rates ("beta", "sigma",
+        "gamma", "omega"; 1 if missing)
+    """
+    def __init__(self, scales=None):
+        self.scales = {rate: 1.0 for rate in RATES}
+        self.scales.update(scales or {})
+        self.calibration_ = None
+
+    def parameters(self, configurations):
+        """
+        Rescaled parameters of several configurations
+
+        Parameters
+        ----------
+        configurations : list[dict]
+
+        Returns
+        -------
+        dict
+            arrays of parameters (see seirs_parameters)
+        """
+        parameters = [seirs_parameters(configuration)
+                      for configuration in configurations]
+        arrays = {key: np.array([p[key] for p in parameters], dtype=float)
+                  for key in parameters[0]}
+        for rate in RATES:
+            arrays[rate] = arrays[rate] * self.scales[rate]
+        return arrays
+
+    def integrate(self, parameters, steps, extinction=0.5):
+        """
+        Run the surrogate for arrays of parameters (broadcast together)
+
+        Parameters
+        ----------
+        parameters : dict
+            arrays of parameters (see parameters)
+        steps : int
+            number of steps to run
+        extinction : float
+            expected number of infected people below which no further
+            infections occur (the outbreak has died out, as it does in a
+            finite population)
+
+        Returns
+        -------
+        dict
+            "days" (steps,), "n_infected" (exposed and infectious) and
+            "n_immune" (..., steps) expected counts
+        """
+        shape = np.broadcast(*parameters.values()).shape
+        values = {key: np.broadcast_to(value, shape)
+                  for key, value in parameters.items()}
+        beta = values["beta"]
+        seasonality = values["seasonality"]
+        # residence times in each compartment
+        delays = {compartment: np.maximum(
+                      1, np.round(1.0 / values[rate])).astype(int)
+                  for compartment, rate in (("exposed", "sigma"),
+                                            ("infectious", "gamma"),
+                                            ("recovered", "omega"))}
+
+        # inflow into each compartment on each day (day 0: seeds)
+        inflows = {compartment: np.zeros(shape + (steps + 1,))
+                   for compartment in delays}
+        inflows["exposed"][..., 0] = values["exposed"]
+        counts = {compartment: inflows[compartment][..., 0].copy()
+                  for compartment in delays}
+        susceptible = values["n_people"] - counts["exposed"]
+
+        def outflow(compartment, day):
+            past = day - delays[compartment]
+            flow = np.take_along_axis(inflows[compartment],
+                                      np.maximum(past, 0)[..., None],
+                                      axis=-1)[..., 0]
+            return np.where(past >= 0, flow, 0.0)
+
+        n_infected = np.zeros(shape + (steps,))
+        n_immune = np.zeros(shape + (steps,))
+        for day in range(1, steps + 1):
+            # health is updated before the infection draw (as in
+            # Infection.update_people)
+            onset = outflow("exposed", day)
+            recovery = outflow("infectious", day)
+            waning = outflow("recovered", day)
+            inflows["infectious"][..., day] = onset
+            inflows["recovered"][..., day] = recovery
+            counts["exposed"] = counts["exposed"] - onset
+            counts["infectious"] = counts["infectious"] + onset - recovery
+            counts["recovered"] = counts["recovered"] + recovery - waning
+            susceptible = susceptible + waning
+
+            infected = counts["exposed"] + counts["infectious"]
+            force = (beta * (1 + seasonality * np.cos(2 * np.pi * day / 365))
+                     * np.where(infected >= extinction, infected, 0.0))
+            infection = susceptible * -np.expm1(-np.maximum(force, 0.0))
+            susceptible = susceptible - infection
+            inflows["exposed"][..., day] = infection
+            counts["exposed"] = counts["exposed"] + infection
+
+            n_infected[..., day - 1] = (counts["exposed"]
+                                        + counts["infectious"])
+            n_immune[..., day - 1] = counts["recovered"]
+
+        return {"days": np.arange(1, steps + 1),
+                "n_infected": n_infected,
+                "n_immune": n_immune}
+
+    def run(self, configurations, steps):
+        """
+        Run the surrogate for several configurations
+
+        Parameters
+        ----------
+        configurations : list[dict]
+        steps : int
+            number of steps to run
+
+        Returns
+        -------
+        dict
+            see integrate
+        """
+        return self.integrate(self.parameters(configurations), steps)
+
+    def calibrate(self, configurations, steps, random_seeds=(0, 1, 2),
+                  fit=("beta", "gamma"), agent_curves=None, n_grid=25,
+                  n_refine=3):
+        """
+        Fit the rate scales to the mean curves of agent runs (log-grid
+        search, refined around the best point)
+
+        Parameters
+        ----------
+        configurations : list[dict]
+            configurations of the agent runs
+        steps : int
+            number of steps to run
+        random_seeds : list[int]
+            seeds of the agent runs of each configuration
+        fit : list[str]
+            rates whose scales are fitted
+        agent_curves : dict
+            mean curves of the agent runs (see agent_curves; computed if
+            None)
+        n_grid : int
+            number of grid points per fitted rate
+        n_refine : int
+            number of refinements of the grid
+
+        Returns
+        -------
+        SEIRSSurrogate
+        """
+        if agent_curves is None:
+            agent_curves = mean_agent_curves(configurations, steps,
+                                             random_seeds)
+        base = self.parameters(configurations)
+        center = {rate: np.log(self.scales[rate]) for rate in fit}
+        width = np.log(100.0)
+        for _ in range(n_refine):
+            axes = [np.linspace(center[rate] - width, center[rate] + width,
+                                n_grid) for rate in fit]
+            grid = np.meshgrid(*axes, indexing="ij")
+            # evaluate every grid point for every configuration at once
+            parameters = {key: value * np.ones(grid[0].shape + (1,))
+                          for key, value in base.items()}
+            for rate, log_scale in zip(fit, grid):
+                parameters[rate] = (parameters[rate]
+                                    * np.exp(log_scale)[..., None]
+                                    / self.scales[rate])
+            curves = self.integrate(parameters, steps)
+            loss = squared_error(curves, agent_curves, base["n_people"])
+            best = np.unravel_index(np.argmin(loss), loss.shape)
+            center = {rate: axis[index]
+                      for rate, axis, index in zip(fit, axes, best)}
+            width = 2 * width / (n_grid - 1)
+
+        self.scales.update({rate: float(np.exp(center[rate]))
+                            for rate in fit})
+        self.calibration_ = self.error(configurations, steps,
+                                       agent_curves=agent_curves)
+        return self
+
+    def error(self, configurations, steps, random_seeds=(0, 1, 2),
+              agent_curves=None):
+        """
+        Compare the surrogate with the mean curves of agent runs
+
+        Parameters
+        ----------
+        configurations : list[dict]
+        steps : int
+            number of steps to run
+        random_seeds : list[int]
+            seeds of the agent runs of each configuration
+        agent_curves : dict
+            mean curves of the agent runs (computed if None)
+
+        Returns
+        -------
+        dict
+            root mean square errors of the infected and immune fractions,
+            and errors of the peak infected fraction, of the day of the
+            peak and of the final immune fraction, per configuration
+        """
+        if agent_curves is None:
+            agent_curves = mean_agent_curves(configurations, steps,
+                                             random_seeds)
+        curves = self.run(configurations, steps)
+        n_people = np.array([seirs_parameters(c)["n_people"]
+                             for c in configurations])[:, None]
+        infected = curves["n_infected"] / n_people
+        immune = curves["n_immune"] / n_people
+        agent_infected = agent_curves["n_infected"] / n_people
+        agent_immune = agent_curves["n_immune"] / n_people
+        return {
+            "rmse_infected": np.sqrt(np.mean((infected - agent_infected) ** 2,
+                                             axis=1)).tolist(),
+            "rmse_immune": np.sqrt(np.mean((immune - agent_immune) ** 2,
+                                           axis=1)).tolist(),
+            "peak_error": (infected.max(axis=1)
+                           - agent_infected.max(axis=1)).tolist(),
+            "peak_day_error": (infected.argmax(axis=1)
+                               - agent_infected.argmax(axis=1)).tolist(),
+            "final_immune_error": (immune[:, -1]
+                                   - agent_immune[:, -1]).tolist()
+        }
+
+    def __repr__(self):
+        return pformat({"scales": self.scales,
+                        "calibration": self.calibration_})
+
+
+def mean_agent_curves(configurations, steps, random_seeds):
+    """
+    Mean epidemic curves of agent runs of each configuration
+
+    Returns
+    -------
+    dict
+        "n_infected" and "n_immune" (n_configurations, steps)
+    """
+    n_infected = []
+    n_immune = []
+    for configuration in configurations:
+        curves = [epidemic_curves(configuration, steps, seed)
+                  for seed in random_seeds]
+        n_infected.append(np.mean([curve[0] for curve in curves], axis=0))
+        n_immune.append(np.mean([curve[1] for curve in curves], axis=0))
+    return {"n_infected": np.array(n_infected),
+            "n_immune": np.array(n_immune)}
+
+
+def squared_error(curves, agent_curves, n_people):
+    """
+    Mean squared error of the infected and immune fractions, summed over
+    configurations (last axis of the parameters)
+    """
+    n_people = n_people[:, None]
+    error = (((curves["n_infected"] - agent_curves["n_infected"])
+              / n_people) ** 2
+             + ((curves["n_immune"] - agent_curves["n_immune"])
+                / n_people) ** 2)
+    return error.mean(axis=-1).sum(axis=-1)
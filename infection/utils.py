@@ -52,7 +52,7 @@ def supdate(d, update, specials=None):
             d[k] = v
 
 
-def random_choice(values_obj, size=None, positive=True):
+def random_choice(values_obj, size=None, positive=True, rng=None):
     """
     Replace values_obj with a single value as follows:
         - if values_obj is a list, select one element with uniform probability
@@ -72,17 +72,20 @@ def random_choice(values_obj, size=None, positive=True):
         if specified, return a list of value
     positive : bool
         if set, return absolute value of result (numpy distribution only)
+    rng : numpy.random.Generator
+        random generator to draw from (global numpy.random if None)
 
     Returns
     -------
     number or object or list
     """
+    if rng is None:
+        rng = np.random
     if isinstance(values_obj, list):
-        return np.random.choice(values_obj, size=size)
+        return rng.choice(values_obj, size=size)
     if isinstance(values_obj, dict) and "dist" in values_obj:
         params = {**values_obj.get("params"), **{"size": size}}
-        result = getattr(np.random,
-                         values_obj["dist"])(**params)
+        result = getattr(rng, values_obj["dist"])(**params)
         if positive:
             return np.abs(result)
         else:
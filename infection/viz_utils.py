@@ -8,16 +8,151 @@ Email:   majorgowan@yahoo.com
 """
 import numpy as np
 import matplotlib.pyplot as plt
-import matplotlib.cm
 import matplotlib.colors
+import matplotlib.image
 from infection.base import Person
+from infection.metrics import snapshot
 from IPython.display import HTML
 
 
 plt.style.use("bmh")
 
 
-def init_frame(infection0, figsize=None):
+# colours of people in each state of raster frames
+STATES = ["healthy", "incubating", "sick", "immune"]
+STATE_COLOURS = np.array([matplotlib.colors.to_rgb(colour)
+                          for colour in ("burlywood", "gold", "saddlebrown",
+                                         "steelblue")])
+
+
+def temperature_scale(temperature, n_people):
+    """
+    Typical largest temperature: the amplitude of a hotspot times the
+    expected number of overlapping hotspots
+
+    Parameters
+    ----------
+    temperature : Temperature object
+        temperature field
+    n_people : int
+        number of people
+
+    Returns
+    -------
+    float
+    """
+    amplitude = (temperature.intensity / (4 * np.pi)
+                 / temperature.hotspot_radius)
+    density_factor = (1 +
+                      4 * np.pi * n_people * temperature.hotspot_radius ** 2)
+    return density_factor * amplitude
+
+
+def temperature_colours(temperature, n_people):
+    """
+    Colour map and normalization of temperature frames
+
+    Parameters
+    ----------
+    temperature : Temperature object
+        temperature field
+    n_people : int
+        number of people
+
+    Returns
+    -------
+    matplotlib.colors.Colormap
+    matplotlib.colors.Normalize
+    """
+    contour_cmap = plt.get_cmap("Reds").copy()
+    contour_norm = matplotlib.colors.Normalize(
+        vmin=0, vmax=1.2 * temperature_scale(temperature, n_people))
+    contour_cmap.set_over(color="darkred")
+    return contour_cmap, contour_norm
+
+
+def state_counts(infection0, bins, field):
+    """
+    Number of people in each state (see STATES) in each cell of a
+    bins x bins grid over the unit square (the members of a
+    super-individual are split between the states)
+
+    Parameters
+    ----------
+    infection0 : Infection object
+    bins : int
+        number of cells in each direction
+    field : numpy.array
+        (bins, bins) temperature in each cell against which immunity is
+        tested
+
+    Returns
+    -------
+    numpy.array
+        (4, bins, bins) counts (indexed [state, y, x])
+    """
+    state = snapshot(infection0)
+    columns = np.clip((state["positions"][:, 0] * bins).astype(int),
+                      0, bins - 1)
+    rows = np.clip((state["positions"][:, 1] * bins).astype(int),
+                   0, bins - 1)
+    infected = state["infected_weight"]
+    incubating = np.where(state["incubating"], infected, 0)
+    immune = np.where(state["immunity"] > field[rows, columns] + 0.1,
+                      np.minimum(state["recovered_weight"],
+                                 state["weight"] - infected), 0)
+    members = np.stack([state["weight"] - infected - immune, incubating,
+                        infected - incubating, immune])
+    index = rows * bins + columns
+    counts = np.stack([np.bincount(index, weights=weights,
+                                   minlength=bins * bins)
+                       for weights in members])
+    return np.rint(counts).astype(int).reshape(4, bins, bins)
+
+
+def raster_image(infection0, bins):
+    """
+    Composite of the density of people in each state over the temperature
+    (apart from one vectorized pass binning the people, the cost does not
+    depend on the number of people)
+
+    Parameters
+    ----------
+    infection0 : Infection object
+    bins : int
+        number of pixels in each direction
+
+    Returns
+    -------
+    numpy.array
+        (bins, bins, 3) rgb image (indexed [y, x])
+    """
+    temperature = infection0.temperature_
+    n_people = infection0["n_people"]
+    cmap, norm = temperature_colours(temperature, n_people)
+
+    # temperature at the grid point nearest the centre of each pixel
+    centres = (np.arange(bins) + 0.5) / bins
+    xs = temperature.xx[0, :]
+    ys = temperature.yy[:, 0]
+    columns = np.clip(np.searchsorted(xs, centres), 1, len(xs) - 1)
+    columns -= centres - xs[columns - 1] < xs[columns] - centres
+    rows = np.clip(np.searchsorted(ys, centres), 1, len(ys) - 1)
+    rows -= centres - ys[rows - 1] < ys[rows] - centres
+    field = temperature.temperature[np.ix_(rows, columns)]
+    background = cmap(norm(field))[..., :3]
+
+    counts = state_counts(infection0, bins, field=field)
+    total = counts.sum(axis=0)
+    people = (np.tensordot(counts, STATE_COLOURS, axes=(0, 0))
+              / np.maximum(total, 1)[..., None])
+    # opacity saturates at a few times the mean density
+    saturation = max(1.0, 2.0 * n_people / bins ** 2)
+    alpha = (1 - np.exp(-total / saturation))[..., None]
+    return (1 - alpha) * background + alpha * people
+
+
+def init_frame(infection0, figsize=None, raster=None):
     """
     Initialize figure for plotting animation frames
 
@@ -27,15 +162,19 @@ def init_frame(infection0, figsize=None):
         initialized simulation object
     figsize : tuple
         size of figure canvas
+    raster : int
+        if given, draw the density of people in each state over the
+        temperature as a single image with raster x raster pixels instead
+        of a marker per person (for large populations)
 
     Returns
     -------
     matplotlib.pyplot.Figure
         main figure object
-    matplotlib.collections.PathCollection
-        scatter plot data
+    matplotlib.collections.PathCollection or matplotlib.image.AxesImage
+        scatter plot data (or image in raster mode)
     matplotlib.contour.QuadContourSet
-        contour plot data
+        contour plot data (None in raster mode)
     """
     if figsize is None:
         figsize = (12, 12)
@@ -48,17 +187,26 @@ def init_frame(infection0, figsize=None):
 
     ax = fig.gca()
 
-    amplitude = (temperature.intensity / (4 * np.pi)
-                 / temperature.hotspot_radius)
-    density_factor = (1 +
-                      4 * np.pi * len(people) * temperature.hotspot_radius ** 2)
-
-    levels = np.linspace(0, density_factor * amplitude, 40)
-
-    vmax = 1.2 * density_factor * amplitude
-    contour_cmap = matplotlib.cm.get_cmap("Reds").copy()
-    contour_norm = matplotlib.colors.Normalize(vmin=0, vmax=vmax)
-    contour_cmap.set_over(color="darkred")
+    if raster:
+        image = ax.imshow(raster_image(infection0, raster), origin="lower",
+                          extent=(0, 1, 0, 1), interpolation="nearest",
+                          zorder=1)
+        for wall in walls:
+            if wall.orient == "h":
+                ax.hlines(wall.y, *wall.x, linewidth=2, color="k", zorder=5)
+            else:
+                ax.vlines(wall.x, *wall.y, linewidth=2, color="k", zorder=5)
+        ax.grid(None)
+        ax.set_xticks([])
+        ax.set_yticks([])
+        ax.set_ylim((0, 1))
+        ax.set_xlim((0, 1))
+        return fig, image, None
+
+    levels = np.linspace(0, temperature_scale(temperature,
+                                              infection0["n_people"]), 40)
+    contour_cmap, contour_norm = temperature_colours(temperature,
+                                                     infection0["n_people"])
 
     # plot the temperature field
     qcs = ax.contourf(temperature.xx, temperature.yy, temperature.temperature,
@@ -80,7 +228,7 @@ def init_frame(infection0, figsize=None):
             ax.vlines(wall.x, *wall.y, linewidth=wall_width, color="k",
                       zorder=5)
 
-    scatter_cmap = matplotlib.cm.get_cmap("copper")
+    scatter_cmap = plt.get_cmap("copper")
     scatter_norm = matplotlib.colors.Normalize(vmin=-0.2, vmax=1.2)
 
     # plot the people
@@ -112,7 +260,7 @@ def update_frame(fig, scatter, qcs, infection0):
     fig : matplotlib.pyplot.Figure object
         figure in which to plot current frame
     scatter : matplotlib.collections.PathCollection
-        scatter plot data
+        scatter plot data (or image in raster mode, see init_frame)
     qcs: matplotlib.contour.QuadContourSet
         contour plot data
     infection0 : Infection object
@@ -130,23 +278,21 @@ def update_frame(fig, scatter, qcs, infection0):
     temperature = infection0.temperature_
     people = infection0.people_
 
+    if isinstance(scatter, matplotlib.image.AxesImage):
+        bins = scatter.get_array().shape[0]
+        scatter.set_data(raster_image(infection0, bins))
+        return fig, scatter, qcs
+
     ax = fig.gca()
 
     # clear existing contours
     for coll in qcs.collections:
         coll.remove()
 
-    # plot new temperature field
-    amplitude = (temperature.intensity / (4 * np.pi)
-                 / temperature.hotspot_radius)
-    density_factor = (1 +
-                      4 * np.pi * len(people) * temperature.hotspot_radius ** 2)
-    levels = np.linspace(0, density_factor * amplitude, 40)
-
-    vmax = 1.2 * density_factor * amplitude
-    contour_cmap = matplotlib.cm.get_cmap("Reds").copy()
-    contour_norm = matplotlib.colors.Normalize(vmin=0, vmax=vmax)
-    contour_cmap.set_over(color="darkred")
+    levels = np.linspace(0, temperature_scale(temperature,
+                                              infection0["n_people"]), 40)
+    contour_cmap, contour_norm = temperature_colours(temperature,
+                                                     infection0["n_people"])
 
     # plot the new temperature field
     qcs = ax.contourf(temperature.xx, temperature.yy, temperature.temperature,
@@ -157,9 +303,9 @@ def update_frame(fig, scatter, qcs, infection0):
         coll.set_edgecolor("face")
 
     # update people positions
-    scatter_cmap = matplotlib.cm.get_cmap("copper")
+    scatter_cmap = plt.get_cmap("copper")
     scatter_norm = matplotlib.colors.Normalize(vmin=-0.2, vmax=1.2)
-    scatter_cmap2 = matplotlib.cm.get_cmap("Blues")
+    scatter_cmap2 = plt.get_cmap("Blues")
     immunity_max = max([p.full_immunity for p in people])
     scatter_norm2 = matplotlib.colors.Normalize(vmin=-1, vmax=immunity_max)
 
@@ -1,4 +1,5 @@
 import os
+import re
 import setuptools
 
 with open("README.md", "r") as fh:
@@ -11,9 +12,14 @@ with open(os.path.join(this_directory, 'requirements.txt'),
           encoding='utf-8') as f:
     requirements = f.read().splitlines()
 
+# read the version from the package (the single place it is defined)
+with open(os.path.join(this_directory, 'infection', '__init__.py'),
+          encoding='utf-8') as f:
+    version = re.search(r'^__version__ = "(.+)"', f.read(), re.M).group(1)
+
 setuptools.setup(
     name="infection",
-    version="1.0",
+    version=version,
     author="Mark Fruman",
     author_email="majorgowan@yahoo.com",
     description="Package for simulating an epidemic infection",